@@ -1,17 +1,47 @@
-from uuid import uuid4
+import hashlib
+import json
+import os
+import time
 from time import gmtime, strftime
 from typing import Optional
+from uuid import uuid4
 
-from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Body
-from celery.result import AsyncResult
+from fastapi import (
+    APIRouter,
+    File,
+    Form,
+    Header,
+    HTTPException,
+    Query,
+    Request,
+    Response,
+    UploadFile,
+)
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import JSONResponse, StreamingResponse
 
-from app.api.schemas import ProcessResponse, StatusResp, FeatureProjectRequest, SynthesizeRequest
+from app.api.schemas import (
+    FeatureProjectRequest,
+    ProcessResponse,
+    ResumableCommitRequest,
+    ResumableInitRequest,
+    ResumableState,
+    StatusResp,
+    SynthesizeRequest,
+)
 from app.api.validators import validate_bpm
-from app.workers.celery_app import celery_app
-from app.core import storage
-from app.core.pipeline_stub import stub_separate, stub_synthesize
+from app.core import admission, events, midi, storage, uploads
 from app.core.config import settings
-from app.core.task import run_pipeline_task
+from app.core.task import (
+    publish_task,
+    run_pipeline_task,
+    stage_quantize_midi_task,
+    stage_separate_task,
+    stage_synthesize_task,
+)
+from app.workers import dispatch
+from app.workers.local_executor import QueueFull
+from app.workers.queues import PRIORITY_INTERACTIVE, queue_depths
 
 router = APIRouter()
 
@@ -34,28 +64,77 @@ async def process(
 
     project_id = str(uuid4())
     in_path = await storage.save_upload(project_id, file)
-    storage.save_project_meta(project_id, {
+    return _start_job(project_id, in_path, bpm, project_name, pen_name)
+
+def _start_job(project_id: str, in_path: str, bpm: int, project_name: str, pen_name: str) -> dict:
+    storage.update_project_meta(project_id, {
         "project_name": project_name,
         "pen_name": pen_name,
         "created_at": strftime("%Y-%m-%dT%H:%M:%SZ", gmtime()),
+        "enqueued_at": time.time(),  # 排队等待时间指标
     })
 
-    res = run_pipeline_task.apply_async(
-        kwargs={"project_id": project_id, "bpm": bpm, "in_path": in_path},
-        task_id = project_id
-    )
+    try:
+        res = dispatch.submit(run_pipeline_task,
+                              {"project_id": project_id, "bpm": bpm, "in_path": in_path},
+                              task_id=project_id)
+    except QueueFull:
+        raise HTTPException(status_code=503, detail="任务队列已满，请稍后重试",
+                            headers={"Retry-After": "30"})
     job_id = res.id
     return {
         "job_id": job_id,
         "status_url": f"/hachimi_ai_mad/tasks/{job_id}/status",
         "download_url": f"/hachimi_ai_mad/tasks/{job_id}/download",
+        "eta_seconds": admission.snapshot().eta_seconds,
     }
 
+# ========== 分片续传上传：init → PUT 分片(可并行/重传) → commit 进入处理流程 ==========
+def _admit() -> None:
+    """与 /tasks/process 相同的准入判断"""
+    verdict = admission.check(None)
+    if verdict is not None:
+        status, detail, retry_after = verdict
+        headers = {"Retry-After": str(retry_after)} if retry_after else None
+        raise HTTPException(status, detail, headers=headers)
+
+@router.post("/hachimi_ai_mad/uploads", response_model=ResumableState, status_code=201)
+def resumable_init(body: ResumableInitRequest):
+    if body.content_type.split("/")[0] != "audio":
+        raise HTTPException(415, "不支持的文件类型")
+    # 在传任何字节之前拒绝
+    _admit()
+    return uploads.init_upload(body.filename, body.size, body.sha256)
+
+@router.get("/hachimi_ai_mad/uploads/{upload_id}", response_model=ResumableState)
+def resumable_status(upload_id: str):
+    return uploads.describe(upload_id)
+
+@router.put("/hachimi_ai_mad/uploads/{upload_id}/parts/{index}")
+async def resumable_put_part(upload_id: str, index: int, request: Request,
+                             x_part_sha256: str = Header(..., pattern="^[0-9a-fA-F]{64}$")):
+    """请求体为分片原始字节，X-Part-SHA256 为该分片的 sha256"""
+    return await uploads.write_part(upload_id, index, request.stream(), x_part_sha256)
+
+@router.post("/hachimi_ai_mad/uploads/{upload_id}/commit", response_model=ProcessResponse,
+             status_code=201)
+def resumable_commit(upload_id: str, body: ResumableCommitRequest):
+    validate_bpm(body.bpm)
+    # 分片可能传了很久，入队前按当前负载再判断一次；被拒时上传保持 open，稍后可重试 commit
+    _admit()
+    in_path = uploads.commit_upload(upload_id)
+    return _start_job(upload_id, in_path, body.bpm, body.project_name, body.pen_name)
+
+@router.delete("/hachimi_ai_mad/uploads/{upload_id}")
+def resumable_abort(upload_id: str):
+    uploads.abort_upload(upload_id)
+    return {"ok": True}
+
 
 
 @router.get("/hachimi_ai_mad/tasks/{job_id}/status", response_model=StatusResp)
 def get_task_status(job_id: str):
-    r = AsyncResult(job_id, app=celery_app)
+    r = dispatch.result(job_id)
     state = r.state  # 获取Celery原生状态（PENDING/STARTED/PROGRESS/SUCCESS/FAILURE等）
     
     # 1. 统一状态语义（修改后的核心逻辑）
@@ -81,6 +160,49 @@ def get_task_status(job_id: str):
     
     return result
 
+def _job_final_state(job_id: str) -> Optional[dict]:
+    """任务终态数据；未结束返回 {}，结果后端与项目元数据里都查不到(未知或已过期)返回 None"""
+    r = dispatch.result(job_id)
+    state = r.state
+    if state in ("SUCCESS", "FAILURE", "REVOKED"):
+        status = "SUCCEEDED" if state == "SUCCESS" else "FAILED"
+    elif state != "PENDING":
+        return {}
+    elif os.path.exists(storage.meta_path(job_id)):
+        # 结果后端过期或 worker 重启后状态回落为 PENDING，以元数据里的运行状态为准
+        status = storage.load_project_meta(job_id).get("job_status")
+        if status not in events.TERMINAL_STATUSES:
+            return {}
+    else:
+        return None
+    if status == "SUCCEEDED":
+        payload = storage.read_result(job_id) or {}
+        return {"status": status, "progress": 1.0, "urls": payload.get("urls", {})}
+    return {"status": status, "message": {"FAILURE": str(r.info), "REVOKED": "revoked"}.get(state)}
+
+@router.get("/hachimi_ai_mad/tasks/{job_id}/events")
+async def task_events(job_id: str, request: Request, last_event_id: Optional[str] = Query(None)):
+    """SSE 推送任务进度，SUCCEEDED/FAILED 后关闭；支持 Last-Event-ID 断线续传
+
+    未知任务返回 404；已结束的任务只回放历史(缺终态事件时补发一条)后关闭，不再挂着心跳
+    """
+    resume_from = request.headers.get("last-event-id") or last_event_id
+    final = await run_in_threadpool(_job_final_state, job_id)
+    if final is None:
+        raise HTTPException(status_code=404, detail="task not found")
+
+    async def stream():
+        yield b"retry: 3000\n\n"
+        async for ev in events.listen(job_id, resume_from, final=final or None):
+            if await request.is_disconnected():
+                break
+            yield events.format_sse(ev)
+
+    return StreamingResponse(stream(), media_type="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",
+    })
+
 @router.get("/hachimi_ai_mad/tasks/{job_id}/download")
 def download_result(job_id: str):
     payload = storage.read_result(job_id)
@@ -88,13 +210,28 @@ def download_result(job_id: str):
         raise HTTPException(status_code=404, detail="result not ready")
     return payload
 
-@router.post("/hachimi_ai_mad/tasks/{job_id}/publish")
-def publish_job_result(job_id: str):
+def _dispatch(task, kwargs: dict, missing_status: int, missing_detail: str):
+    """交互式操作以高优先级入各自队列；eager 模式下已同步完成则直接返回结果，否则 202 + 查询地址"""
     try:
-        publish_meta = storage.publish_job(job_id)
+        res = dispatch.submit(task, kwargs, priority=PRIORITY_INTERACTIVE)
+        if res.ready():
+            # eager 任务执行期间 celery 会置进程级"禁止 join"标志，并发请求里取已完成结果也会被拦，
+            # 这里结果已就绪不会阻塞
+            return res.get(disable_sync_subtasks=False)
     except FileNotFoundError:
-        raise HTTPException(status_code=409, detail="result not ready or missing")
-    return publish_meta
+        raise HTTPException(status_code=missing_status, detail=missing_detail)
+    except QueueFull:
+        raise HTTPException(status_code=503, detail="任务队列已满，请稍后重试",
+                            headers={"Retry-After": "30"})
+    return JSONResponse(status_code=202, content={
+        "ok": True,
+        "job_id": res.id,
+        "status_url": f"/hachimi_ai_mad/tasks/{res.id}/status",
+    })
+
+@router.post("/hachimi_ai_mad/tasks/{job_id}/publish")
+def publish_job_result(job_id: str):
+    return _dispatch(publish_task, {"project_id": job_id}, 409, "result not ready or missing")
 
 # ========== 阶段处理流程 ==========
 @router.post("/hachimi_ai_mad/stages/separate/retry")
@@ -109,24 +246,37 @@ async def separate_retry(
     storage.ensure_project_initialized(project_id)
     if audio_file is not None:
         await storage.save_upload(project_id, audio_file, stage="uploads")
-    try:
-        out = stub_separate(project_id, bpm=int(bpm), allow_missing=bool(allow_missing))
-    except FileNotFoundError:
-        raise HTTPException(status_code=400, detail="缺少输入音频；请先上传或设置 allow_missing=true")
-    return out
+    return _dispatch(stage_separate_task,
+                     {"project_id": project_id, "bpm": int(bpm),
+                      "allow_missing": bool(allow_missing)},
+                     400, "缺少输入音频；请先上传或设置 allow_missing=true")
 
 @router.post("/hachimi_ai_mad/stages/midi/upload")
 async def midi_upload(
     project_id: str = Form(...),
     quantize: bool = Form(True),
+    bpm: int = Form(120),
     midi_file: UploadFile = File(...),
 ):
-    """MIDI上传"""
+    """MIDI上传；quantize=true 时按 bpm 的 16 分音符网格量化并清理成单声部旋律"""
+    validate_bpm(bpm)
     storage.ensure_project_initialized(project_id)
-    midi_url = await storage.save_upload(project_id, midi_file, stage="midi")
-    q_url = midi_url if bool(quantize) else None
-    storage.record_stage_artifacts(project_id, "midi", {"midi": midi_url, "quantized": q_url or midi_url})
-    return {"ok": True, "midi_url": midi_url, "quantized_url": q_url}
+    # 量化产物固定叫 quantized.mid，避免用户文件与之同名被覆盖
+    dst_name = "source.mid" if midi_file.filename == midi.QUANTIZED_NAME else None
+    midi_url = await storage.save_upload(project_id, midi_file, stage="midi", dst_name=dst_name)
+    if not quantize:
+        # 不量化时原文件即下游使用的旋律，元数据与响应里的 quantized 都指向它
+        storage.record_stage_artifacts(project_id, "midi",
+                                       {"midi": midi_url, "quantized": midi_url})
+        return {"ok": True, "midi_url": midi_url, "quantized_url": midi_url}
+    # 量化与其它交互式阶段操作一样作为任务进合成队列，不占 API 进程
+    try:
+        return await run_in_threadpool(
+            _dispatch, stage_quantize_midi_task,
+            {"project_id": project_id, "filename": dst_name or midi_file.filename, "bpm": bpm},
+            400, "MIDI 文件不存在")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"MIDI 解析失败: {e}")
 
 @router.post("/hachimi_ai_mad/stages/lyrics/upload")
 async def lyrics_upload(
@@ -143,26 +293,49 @@ async def lyrics_upload(
 def synth_retry(body: SynthesizeRequest):
     """合成重试"""
     storage.ensure_project_initialized(body.project_id)
-    try:
-        out = stub_synthesize(body.project_id, fmt=body.format, allow_missing=bool(body.allow_missing))
-    except FileNotFoundError:
-        raise HTTPException(status_code=400, detail="缺少上游产物")
-    return out
+    return _dispatch(stage_synthesize_task,
+                     {"project_id": body.project_id, "fmt": body.format,
+                      "allow_missing": bool(body.allow_missing)},
+                     400, "缺少上游产物")
 
 # ========== 展示区 ==========
 @router.get("/hachimi_ai_mad/showcase")
-def list_showcase():
-    return storage.list_published()
+def list_showcase(
+    request: Request,
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = Query(None),
+):
+    """展示区分页列表，带强 ETag 供 CDN/浏览器协商缓存"""
+    try:
+        page = storage.list_published_page(limit=limit, cursor=cursor)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="invalid cursor")
+    body = json.dumps(page, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    etag = '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+    headers = {"ETag": etag, "Cache-Control": "public, no-cache"}
+    inm = request.headers.get("if-none-match")
+    if inm and (inm.strip() == "*" or etag in [t.strip() for t in inm.split(",")]):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
 
 @router.get("/hachimi_ai_mad/showcase/{public_id}/preview")
-def get_showcase_preview(public_id: str):
-    """预览展示，参数名统一为public_id"""
-    return storage.serve_published(public_id, "preview.wav")
+def get_showcase_preview(public_id: str, v: Optional[str] = Query(None),
+                         format: Optional[str] = Query(None)):
+    """预览展示，参数名统一为public_id；format=mp3|opus 返回压缩副本"""
+    return storage.serve_published(public_id, "preview.wav", version=v, fmt=format)
 
 @router.get("/hachimi_ai_mad/showcase/{public_id}/result")
-def get_showcase_result(public_id: str):
-    """结果展示，参数名统一为public_id"""
-    return storage.serve_published(public_id, "result.wav")
+def get_showcase_result(public_id: str, v: Optional[str] = Query(None),
+                        format: Optional[str] = Query(None)):
+    """结果展示，参数名统一为public_id；format=mp3|opus 返回压缩副本"""
+    return storage.serve_published(public_id, "result.wav", version=v, fmt=format)
+
+@router.get("/hachimi_ai_mad/showcase/{public_id}/{kind}/peaks")
+def get_showcase_peaks(public_id: str, kind: str, v: Optional[str] = Query(None)):
+    """预览/结果的多级波形峰值(二进制，格式见 app/core/waveform.py)"""
+    if kind not in ("preview", "result"):
+        raise HTTPException(status_code=404, detail="file not found")
+    return storage.serve_published(public_id, f"{kind}.peaks", version=v)
 
 # ========== 项目管理 ==========
 @router.get("/hachimi_ai_mad/projects/{project_id}/artifacts")
@@ -170,8 +343,8 @@ def get_project_artifacts(project_id: str):
     return {"project_id": project_id, "stages": storage.list_artifacts(project_id)}
 
 @router.get("/hachimi_ai_mad/projects/{project_id}/{kind}/{filename:path}")
-def get_file(project_id: str, kind: str, filename: str):
-    return storage.serve_file(project_id, kind, filename)
+def get_file(project_id: str, kind: str, filename: str, format: Optional[str] = Query(None)):
+    return storage.serve_file(project_id, kind, filename, fmt=format)
 
 # ========== 项目列表 ==========
 @router.get("/hachimi_ai_mad/projects/featured")
@@ -188,4 +361,11 @@ def admin_feature_project(req: FeatureProjectRequest):
     if not settings.ADMIN_SECRET or req.admin_secret != settings.ADMIN_SECRET:
         raise HTTPException(status_code=403, detail="forbidden")
     meta = storage.feature_project(req.project_id)
-    return {"ok": True, "project_id": req.project_id, "is_featured": meta.get("is_featured", False)}
\ No newline at end of file
+    return {"ok": True, "project_id": req.project_id, "is_featured": meta.get("is_featured", False)}
+
+@router.get("/hachimi_ai_mad/admin/queues")
+def admin_queue_depths(x_admin_secret: str = Header("")):
+    """各队列积压深度，供扩缩容脚本/监控轮询"""
+    if not settings.ADMIN_SECRET or x_admin_secret != settings.ADMIN_SECRET:
+        raise HTTPException(status_code=403, detail="forbidden")
+    return {"queues": queue_depths()}
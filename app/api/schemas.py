@@ -12,6 +12,28 @@ class ProcessResponse(BaseModel):
     job_id: str
     status_url: str
     download_url: str
+    eta_seconds: Optional[float] = None
+
+class ResumableInitRequest(BaseModel):
+    filename: str
+    size: int = Field(gt=0)
+    content_type: str = "audio/wav"
+    sha256: Optional[str] = Field(default=None, pattern="^[0-9a-fA-F]{64}$")
+
+class ResumableState(BaseModel):
+    upload_id: str
+    filename: str
+    size: int
+    part_size: int
+    parts_total: int
+    received: List[int]
+    missing: List[int]
+    status: str
+
+class ResumableCommitRequest(BaseModel):
+    bpm: int
+    project_name: str
+    pen_name: str
 
 class PublishResponse(BaseModel):
     public_id: str
@@ -30,6 +52,7 @@ class ShowcaseItem(BaseModel):
 
 class ShowcaseList(BaseModel):
     items: List[ShowcaseItem]
+    next_cursor: Optional[str] = None
 
 # 新增管理与阶段接口请求体
 class FeatureProjectRequest(BaseModel):
@@ -38,7 +61,7 @@ class FeatureProjectRequest(BaseModel):
 
 class SynthesizeRequest(BaseModel):
     project_id: str
-    format: str = "wav"
+    format: str = Field(default="wav", pattern="^(wav|mp3|opus)$")
     allow_missing: bool = False
     force: bool = False
     use_custom_midi: bool = False
\ No newline at end of file
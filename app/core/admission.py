@@ -0,0 +1,134 @@
+import datetime as _dt
+import json
+import logging
+import math
+import os
+import shutil
+import threading
+import time
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
+from starlette.concurrency import run_in_threadpool
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from app.core import meta_index
+from app.core.config import settings
+
+log = logging.getLogger(__name__)
+
+# /tasks/process 的准入控制：在读取请求体之前按排队深度、磁盘余量、Content-Length 拒绝，
+# 返回 429/503/413 + Retry-After，避免突发上传先写满磁盘再排几小时的队
+_SNAPSHOT_TTL = 1.0  # 排队深度/磁盘余量的缓存秒数，突发请求不会每个都去查 Redis
+
+@dataclass(frozen=True)
+class Snapshot:
+    queued: int            # 排队 + 执行中
+    workers: int
+    free_mb: float
+    avg_job_seconds: float
+
+    @property
+    def eta_seconds(self) -> float:
+        """新任务预计多久后完成：前面排队的轮次 + 自身一轮"""
+        return math.ceil((self.queued + 1) / self.workers) * self.avg_job_seconds
+
+_lock = threading.Lock()
+_cached: Optional[Tuple[float, Snapshot]] = None
+
+def _workers() -> int:
+    if settings.EXECUTION_BACKEND == "local":
+        return settings.LOCAL_WORKERS
+    return settings.CELERY_WORKER_CONCURRENCY
+
+def _queued() -> int:
+    from app.workers.queues import queue_depths
+    try:
+        return queue_depths()["pipeline"]
+    except Exception:
+        # broker 不可用时不拦截，交给入队本身报错
+        log.exception("queue depth unavailable")
+        return 0
+
+def _running() -> int:
+    """celery 模式下 worker 已取走的任务(acks_late 未确认)不在 Redis 列表里，按元数据 RUNNING 计入；
+    local 模式的 active() 已含执行中，eager 模式在请求内同步执行"""
+    if settings.EXECUTION_BACKEND == "local" or settings.CELERY_EAGER:
+        return 0
+    # 与清理任务一致：开始超过硬超时两倍仍是 RUNNING 的不算
+    grace = _dt.timedelta(seconds=2 * settings.CELERY_TASK_TIME_LIMIT)
+    since = _dt.datetime.now(_dt.timezone.utc) - grace
+    try:
+        return meta_index.running_jobs(since.isoformat().replace("+00:00", "Z"))
+    except Exception:
+        log.exception("running job count unavailable")
+        return 0
+
+def _free_mb(path: str) -> float:
+    while not os.path.exists(path) and os.path.dirname(path) != path:
+        path = os.path.dirname(path)
+    return shutil.disk_usage(path).free / (1024 * 1024)
+
+def _avg_job_seconds() -> float:
+    try:
+        recent = meta_index.recent_job_seconds(limit=20)
+    except Exception:
+        log.exception("job duration history unavailable")
+        recent = []
+    return sum(recent) / len(recent) if recent else settings.ADMISSION_DEFAULT_JOB_SECONDS
+
+def snapshot(refresh: bool = False) -> Snapshot:
+    global _cached
+    now = time.monotonic()
+    with _lock:
+        if not refresh and _cached is not None and now - _cached[0] < _SNAPSHOT_TTL:
+            return _cached[1]
+    snap = Snapshot(_queued() + _running(), _workers(), _free_mb(settings.TEMP_DIR),
+                    _avg_job_seconds())
+    with _lock:
+        _cached = (now, snap)
+    return snap
+
+def check(content_length: Optional[int]) -> Optional[Tuple[int, str, Optional[int]]]:
+    """通过返回 None，否则返回 (状态码, 原因, Retry-After 秒)"""
+    limit = settings.MAX_UPLOAD_MB * 1024 * 1024
+    # multipart 表单字段与边界留 1MB 余量，精确的文件大小限制仍由 save_upload 执行
+    if content_length is not None and content_length > limit + 1024 * 1024:
+        return 413, f"上传超过 {settings.MAX_UPLOAD_MB}MB", None
+    snap = snapshot()
+    if snap.free_mb < settings.ADMISSION_MIN_FREE_MB:
+        return 503, "磁盘空间不足，暂停接收新任务", settings.SWEEP_INTERVAL_MINUTES * 60
+    if snap.queued >= settings.ADMISSION_MAX_QUEUED:
+        # 大约一个 worker 腾出空位的时间
+        retry_after = max(1, math.ceil(snap.avg_job_seconds / snap.workers))
+        return 429, "排队任务过多，请稍后重试", retry_after
+    return None
+
+class AdmissionMiddleware:
+    def __init__(self, app: ASGIApp, paths: Tuple[str, ...] = ("/hachimi_ai_mad/tasks/process",)):
+        self.app = app
+        self.paths = paths
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if (not settings.ADMISSION_ENABLED or scope["type"] != "http"
+                or scope["method"] != "POST" or scope["path"] not in self.paths):
+            return await self.app(scope, receive, send)
+        length = None
+        for k, v in scope["headers"]:
+            if k == b"content-length":
+                try:
+                    length = int(v)
+                except ValueError:
+                    pass
+        verdict = await run_in_threadpool(check, length)
+        if verdict is None:
+            return await self.app(scope, receive, send)
+        status, detail, retry_after = verdict
+        headers = [(b"content-type", b"application/json")]
+        if retry_after is not None:
+            headers.append((b"retry-after", str(retry_after).encode()))
+        body = json.dumps({"detail": detail}, ensure_ascii=False).encode("utf-8")
+        headers.append((b"content-length", str(len(body)).encode()))
+        # 不读取请求体直接回应，由服务器丢弃剩余上传数据
+        await send({"type": "http.response.start", "status": status, "headers": headers})
+        await send({"type": "http.response.body", "body": body})
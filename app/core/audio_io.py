@@ -0,0 +1,274 @@
+import os
+import struct
+import uuid
+from contextlib import contextmanager
+from typing import IO, Any, Iterator, Optional, Tuple, Union
+
+import numpy as np
+
+# 整块写 PCM：一次 write 一个缓冲区，而不是每个采样一次 Python 调用
+# sample_format -> (每采样字节数, WAV 格式码)
+SAMPLE_FORMATS = {
+    "pcm16": (2, 1),
+    "pcm24": (3, 1),
+    "pcm32": (4, 1),
+    "float32": (4, 3),
+}
+BLOCK_FRAMES = 1 << 16  # 长音频分块写，单块约 64k 帧
+
+_FORMAT_PCM = 1
+_FORMAT_FLOAT = 3
+_FORMAT_EXTENSIBLE = 0xFFFE
+
+AudioData = Union[np.ndarray, bytes, bytearray, memoryview]
+
+def _to_frames(data: np.ndarray, channels: int) -> np.ndarray:
+    if data.ndim == 1:
+        data = data.reshape(-1, 1)
+    if data.ndim != 2 or data.shape[1] != channels:
+        raise ValueError(f"expected (frames, {channels}) samples, got {data.shape}")
+    return data
+
+def encode_pcm(data: np.ndarray, sample_format: str) -> bytes:
+    """把 (frames, channels) 或 (frames,) 的数组编码成小端交织 PCM 字节
+
+    浮点输入按 [-1, 1] 满幅；有符号整型输入按其自身位宽满幅，再换算到目标位宽。
+    """
+    if sample_format not in SAMPLE_FORMATS:
+        raise ValueError(f"unsupported sample format {sample_format!r}")
+    if data.dtype.kind not in "fi":
+        raise ValueError(f"unsupported sample dtype {data.dtype}")
+    if sample_format == "float32":
+        if data.dtype.kind == "i":
+            data = data / float(2 ** (8 * data.dtype.itemsize - 1))
+        return np.ascontiguousarray(data, dtype="<f4").tobytes()
+    bits = 8 * SAMPLE_FORMATS[sample_format][0]
+    if data.dtype.kind == "f":
+        scale = float(2 ** (bits - 1))
+        ints = np.clip(np.rint(np.clip(data, -1.0, 1.0) * scale), -scale, scale - 1)
+    else:
+        shift = bits - 8 * data.dtype.itemsize
+        ints = data.astype(np.int64)
+        ints = ints << shift if shift >= 0 else ints >> -shift
+    if bits == 16:
+        return np.ascontiguousarray(ints, dtype="<i2").tobytes()
+    packed = np.ascontiguousarray(ints, dtype="<i4")
+    if bits == 32:
+        return packed.tobytes()
+    # 24bit：取 int32 小端的低 3 字节
+    return packed.reshape(-1).view(np.uint8).reshape(-1, 4)[:, :3].tobytes()
+
+def temp_path(path: str) -> str:
+    return f"{path}.{uuid.uuid4().hex}.tmp"
+
+@contextmanager
+def atomic_open(path: str, mode: str = "wb", **kwargs: Any) -> Iterator[IO]:
+    """写同目录临时文件，正常退出时 os.replace 到 path，出错时删掉临时文件
+
+    读者永远看不到半截文件；目标可能是缓存条目的硬链接，整体替换才不会改到缓存
+    """
+    tmp = temp_path(path)
+    try:
+        with open(tmp, mode, **kwargs) as f:
+            yield f
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except FileNotFoundError:
+            pass
+        raise
+
+class WavWriter:
+    """流式 WAV 写入：先写占位头，close 时回填长度并原子替换到目标路径"""
+
+    def __init__(self, path: str, sr: int, channels: int = 1, sample_format: str = "pcm16"):
+        if sample_format not in SAMPLE_FORMATS:
+            raise ValueError(f"unsupported sample format {sample_format!r}")
+        self.path = path
+        self.sr = int(sr)
+        self.channels = int(channels)
+        self.sample_format = sample_format
+        self.width, self.format_tag = SAMPLE_FORMATS[sample_format]
+        self.frames = 0
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        # 目标可能是缓存条目的硬链接，不能原地截断
+        self._tmp = temp_path(path)
+        self._f = open(self._tmp, "wb")
+        self._f.write(self._header(0))
+
+    def _header(self, data_bytes: int) -> bytes:
+        block_align = self.channels * self.width
+        if self.format_tag == _FORMAT_FLOAT:
+            fmt = struct.pack("<HHIIHHH", _FORMAT_FLOAT, self.channels, self.sr,
+                              self.sr * block_align, block_align, 8 * self.width, 0)
+            fact = b"fact" + struct.pack("<II", 4, data_bytes // block_align)
+        else:
+            fmt = struct.pack("<HHIIHH", _FORMAT_PCM, self.channels, self.sr,
+                              self.sr * block_align, block_align, 8 * self.width)
+            fact = b""
+        body = b"WAVE" + b"fmt " + struct.pack("<I", len(fmt)) + fmt + fact
+        return b"RIFF" + struct.pack("<I", len(body) + 8 + data_bytes + (data_bytes & 1)) + body \
+            + b"data" + struct.pack("<I", data_bytes)
+
+    def write(self, data: AudioData) -> None:
+        """写入一块采样：ndarray 为 (frames, channels)/(frames,)，bytes 需已是目标格式"""
+        if isinstance(data, np.ndarray):
+            data = _to_frames(data, self.channels)
+            buf = encode_pcm(data, self.sample_format)
+        else:
+            buf = memoryview(data).cast("B")
+        block_align = self.channels * self.width
+        if len(buf) % block_align:
+            raise ValueError("partial frame in PCM buffer")
+        self._f.write(buf)
+        self.frames += len(buf) // block_align
+
+    def close(self) -> None:
+        if self._f.closed:
+            return
+        data_bytes = self.frames * self.channels * self.width
+        if data_bytes & 1:
+            self._f.write(b"\x00")
+        self._f.seek(0)
+        self._f.write(self._header(data_bytes))
+        self._f.close()
+        os.replace(self._tmp, self.path)
+
+    def abort(self) -> None:
+        if not self._f.closed:
+            self._f.close()
+        try:
+            os.remove(self._tmp)
+        except FileNotFoundError:
+            pass
+
+    def __enter__(self) -> "WavWriter":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+def write_wav(path: str, data: AudioData, sr: int, channels: Optional[int] = None,
+              sample_format: str = "pcm16") -> None:
+    """一次性写完整缓冲区；长音频按 BLOCK_FRAMES 分块落盘"""
+    if isinstance(data, np.ndarray):
+        if channels is None:
+            channels = 1 if data.ndim == 1 else data.shape[1]
+        data = _to_frames(data, channels)
+        with WavWriter(path, sr, channels, sample_format) as w:
+            for i in range(0, len(data), BLOCK_FRAMES):
+                w.write(data[i:i + BLOCK_FRAMES])
+    else:
+        with WavWriter(path, sr, channels or 1, sample_format) as w:
+            w.write(data)
+
+def write_silence(path: str, seconds: float, sr: int = 16000, channels: int = 1,
+                  sample_format: str = "pcm16") -> None:
+    n_frames = int(seconds * sr)
+    frame_bytes = channels * SAMPLE_FORMATS[sample_format][0]
+    zeros = bytes(min(n_frames, BLOCK_FRAMES) * frame_bytes)
+    with WavWriter(path, sr, channels, sample_format) as w:
+        left = n_frames
+        while left > 0:
+            n = min(left, BLOCK_FRAMES)
+            w.write(memoryview(zeros)[:n * frame_bytes])
+            left -= n
+
+# ========== 读取 ==========
+class WavInfo:
+    __slots__ = ("sr", "channels", "width", "sample_format", "data_offset", "frames")
+
+    def __init__(self, sr: int, channels: int, width: int, sample_format: str,
+                 data_offset: int, frames: int):
+        self.sr = sr
+        self.channels = channels
+        self.width = width
+        self.sample_format = sample_format
+        self.data_offset = data_offset
+        self.frames = frames
+
+    @property
+    def duration(self) -> float:
+        return self.frames / self.sr if self.sr else 0.0
+
+def wav_info(path: str) -> WavInfo:
+    """只解析 RIFF 头，定位 data 块；非 WAV 或不支持的编码抛 ValueError"""
+    with open(path, "rb") as f:
+        riff = f.read(12)
+        if len(riff) < 12 or riff[:4] != b"RIFF" or riff[8:12] != b"WAVE":
+            raise ValueError("not a RIFF/WAVE file")
+        fmt = None
+        while True:
+            hdr = f.read(8)
+            if len(hdr) < 8:
+                raise ValueError("missing data chunk")
+            cid, size = hdr[:4], struct.unpack("<I", hdr[4:])[0]
+            if cid == b"fmt ":
+                fmt = f.read(size)
+                if size & 1:
+                    f.seek(1, 1)
+            elif cid == b"data":
+                if fmt is None:
+                    raise ValueError("data chunk before fmt chunk")
+                tag, channels, sr, _, block_align, bits = struct.unpack("<HHIIHH", fmt[:16])
+                if tag == _FORMAT_EXTENSIBLE and len(fmt) >= 26:
+                    tag = struct.unpack("<H", fmt[24:26])[0]
+                width = bits // 8
+                if tag == _FORMAT_FLOAT and width == 4:
+                    sample_format = "float32"
+                elif tag == _FORMAT_PCM and width in (2, 3, 4):
+                    sample_format = f"pcm{bits}"
+                else:
+                    raise ValueError(f"unsupported WAV encoding tag={tag} bits={bits}")
+                offset = f.tell()
+                file_left = os.fstat(f.fileno()).st_size - offset
+                size = min(size, file_left)  # 兼容流式写入未回填长度的文件
+                return WavInfo(sr, channels, width, sample_format, offset, size // block_align)
+            else:
+                f.seek(size + (size & 1), 1)
+
+_NP_DTYPES = {"pcm16": "<i2", "pcm32": "<i4", "float32": "<f4"}
+
+def memmap_wav(path: str, info: Optional[WavInfo] = None) -> Tuple[np.ndarray, WavInfo]:
+    """把 data 块映射为 (frames, channels) 数组，不读入内存
+
+    24bit 返回 (frames, channels, 3) 的 uint8
+    """
+    info = info or wav_info(path)
+    if info.frames == 0:
+        dtype = _NP_DTYPES.get(info.sample_format, np.uint8)
+        shape = (0, info.channels, 3) if info.sample_format == "pcm24" else (0, info.channels)
+        return np.zeros(shape, dtype=dtype), info
+    if info.sample_format == "pcm24":
+        mm = np.memmap(path, dtype=np.uint8, mode="r", offset=info.data_offset,
+                       shape=(info.frames, info.channels, 3))
+    else:
+        mm = np.memmap(path, dtype=_NP_DTYPES[info.sample_format], mode="r",
+                       offset=info.data_offset, shape=(info.frames, info.channels))
+    return mm, info
+
+def to_float32(block: np.ndarray, sample_format: str) -> np.ndarray:
+    """把 memmap_wav 取出的一块转成 [-1, 1) 的 float32"""
+    if sample_format == "float32":
+        return np.asarray(block, dtype=np.float32)
+    if sample_format == "pcm24":
+        b = block.astype(np.int32)
+        ints = (b[..., 0] | (b[..., 1] << 8) | (b[..., 2] << 16)) << 8 >> 8
+        return (ints / float(1 << 23)).astype(np.float32)
+    width = 2 if sample_format == "pcm16" else 4
+    return (block / float(2 ** (8 * width - 1))).astype(np.float32)
+
+def iter_blocks(path: str, block_frames: int = BLOCK_FRAMES) -> Iterator[np.ndarray]:
+    """按块产出 float32 (frames, channels)，峰值内存与文件长度无关"""
+    mm, info = memmap_wav(path)
+    for i in range(0, info.frames, block_frames):
+        yield to_float32(mm[i:i + block_frames], info.sample_format)
+
+def read_wav(path: str) -> Tuple[np.ndarray, int]:
+    """整段读取为 float32 (frames, channels)，仅用于短音频"""
+    mm, info = memmap_wav(path)
+    return to_float32(mm[:], info.sample_format), info.sr
@@ -0,0 +1,310 @@
+import argparse
+import json
+import logging
+import os
+import re
+import sys
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from app.core import audio_io
+from app.core.config import settings
+
+log = logging.getLogger(__name__)
+
+# 素材库：离线把素材目录里的所有片段打包成一个单声道 PCM16 大文件 + 索引，
+# 合成时 mmap 打开，按字查行范围是 O(1) 字典，同字内按音高/时值找最近片段，切片零拷贝。
+# 目录布局：clips.pcm(原始小端 int16) / clips.npy(索引，按 字、音高 排序) /
+#           library.json(字 → 行范围)
+#
+# 素材命名：<字>[_<MIDI音高>][_<任意>].wav，可放在子目录；
+#           文件名里没有音高时用自相关估计，清音记为 NaN
+
+BLOB_NAME = "clips.pcm"
+INDEX_NAME = "clips.npy"
+MANIFEST_NAME = "library.json"
+FORMAT_VERSION = 1
+
+INDEX_DTYPE = np.dtype([("word", "<i4"), ("offset", "<i8"), ("frames", "<i4"),
+                        ("pitch", "<f4"), ("duration", "<f4")])
+
+_NAME_RE = re.compile(r"^(?P<word>[^_]+)(?:_(?P<pitch>\d{1,3}))?(?:_.*)?$")
+_TRIM_LEVEL = 10 ** (-50 / 20)   # 首尾低于 -50dBFS 的部分裁掉，拼接时片段即刻起音
+_FADE_SECONDS = 0.005
+
+class ClipLibraryError(RuntimeError):
+    pass
+
+def parse_name(path: str) -> Tuple[str, Optional[float]]:
+    stem = os.path.splitext(os.path.basename(path))[0]
+    m = _NAME_RE.match(stem)
+    if not m:
+        return stem, None
+    pitch = m.group("pitch")
+    return m.group("word"), float(pitch) if pitch is not None else None
+
+def estimate_pitch(x: np.ndarray, sr: int, fmin: float = 60.0, fmax: float = 1000.0) -> float:
+    """FFT 自相关取基频，返回 MIDI 音高；周期性不足时返回 NaN"""
+    n = min(len(x), 4096)
+    seg = x[(len(x) - n) // 2:][:n].astype(np.float64)
+    seg = seg - seg.mean()
+    lo, hi = int(sr / fmax), min(int(sr / fmin), n - 1)
+    if hi <= lo or not seg.any():
+        return float("nan")
+    spec = np.fft.rfft(seg, 2 * n)
+    ac = np.fft.irfft(spec * np.conj(spec))[:n]
+    ac /= ac[0]
+    lag = lo + int(np.argmax(ac[lo:hi]))
+    if ac[lag] < 0.3:
+        return float("nan")
+    # 抛物线插值细化峰位
+    if 0 < lag < n - 1:
+        a, b, c = ac[lag - 1], ac[lag], ac[lag + 1]
+        den = a - 2 * b + c
+        lag = lag + (0.5 * (a - c) / den if den else 0.0)
+    return float(69 + 12 * np.log2(sr / lag / 440.0))
+
+def _prepare(path: str, sr: int) -> np.ndarray:
+    """读素材 → 下混单声道 → 重采样到库采样率 → 裁掉首尾静音"""
+    data, src_sr = audio_io.read_wav(path)
+    mono = data.mean(axis=1, dtype=np.float32) if data.shape[1] > 1 else data[:, 0]
+    if src_sr != sr and len(mono):
+        n = max(1, int(round(len(mono) * sr / src_sr)))
+        mono = np.interp(np.arange(n) * (src_sr / sr), np.arange(len(mono)), mono)
+        mono = mono.astype(np.float32)
+    loud = np.flatnonzero(np.abs(mono) >= _TRIM_LEVEL)
+    return mono[loud[0]:loud[-1] + 1] if len(loud) else mono[:0]
+
+def _scan(src_dir: str) -> List[Tuple[str, str, Optional[float]]]:
+    found = []
+    for dirpath, _, filenames in os.walk(src_dir):
+        for fn in filenames:
+            if fn.lower().endswith(".wav"):
+                path = os.path.join(dirpath, fn)
+                found.append((*parse_name(path), path))
+    # 同一个字可以混用带/不带音高的命名，无音高的排在后面
+    found.sort(key=lambda t: (t[0], t[1] is None, t[1] or 0.0, t[2]))
+    return [(path, word, pitch) for word, pitch, path in found]
+
+def build(src_dir: str, out_dir: str, sr: Optional[int] = None) -> Dict[str, Any]:
+    """离线打包素材目录；PCM 按字聚集顺序追加写，全程只持有单个片段"""
+    sr = int(sr or settings.MIX_SAMPLE_RATE)
+    os.makedirs(out_dir, exist_ok=True)
+    words: List[str] = []
+    word_ids: Dict[str, int] = {}
+    rows = []
+    offset, skipped = 0, 0
+    # 三个文件都写完才依次替换(退出顺序与进入相反)：blob → index → manifest；
+    # 打开时校验 blob 长度，替换途中打开会得到明确错误而不是错位数据
+    with (audio_io.atomic_open(os.path.join(out_dir, MANIFEST_NAME), "w",
+                               encoding="utf-8") as manifest_f,
+          audio_io.atomic_open(os.path.join(out_dir, INDEX_NAME)) as index_f,
+          audio_io.atomic_open(os.path.join(out_dir, BLOB_NAME)) as blob):
+        for path, word, pitch in _scan(src_dir):
+            try:
+                clip = _prepare(path, sr)
+            except (OSError, ValueError) as e:
+                log.warning("skip clip %s: %s", path, e)
+                skipped += 1
+                continue
+            if not len(clip):
+                skipped += 1
+                continue
+            if pitch is None:
+                pitch = estimate_pitch(clip, sr)
+            if word not in word_ids:
+                word_ids[word] = len(words)
+                words.append(word)
+            blob.write(audio_io.encode_pcm(clip, "pcm16"))
+            rows.append((word_ids[word], offset, len(clip), pitch, len(clip) / sr))
+            offset += len(clip)
+        index = np.array(rows, dtype=INDEX_DTYPE)
+        # 同字内按音高排序(NaN 排最后)，manifest 记录每个字的行范围
+        index = index[np.lexsort((index["pitch"], index["word"]))]
+        bounds = np.searchsorted(index["word"], np.arange(len(words) + 1))
+        manifest = {
+            "version": FORMAT_VERSION, "sr": sr, "sample_format": "pcm16",
+            "clips": len(index), "frames": offset, "skipped": skipped,
+            "words": {w: [int(bounds[i]), int(bounds[i + 1])] for i, w in enumerate(words)},
+        }
+        np.save(index_f, index)
+        json.dump(manifest, manifest_f, ensure_ascii=False)
+    return {"clips": manifest["clips"], "words": len(words), "seconds": round(offset / sr, 3),
+            "skipped": skipped}
+
+class ClipLibrary:
+    def __init__(self, root: str):
+        self.root = root
+        try:
+            with open(os.path.join(root, MANIFEST_NAME), encoding="utf-8") as f:
+                manifest = json.load(f)
+            self.index = np.load(os.path.join(root, INDEX_NAME), allow_pickle=False)
+            blob_path = os.path.join(root, BLOB_NAME)
+            frames = os.path.getsize(blob_path) // 2
+            self.pcm = np.memmap(blob_path, dtype="<i2", mode="r") if frames else np.zeros(0, "<i2")
+        except (OSError, ValueError) as e:
+            raise ClipLibraryError(f"cannot open clip library {root}: {e}")
+        if manifest.get("version") != FORMAT_VERSION:
+            raise ClipLibraryError(f"unsupported clip library version {manifest.get('version')!r}")
+        if (frames != manifest["frames"] or len(self.index) != manifest["clips"]
+                or self.index.dtype != INDEX_DTYPE):
+            raise ClipLibraryError("clip library files are inconsistent (rebuild in progress?)")
+        self.sr = int(manifest["sr"])
+        self.ranges: Dict[str, Tuple[int, int]] = {
+            w: (a, b) for w, (a, b) in manifest["words"].items()}
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    @property
+    def words(self) -> List[str]:
+        return list(self.ranges)
+
+    def lookup(self, word: str) -> Tuple[int, int]:
+        """字 → 索引行范围 [start, end)；不存在返回 (0, 0)"""
+        return self.ranges.get(word, (0, 0))
+
+    def clip(self, row: int) -> np.ndarray:
+        """第 row 行片段的 int16 视图(零拷贝)"""
+        r = self.index[row]
+        return self.pcm[r["offset"]:r["offset"] + r["frames"]]
+
+    def nearest(self, word: str, pitch: Optional[float] = None, duration: Optional[float] = None,
+                duration_weight: float = 6.0) -> Optional[int]:
+        """同字内代价最小的行：|音高差(半音)| + duration_weight * |log2(时值比)|
+
+        未知音高不计音高项
+        """
+        a, b = self.lookup(word)
+        if a == b:
+            return None
+        cand = self.index[a:b]
+        cost = np.zeros(b - a)
+        if pitch is not None:
+            cost += np.nan_to_num(np.abs(cand["pitch"] - pitch), nan=0.0)
+        if duration is not None and duration > 0:
+            cost += duration_weight * np.abs(np.log2(cand["duration"] / duration))
+        return a + int(np.argmin(cost))
+
+    def nearest_many(self, words: Iterable[str], pitches: Iterable[float],
+                     durations: Iterable[float], duration_weight: float = 6.0) -> np.ndarray:
+        """批量查找：按字分组，每组一次向量化求 (请求数, 候选数) 代价矩阵；缺字为 -1"""
+        words = list(words)
+        pitches = np.asarray(list(pitches), dtype=np.float64)
+        durations = np.asarray(list(durations), dtype=np.float64)
+        out = np.full(len(words), -1, dtype=np.int64)
+        groups: Dict[str, List[int]] = {}
+        for i, w in enumerate(words):
+            groups.setdefault(w, []).append(i)
+        for w, idx in groups.items():
+            a, b = self.lookup(w)
+            if a == b:
+                continue
+            cand = self.index[a:b]
+            idx = np.asarray(idx)
+            cost = np.nan_to_num(np.abs(cand["pitch"][None, :] - pitches[idx, None]), nan=0.0)
+            dur = np.maximum(durations[idx, None], 1e-6)
+            cost += duration_weight * np.abs(np.log2(cand["duration"][None, :] / dur))
+            out[idx] = a + np.argmin(cost, axis=1)
+        return out
+
+    def render(self, notes: Iterable[Tuple[float, float, float, str]], out_path: str,
+               sample_format: str = "pcm16") -> Dict[str, int]:
+        """按 (起点秒, 时值秒, 音高, 字) 把片段拼到时间线上写出单声道 WAV。
+        音符需按起点排序且不重叠(量化输出即满足)；片段截到音符时值并做短淡出，找不到的字留空。"""
+        notes = list(notes)
+        rows = self.nearest_many([n[3] for n in notes], [n[2] for n in notes],
+                                 [n[1] for n in notes])
+        fade = max(1, int(_FADE_SECONDS * self.sr))
+        pos = placed = 0
+        with audio_io.WavWriter(out_path, self.sr, 1, sample_format) as w:
+            for (onset, dur, _, _), row in zip(notes, rows):
+                start = max(pos, int(round(onset * self.sr)))
+                if row < 0:
+                    continue
+                pcm = self.clip(int(row))[:max(0, int(round(dur * self.sr)))]
+                if not len(pcm):
+                    continue
+                for gap in range(pos, start, audio_io.BLOCK_FRAMES):
+                    w.write(np.zeros(min(audio_io.BLOCK_FRAMES, start - gap), np.float32))
+                seg = audio_io.to_float32(pcm, "pcm16")
+                k = min(fade, len(seg))
+                seg[-k:] *= np.linspace(1.0, 0.0, k, dtype=np.float32)
+                w.write(seg)
+                pos = start + len(seg)
+                placed += 1
+        return {"notes": len(notes), "placed": placed, "frames": pos}
+
+    def render_phrases(self, doc: Dict[str, Any], out_path: str) -> Dict[str, int]:
+        """phrases.json(填词后)里每个音符取 text 的对应字"""
+        notes = []
+        for p in doc.get("phrases", []):
+            text = p.get("text") or ""
+            for ch, (onset, dur, pitch) in zip(text, p["notes"]):
+                notes.append((onset, dur, pitch, ch))
+        return self.render(notes, out_path)
+
+_open_lock = threading.Lock()
+_opened: Dict[str, Tuple[float, ClipLibrary]] = {}
+
+def open_library(root: Optional[str] = None) -> ClipLibrary:
+    """按目录缓存已打开的库；重建后(manifest mtime 变化)自动重新打开"""
+    root = root or settings.CLIP_LIBRARY_DIR
+    if not root:
+        raise ClipLibraryError("CLIP_LIBRARY_DIR is not configured")
+    try:
+        mtime = os.stat(os.path.join(root, MANIFEST_NAME)).st_mtime_ns
+    except OSError as e:
+        raise ClipLibraryError(f"cannot open clip library {root}: {e}")
+    with _open_lock:
+        hit = _opened.get(root)
+        if hit and hit[0] == mtime:
+            return hit[1]
+        lib = ClipLibrary(root)
+        _opened[root] = (mtime, lib)
+        return lib
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="素材库打包与查询")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    b = sub.add_parser("build", help="把素材目录打包成库")
+    b.add_argument("src")
+    b.add_argument("out", nargs="?", default=None, help="默认 CLIP_LIBRARY_DIR")
+    b.add_argument("--sr", type=int, default=None, help="库采样率，默认 MIX_SAMPLE_RATE")
+    i = sub.add_parser("info", help="统计库内容")
+    i.add_argument("root", nargs="?", default=None)
+    f = sub.add_parser("find", help="查找最接近的片段")
+    f.add_argument("word")
+    f.add_argument("--root", default=None)
+    f.add_argument("--pitch", type=float, default=None)
+    f.add_argument("--duration", type=float, default=None)
+    args = ap.parse_args(argv)
+    try:
+        if args.cmd == "build":
+            out = args.out or settings.CLIP_LIBRARY_DIR
+            if not out:
+                ap.error("output directory required (or set CLIP_LIBRARY_DIR)")
+            print(json.dumps(build(args.src, out, args.sr), ensure_ascii=False))
+            return 0
+        lib = open_library(args.root)
+        if args.cmd == "info":
+            counts = {w: b - a for w, (a, b) in lib.ranges.items()}
+            print(json.dumps({"sr": lib.sr, "clips": len(lib), "words": counts},
+                             ensure_ascii=False))
+            return 0
+        row = lib.nearest(args.word, args.pitch, args.duration)
+        if row is None:
+            print(f"no clips for {args.word!r}", file=sys.stderr)
+            return 1
+        r = lib.index[row]
+        print(json.dumps({"row": row, "offset": int(r["offset"]), "frames": int(r["frames"]),
+                          "pitch": float(r["pitch"]), "duration": float(r["duration"])}))
+        return 0
+    except ClipLibraryError as e:
+        print(str(e), file=sys.stderr)
+        return 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -9,11 +9,36 @@ class Settings(BaseSettings):
     
     TEMP_DIR: str="/tmp/hachimi_ai_mad"
     RESULT_TTL_HOURS: int = Field(default=24, ge=1, le=169)
+    # 项目元数据索引(SQLite)，为空时放在 TEMP_DIR/meta_index.sqlite3
+    META_INDEX_PATH: str | None = None
     
     PUBLISH_DIR: str = "/var/hachimi_ai_mad/published"
     PUBLISHED_TTL_DAYS: int | None = None
+    # 发布索引(SQLite)，为空时放在 PUBLISH_DIR/index.sqlite3
+    PUBLISH_INDEX_PATH: str | None = None
+    
+    # 过期清理：每批条数、每秒最多删除数、单轮上限、常驻模式的间隔
+    SWEEP_BATCH_SIZE: int = Field(default=100, ge=1)
+    SWEEP_MAX_DELETES_PER_SEC: float = Field(default=20.0, ge=0)
+    SWEEP_MAX_PER_RUN: int = Field(default=5000, ge=1)
+    SWEEP_INTERVAL_MINUTES: int = Field(default=30, ge=1)
     
     MAX_UPLOAD_MB: int = 32
+    # 分片续传上传：单文件上限与分片大小
+    RESUMABLE_MAX_MB: int = Field(default=1024, ge=1)
+    UPLOAD_PART_MB: int = Field(default=8, ge=1, le=256)
+    
+    # /tasks/process 准入控制：pipeline 队列积压上限、TEMP_DIR 最低剩余空间；
+    # 没有历史耗时时按 ADMISSION_DEFAULT_JOB_SECONDS 估算排队时间
+    ADMISSION_ENABLED: bool = True
+    ADMISSION_MAX_QUEUED: int = Field(default=50, ge=1)
+    ADMISSION_MIN_FREE_MB: int = Field(default=1024, ge=0)
+    ADMISSION_DEFAULT_JOB_SECONDS: float = Field(default=60.0, gt=0)
+    
+    # 阶段产物内容寻址缓存，为空时放在 TEMP_DIR/stage_cache
+    STAGE_CACHE_ENABLED: bool = True
+    STAGE_CACHE_DIR: str | None = None
+    STAGE_CACHE_MAX_MB: int = Field(default=2048, ge=0)
     
     REDIS_URL: str = "redis://localhost:6379/0"#默认redis连接地址
     #celery消息代理及结果后端地址
@@ -27,6 +52,65 @@ class Settings(BaseSettings):
     #管理员密钥
     ADMIN_SECRET: str | None = None
     
+    # 流水线阶段图调度：同时运行的阶段数；CPU 阶段是否放进进程池
+    # (celery prefork 子进程是 daemon，不能再开进程池，需配合 --pool=threads/solo 使用)
+    PIPELINE_MAX_WORKERS: int = Field(default=4, ge=1, le=64)
+    PIPELINE_PROCESS_POOL: bool = False
+    # 流水线结束前为终混预编码的压缩格式(逗号分隔，为空不编码，与预览并行)
+    PIPELINE_ENCODE_FORMATS: str = ""
+    
+    # 合成阶段混音：输出采样率/声道、分轨增益、限幅天花板；预览片段从 PREVIEW_START_SECONDS 开始
+    # (曲子不够长时向前挪)，取 PREVIEW_SECONDS 秒
+    MIX_SAMPLE_RATE: int = Field(default=44100, ge=8000, le=192000)
+    MIX_CHANNELS: int = Field(default=2, ge=1, le=2)
+    MIX_VOCAL_GAIN_DB: float = 0.0
+    MIX_ACCOMP_GAIN_DB: float = -3.0
+    MIX_CEILING_DBFS: float = Field(default=-1.0, le=0)
+    PREVIEW_START_SECONDS: float = Field(default=30.0, ge=0)
+    PREVIEW_SECONDS: float = Field(default=30.0, gt=0)
+    
+    # 乐句切分：休止间隔达到多少拍即断句，单句最长多少小节(超出按小节周期强制断开)，每小节拍数
+    PHRASE_REST_BEATS: float = Field(default=1.0, gt=0)
+    PHRASE_MAX_BARS: int = Field(default=2, ge=1, le=16)
+    PHRASE_BEATS_PER_BAR: int = Field(default=4, ge=1, le=12)
+    
+    # 填词推理：模型文件(为空用内置测试模型)、上下文句数、批处理最大行数与攒批等待(毫秒)；
+    # LYRICS_PRELOAD 为 1 时 celery 子进程启动即加载模型
+    LYRICS_MODEL_PATH: str | None = None
+    LYRICS_CONTEXT_PHRASES: int = Field(default=4, ge=0, le=64)
+    LYRICS_BATCH_MAX_ROWS: int = Field(default=512, ge=1)
+    LYRICS_BATCH_WAIT_MS: float = Field(default=5.0, ge=0)
+    LYRICS_PRELOAD: int = 1
+    
+    # 合成素材库目录(python -m app.core.clip_library build 生成)；为空表示未配置
+    CLIP_LIBRARY_DIR: str | None = None
+    
+    # 人声分离：模型(内置名或 "包.模块:类名")、内存预算(MB，决定窗口长度)、
+    # 窗口并行线程数、窗口重叠交叉淡化时长
+    SEPARATION_MODEL: str = "center_band"
+    SEPARATION_MEMORY_MB: float = Field(default=256.0, gt=0)
+    SEPARATION_WORKERS: int = Field(default=2, ge=1, le=32)
+    SEPARATION_OVERLAP_SECONDS: float = Field(default=0.25, ge=0)
+    
+    # 压缩格式转码(mp3/opus)：ffmpeg 可执行文件、并发编码数、单次超时、副本总量上限，
+    # 发布时预热的格式(逗号分隔，为空不预热)；找不到 ffmpeg 时一律退回原 WAV
+    TRANSCODE_FFMPEG: str = "ffmpeg"
+    TRANSCODE_WORKERS: int = Field(default=2, ge=1, le=32)
+    TRANSCODE_TIMEOUT: float = Field(default=300.0, gt=0)
+    TRANSCODE_CACHE_MAX_MB: int = Field(default=2048, ge=0)
+    TRANSCODE_PUBLISH_FORMATS: str = "opus,mp3"
+    
+    # 任务进度推送：auto 表示 eager/local 执行时用进程内总线，否则用 Redis Stream
+    EVENTS_BACKEND: str = Field(default="auto", pattern="^(auto|memory|redis)$")
+    EVENTS_HEARTBEAT_SECONDS: float = Field(default=15.0, gt=0)
+    EVENTS_MAX_PER_JOB: int = Field(default=1000, ge=10)
+    
+    # 执行后端：celery(broker 或 eager)；local 为随 API 进程启动的线程任务池，单机无需 Redis
+    EXECUTION_BACKEND: str = Field(default="celery", pattern="^(celery|local)$")
+    LOCAL_WORKERS: int = Field(default=2, ge=1, le=64)
+    LOCAL_QUEUE_SIZE: int = Field(default=16, ge=1)
+    LOCAL_SHUTDOWN_TIMEOUT: float = Field(default=30.0, ge=0)
+    
     CELERY_TASK_TIME_LIMIT: int = Field(default=300, ge=30, le=3600)
     CELERY_WORKER_CONCURRENCY: int = Field(default=2, ge=1, le=64)
     # 测试方便：是否同步执行（pytest里也会 monkeypatch）
@@ -0,0 +1,112 @@
+import multiprocessing
+import time
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    Executor,
+    Future,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    wait,
+)
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+
+@dataclass(frozen=True)
+class Stage:
+    """流水线中的一个阶段：声明输入/输出键，fn(ctx) 返回包含全部输出键的 dict"""
+    name: str
+    fn: Callable[[Dict[str, Any]], Dict[str, Any]]
+    inputs: Tuple[str, ...] = ()
+    outputs: Tuple[str, ...] = ()
+    cpu: bool = False  # CPU 密集阶段可放进进程池；fn 需是可 pickle 的顶层函数
+
+def topo_order(stages: List[Stage], initial: Tuple[str, ...] = ()) -> List[Stage]:
+    """校验依赖并给出一个拓扑序；缺输入、重复产出或成环时抛 ValueError"""
+    producers: Dict[str, str] = {}
+    for st in stages:
+        for key in st.outputs:
+            if key in producers or key in initial:
+                raise ValueError(f"output {key!r} produced twice")
+            producers[key] = st.name
+    available = set(initial)
+    pending = list(stages)
+    order: List[Stage] = []
+    while pending:
+        ready = [st for st in pending if all(k in available for k in st.inputs)]
+        if not ready:
+            missing = {k for st in pending for k in st.inputs
+                       if k not in available and k not in producers}
+            if missing:
+                raise ValueError(f"unresolved inputs: {sorted(missing)}")
+            raise ValueError("stage graph has a cycle")
+        for st in ready:
+            order.append(st)
+            available.update(st.outputs)
+            pending.remove(st)
+    return order
+
+def _call(fn: Callable[[Dict[str, Any]], Dict[str, Any]],
+          ctx: Dict[str, Any]) -> Tuple[Dict[str, Any], float]:
+    t0 = time.perf_counter()
+    out = fn(ctx) or {}
+    return out, time.perf_counter() - t0
+
+def run_graph(
+    stages: List[Stage],
+    ctx: Dict[str, Any],
+    on_step: Optional[Callable[[str, int], None]] = None,
+    max_workers: int = 4,
+    process_pool: bool = False,
+) -> Tuple[Dict[str, Any], Dict[str, float]]:
+    """依赖就绪的阶段并发执行；on_step 只在调度线程里按启动顺序回调
+
+    返回 (最终 ctx, 各阶段耗时秒数)。任一阶段失败时不再启动新阶段，
+    等已启动的阶段结束后抛出第一个异常。
+    """
+    order = topo_order(stages, tuple(ctx))
+    ctx = dict(ctx)
+    timings: Dict[str, float] = {}
+    pending = list(order)
+    running: Dict[Future, Stage] = {}
+    started = 0
+    error: Optional[BaseException] = None
+    threads = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="stage")
+    procs: Optional[Executor] = None
+    if process_pool:
+        # spawn：不继承父进程里的锁与缓存状态
+        procs = ProcessPoolExecutor(max_workers=max_workers,
+                                    mp_context=multiprocessing.get_context("spawn"))
+    try:
+        while pending or running:
+            if error is None:
+                for st in [s for s in pending if all(k in ctx for k in s.inputs)]:
+                    pending.remove(st)
+                    started += 1
+                    if on_step:
+                        on_step(st.name, started)
+                    pool = procs if (st.cpu and procs is not None) else threads
+                    running[pool.submit(_call, st.fn, dict(ctx))] = st
+            if not running:
+                break
+            done, _ = wait(list(running), return_when=FIRST_COMPLETED)
+            for fut in done:
+                st = running.pop(fut)
+                try:
+                    out, elapsed = fut.result()
+                except BaseException as e:
+                    error = error or e
+                    continue
+                missing = [k for k in st.outputs if k not in out]
+                if missing:
+                    error = error or ValueError(f"stage {st.name!r} did not produce {missing}")
+                    continue
+                ctx.update({k: out[k] for k in st.outputs})
+                timings[st.name] = round(elapsed, 4)
+        if error is not None:
+            raise error
+    finally:
+        threads.shutdown(wait=True)
+        if procs is not None:
+            procs.shutdown(wait=True)
+    return ctx, timings
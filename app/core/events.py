@@ -0,0 +1,241 @@
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+from app.core.config import settings
+
+log = logging.getLogger(__name__)
+
+# 任务进度推送：worker 发布，API 端一个任务只订阅一次，再扇出给所有 SSE 连接
+# 事件 id 形如 "<a>-<b>"，与 Redis Stream id 同构，便于断线续传时比较先后
+TERMINAL_STATUSES = ("SUCCEEDED", "FAILED")
+
+Event = Tuple[str, str, Dict[str, Any]]  # (id, type, data)
+
+def _id_key(event_id: Optional[str]) -> Tuple[int, int]:
+    if not event_id:
+        return (-1, -1)
+    try:
+        a, _, b = event_id.partition("-")
+        return (int(a), int(b or 0))
+    except ValueError:
+        return (-1, -1)
+
+def is_terminal(event: Event) -> bool:
+    return event[2].get("status") in TERMINAL_STATUSES
+
+def _backend() -> str:
+    if settings.EVENTS_BACKEND != "auto":
+        return settings.EVENTS_BACKEND
+    local = settings.CELERY_EAGER or settings.EXECUTION_BACKEND == "local"
+    return "memory" if local else "redis"
+
+# ========== 进程内事件总线(eager/本地模式) ==========
+class MemoryEventBus:
+    def __init__(self, max_jobs: int = 1024, max_events: int = 256):
+        self.max_jobs = max_jobs
+        self.max_events = max_events
+        self._lock = threading.Lock()
+        self._seq = 0
+        self._history: OrderedDict[str, List[Event]] = OrderedDict()
+        self._waiters: Dict[str, List[Callable[[Event], None]]] = {}
+
+    def publish(self, job_id: str, event_type: str, data: Dict[str, Any]) -> str:
+        with self._lock:
+            self._seq += 1
+            ev: Event = (f"0-{self._seq}", event_type, data)
+            hist = self._history.setdefault(job_id, [])
+            self._history.move_to_end(job_id)
+            hist.append(ev)
+            del hist[:-self.max_events]
+            while len(self._history) > self.max_jobs:
+                self._history.popitem(last=False)
+            waiters = list(self._waiters.get(job_id, ()))
+        for cb in waiters:
+            cb(ev)
+        return ev[0]
+
+    def history(self, job_id: str, after: Optional[str] = None) -> List[Event]:
+        key = _id_key(after)
+        with self._lock:
+            return [ev for ev in self._history.get(job_id, ()) if _id_key(ev[0]) > key]
+
+    def subscribe(self, job_id: str, cb: Callable[[Event], None]) -> Callable[[], None]:
+        with self._lock:
+            self._waiters.setdefault(job_id, []).append(cb)
+        def unsubscribe() -> None:
+            with self._lock:
+                lst = self._waiters.get(job_id, [])
+                if cb in lst:
+                    lst.remove(cb)
+                if not lst:
+                    self._waiters.pop(job_id, None)
+        return unsubscribe
+
+memory_bus = MemoryEventBus()
+
+# ========== Redis Stream 后端 ==========
+_sync_clients: Dict[int, Any] = {}
+
+def _stream_key(job_id: str) -> str:
+    return f"hachimi:events:{job_id}"
+
+def _redis():
+    client = _sync_clients.get(os.getpid())
+    if client is None:
+        import redis
+        client = _sync_clients[os.getpid()] = redis.Redis.from_url(settings.REDIS_URL)
+    return client
+
+def _decode(entry_id, fields) -> Event:
+    eid = entry_id.decode() if isinstance(entry_id, bytes) else entry_id
+    raw = fields.get(b"data") or fields.get("data") or b"{}"
+    etype = fields.get(b"type") or fields.get("type") or b"status"
+    return (eid, etype.decode() if isinstance(etype, bytes) else etype, json.loads(raw))
+
+def publish(job_id: str, event_type: str, data: Dict[str, Any]) -> Optional[str]:
+    """发布一条任务事件；推送失败只记日志，不影响任务本身"""
+    data = {"job_id": job_id, "ts": time.time(), **data}
+    if _backend() == "memory":
+        return memory_bus.publish(job_id, event_type, data)
+    try:
+        r = _redis()
+        key = _stream_key(job_id)
+        eid = r.xadd(key, {"type": event_type, "data": json.dumps(data, ensure_ascii=False)},
+                     maxlen=settings.EVENTS_MAX_PER_JOB, approximate=True)
+        r.expire(key, settings.RESULT_TTL_HOURS * 3600)
+        return eid.decode() if isinstance(eid, bytes) else eid
+    except Exception:
+        log.exception("publish event failed for %s", job_id)
+        return None
+
+class _RedisChannel:
+    """一个事件循环内同一任务共用的 Redis 读取协程，把事件扇出给各个队列"""
+
+    def __init__(self, client, job_id: str):
+        self.client = client
+        self.job_id = job_id
+        self.queues: List[asyncio.Queue] = []
+        self.task: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        # 先拿到当前末尾 id 作为读取起点，之后的事件不会落在历史回放与实时读取的缝隙里
+        last = await self.client.xrevrange(_stream_key(self.job_id), count=1)
+        cursor = _decode(*last[0])[0] if last else "0-0"
+        self.task = asyncio.get_running_loop().create_task(self._run(cursor))
+
+    async def _run(self, cursor: str) -> None:
+        block_ms = int(settings.EVENTS_HEARTBEAT_SECONDS * 1000)
+        key = _stream_key(self.job_id)
+        while self.queues:
+            try:
+                resp = await self.client.xread({key: cursor}, block=block_ms, count=100)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                log.exception("xread failed for %s", self.job_id)
+                await asyncio.sleep(1.0)
+                continue
+            for _, entries in resp or ():
+                for entry_id, fields in entries:
+                    ev = _decode(entry_id, fields)
+                    cursor = ev[0]
+                    for q in list(self.queues):
+                        q.put_nowait(ev)
+
+_channels: Dict[Tuple[int, str], _RedisChannel] = {}
+_async_clients: Dict[int, Any] = {}
+
+def _async_redis():
+    loop_id = id(asyncio.get_running_loop())
+    client = _async_clients.get(loop_id)
+    if client is None:
+        import redis.asyncio as aioredis
+        client = _async_clients[loop_id] = aioredis.Redis.from_url(settings.REDIS_URL)
+    return client
+
+async def _subscribe_redis(job_id: str, q: asyncio.Queue) -> Callable[[], None]:
+    key = (id(asyncio.get_running_loop()), job_id)
+    ch = _channels.get(key)
+    if ch is None:
+        ch = _channels[key] = _RedisChannel(_async_redis(), job_id)
+        ch.queues.append(q)
+        await ch.start()
+    else:
+        ch.queues.append(q)
+    def unsubscribe() -> None:
+        if q in ch.queues:
+            ch.queues.remove(q)
+        if not ch.queues:
+            _channels.pop(key, None)
+            if ch.task is not None:
+                ch.task.cancel()
+    return unsubscribe
+
+async def _history_redis(job_id: str, after: Optional[str]) -> List[Event]:
+    lo = f"({after}" if after and _id_key(after) >= (0, 0) else "-"
+    entries = await _async_redis().xrange(_stream_key(job_id), min=lo, max="+")
+    return [_decode(eid, fields) for eid, fields in entries]
+
+async def _history(job_id: str, after: Optional[str]) -> List[Event]:
+    if _backend() == "memory":
+        return memory_bus.history(job_id, after)
+    return await _history_redis(job_id, after)
+
+async def listen(job_id: str, last_event_id: Optional[str] = None,
+                 final: Optional[Dict[str, Any]] = None) -> AsyncIterator[Optional[Event]]:
+    """先回放 last_event_id 之后的历史，再推送实时事件；超时产出 None 作为心跳，终态后结束
+
+    final 为已结束任务的终态数据：只回放历史，历史里没有终态事件(已过期)时补发一条合成的再结束
+    """
+    if final is not None:
+        last_id = last_event_id or "0-0"
+        for ev in await _history(job_id, last_event_id):
+            last_id = ev[0]
+            yield ev
+            if is_terminal(ev):
+                return
+        yield (last_id, "status", {"job_id": job_id, **final})
+        return
+    q: asyncio.Queue = asyncio.Queue()
+    if _backend() == "memory":
+        loop = asyncio.get_running_loop()
+        unsubscribe = memory_bus.subscribe(
+            job_id, lambda ev: loop.call_soon_threadsafe(q.put_nowait, ev))
+        history = memory_bus.history(job_id, last_event_id)
+    else:
+        unsubscribe = await _subscribe_redis(job_id, q)
+        history = await _history_redis(job_id, last_event_id)
+    last = _id_key(last_event_id)
+    try:
+        for ev in history:
+            last = _id_key(ev[0])
+            yield ev
+            if is_terminal(ev):
+                return
+        while True:
+            try:
+                ev = await asyncio.wait_for(q.get(), timeout=settings.EVENTS_HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                yield None
+                continue
+            if _id_key(ev[0]) <= last:
+                continue
+            last = _id_key(ev[0])
+            yield ev
+            if is_terminal(ev):
+                return
+    finally:
+        unsubscribe()
+
+def format_sse(event: Optional[Event]) -> bytes:
+    if event is None:
+        return b": ping\n\n"
+    eid, etype, data = event
+    payload = json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+    return f"id: {eid}\nevent: {etype}\ndata: {payload}\n\n".encode()
@@ -0,0 +1,109 @@
+import hashlib
+import os
+from email.utils import parsedate_to_datetime
+from typing import Optional, Tuple
+
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, Response
+from starlette.types import Receive, Scope, Send
+
+# 音频文件下发：Range(206) 由 starlette 处理，这里补上强 ETag、条件请求(304)、
+# 缓存策略，以及服务器支持 zerocopysend 扩展时走 sendfile；只覆盖公开的 __call__，
+# 不依赖 FileResponse 的内部方法
+IMMUTABLE_CACHE = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE = "no-cache"
+
+def file_version(st: os.stat_result) -> str:
+    """文件身份(inode+mtime+size)的短哈希，内容被替换后必然变化"""
+    raw = f"{st.st_ino}-{st.st_mtime_ns}-{st.st_size}"
+    return hashlib.sha1(raw.encode("ascii")).hexdigest()[:16]
+
+def _etag_matches(header: str, etag: str) -> bool:
+    if header.strip() == "*":
+        return True
+    # 弱比较：W/ 前缀视为同一实体
+    return etag in [t.strip().removeprefix("W/") for t in header.split(",")]
+
+def _single_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """解析单段 bytes 范围，返回 [start, end)；多段、非法或不可满足的返回 None，交给 starlette"""
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+    first, sep, last = spec.strip().partition("-")
+    if not sep:
+        return None
+    try:
+        if first:
+            start, end = int(first), int(last) + 1 if last else size
+        else:
+            start, end = max(size - int(last), 0), size
+    except ValueError:
+        return None
+    end = min(end, size)
+    return (start, end) if 0 <= start < end else None
+
+class CachedFileResponse(FileResponse):
+    chunk_size = 1024 * 1024  # 大块读，减少每块一次线程切换
+
+    def __init__(self, path: str, stat_result: os.stat_result, filename: Optional[str] = None,
+                 cache_control: str = REVALIDATE_CACHE, **kwargs):
+        super().__init__(path, filename=filename, stat_result=stat_result, **kwargs)
+        self.headers["cache-control"] = cache_control
+
+    def set_stat_headers(self, stat_result: os.stat_result) -> None:
+        self.headers.setdefault("etag", f'"{file_version(stat_result)}"')
+        super().set_stat_headers(stat_result)
+
+    def _not_modified(self, headers: Headers) -> bool:
+        inm = headers.get("if-none-match")
+        if inm is not None:
+            return _etag_matches(inm, self.headers["etag"])
+        ims = headers.get("if-modified-since")
+        if ims is not None:
+            try:
+                return int(self.stat_result.st_mtime) <= parsedate_to_datetime(ims).timestamp()
+            except (TypeError, ValueError):
+                return False
+        return False
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        headers = Headers(scope=scope)
+        if scope["method"].upper() in ("GET", "HEAD") and self._not_modified(headers):
+            keep = ("etag", "last-modified", "cache-control")
+            resp = Response(status_code=304,
+                            headers={k: self.headers[k] for k in keep if k in self.headers})
+            return await resp(scope, receive, send)
+        if not await self._send_zerocopy(scope, headers, send):
+            await super().__call__(scope, receive, send)
+
+    async def _send_zerocopy(self, scope: Scope, headers: Headers, send: Send) -> bool:
+        """服务器支持 zerocopysend 时直接下发整文件或单段范围；其余情况返回 False 走 starlette"""
+        if ("http.response.zerocopysend" not in scope.get("extensions", {})
+                or scope["method"].upper() != "GET" or "if-range" in headers):
+            return False
+        size = self.stat_result.st_size
+        http_range = headers.get("range")
+        if http_range is None:
+            status, start, end = self.status_code, 0, size
+        else:
+            span = _single_range(http_range, size)
+            if span is None:
+                return False
+            status, (start, end) = 206, span
+            self.headers["content-range"] = f"bytes {start}-{end - 1}/{size}"
+            self.headers["content-length"] = str(end - start)
+        await send({"type": "http.response.start", "status": status, "headers": self.raw_headers})
+        await self._send_file(send, start, end)
+        if self.background is not None:
+            await self.background()
+        return True
+
+    async def _send_file(self, send: Send, start: int, end: int) -> None:
+        with open(self.path, "rb") as f:
+            await send({
+                "type": "http.response.zerocopysend",
+                "file": f,
+                "offset": start,
+                "count": end - start,
+                "more_body": False,
+            })
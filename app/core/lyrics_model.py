@@ -0,0 +1,296 @@
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.core import audio_io, metrics, phrases
+from app.core.config import settings
+
+log = logging.getLogger(__name__)
+
+# 填词推理：每句的特征 + 前若干句的上下文特征 → 树集成分类器选出歌词模板，按音符数铺成字。
+# 模型离线用 sklearn 训练后导出为 .npz 平铺数组(见 export_forest)，worker 只依赖 numpy；
+# 每个 worker 进程加载并校验一次(celery worker_process_init，其他后端首次使用时)，
+# 推理请求经进程内批处理线程合并：同一首歌的所有句子一批，同进程并发的多个任务也会拼进同一批。
+
+DEFAULT_MODEL = os.path.join(os.path.dirname(os.path.dirname(__file__)), "models",
+                             "lyrics_forest_test.npz")
+FORMAT = "forest-v1"
+
+class ModelError(RuntimeError):
+    pass
+
+def input_names() -> List[str]:
+    return [*phrases.FEATURES, *(f"ctx_{n}" for n in phrases.FEATURES)]
+
+def context_rows(feats: np.ndarray, window: int) -> np.ndarray:
+    """拼上前 window 句特征的均值(首句为 0)；用前缀和逐句滑动，不对每句重算窗口"""
+    n = len(feats)
+    cs = np.zeros((n + 1, feats.shape[1]), dtype=np.float64)
+    np.cumsum(feats, axis=0, dtype=np.float64, out=cs[1:])
+    idx = np.arange(n)
+    lo = np.maximum(idx - window, 0)
+    cnt = (idx - lo)[:, None]
+    ctx = np.divide(cs[idx] - cs[lo], cnt, out=np.zeros((n, feats.shape[1])), where=cnt > 0)
+    return np.hstack([feats, ctx]).astype(np.float32)
+
+class ForestModel:
+    """平铺的树集成：节点数组跨树拼接，子节点为全局下标，叶子的 left = -1"""
+
+    def __init__(self, arrays: Dict[str, np.ndarray], path: str = ""):
+        self.path = path
+        try:
+            if str(arrays["format"]) != FORMAT:
+                raise ModelError(f"unsupported model format {arrays['format']!r}")
+            self.feature_names = [str(x) for x in arrays["feature_names"]]
+            self.classes = [str(x) for x in arrays["classes"]]
+            self.roots = arrays["roots"].astype(np.int64)
+            self.left = arrays["left"].astype(np.int64)
+            self.right = arrays["right"].astype(np.int64)
+            self.feature = arrays["feature"].astype(np.int64)
+            self.threshold = arrays["threshold"].astype(np.float32)
+            self.value = arrays["value"].astype(np.float32)
+            self.depth = int(arrays["depth"])
+        except KeyError as e:
+            raise ModelError(f"model missing array {e}")
+        self._validate()
+
+    def _validate(self) -> None:
+        n = len(self.left)
+        lengths = (len(self.right), len(self.feature), len(self.threshold), len(self.value))
+        if any(k != n for k in lengths):
+            raise ModelError("node arrays differ in length")
+        if self.value.ndim != 2 or self.value.shape[1] != len(self.classes):
+            raise ModelError("value shape does not match classes")
+        if not len(self.roots) or self.roots.min() < 0 or self.roots.max() >= n:
+            raise ModelError("bad tree roots")
+        inner = self.left >= 0
+        for child in (self.left[inner], self.right[inner]):
+            if len(child) and (child.min() < 0 or child.max() >= n):
+                raise ModelError("child index out of range")
+        split = self.feature[inner]
+        if len(split) and (split.min() < 0 or split.max() >= self.n_features):
+            raise ModelError("split feature out of range")
+        if self.feature_names != input_names():
+            raise ModelError("model inputs do not match phrase features")
+        # 冒烟预测：深度不足会让节点停在非叶子上
+        probe = self._leaves(np.zeros((1, self.n_features), np.float32))
+        if (self.left[probe] >= 0).any():
+            raise ModelError("declared depth shallower than trees")
+
+    @property
+    def n_features(self) -> int:
+        return len(self.feature_names)
+
+    @classmethod
+    def load(cls, path: str) -> "ForestModel":
+        try:
+            with np.load(path, allow_pickle=False) as z:
+                arrays = {k: z[k] for k in z.files}
+        except (OSError, ValueError) as e:
+            raise ModelError(f"cannot read model {path}: {e}")
+        return cls(arrays, path)
+
+    def _leaves(self, X: np.ndarray) -> np.ndarray:
+        """所有 (行, 树) 同时下降，每层一次向量化比较，返回 (行数, 树数) 的叶子下标"""
+        node = np.broadcast_to(self.roots, (len(X), len(self.roots))).copy()
+        rows = np.arange(len(X))[:, None]
+        for _ in range(self.depth):
+            inner = self.left[node] >= 0
+            if not inner.any():
+                break
+            go_left = X[rows, self.feature[node]] <= self.threshold[node]
+            node = np.where(inner, np.where(go_left, self.left[node], self.right[node]), node)
+        return node
+
+    def predict_proba(self, X: np.ndarray) -> np.ndarray:
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim != 2 or X.shape[1] != self.n_features:
+            raise ModelError(f"expected (n, {self.n_features}) input, got {X.shape}")
+        if not len(X):
+            return np.zeros((0, len(self.classes)), np.float32)
+        return self.value[self._leaves(X)].mean(axis=1)
+
+def export_forest(path: str, trees: List[Any], classes: List[str],
+                  feature_names: Optional[List[str]] = None) -> None:
+    """把训练好的树(sklearn 的 estimator.tree_ 或同名属性的对象)导出为平铺 .npz"""
+    lefts, rights, feats, thrs, vals, roots = [], [], [], [], [], []
+    depth, base = 0, 0
+    for t in trees:
+        t = getattr(t, "tree_", t)
+        left, right = np.asarray(t.children_left), np.asarray(t.children_right)
+        val = np.asarray(t.value, dtype=np.float64).reshape(len(left), -1)
+        val = val / np.maximum(val.sum(axis=1, keepdims=True), 1e-12)
+        roots.append(base)
+        lefts.append(np.where(left >= 0, left + base, -1))
+        rights.append(np.where(right >= 0, right + base, -1))
+        feats.append(np.maximum(np.asarray(t.feature), 0))
+        thrs.append(np.asarray(t.threshold, dtype=np.float32))
+        vals.append(val.astype(np.float32))
+        depth = max(depth, int(getattr(t, "max_depth", len(left))))
+        base += len(left)
+    with audio_io.atomic_open(path) as f:
+        np.savez_compressed(
+            f, format=np.array(FORMAT), feature_names=np.array(feature_names or input_names()),
+            classes=np.array(classes), roots=np.array(roots, np.int64), depth=np.array(depth),
+            left=np.concatenate(lefts).astype(np.int32),
+            right=np.concatenate(rights).astype(np.int32),
+            feature=np.concatenate(feats).astype(np.int32), threshold=np.concatenate(thrs),
+            value=np.concatenate(vals),
+        )
+
+# ========== 进程内批处理 ==========
+class Batcher:
+    """把各线程提交的特征行攒成一批推理：首个请求到达后最多再等 max_wait 秒或攒满 max_rows 行"""
+
+    def __init__(self, model: ForestModel, max_rows: int, max_wait: float):
+        self.model = model
+        self.max_rows, self.max_wait = max_rows, max_wait
+        self._q: queue.Queue[Tuple[np.ndarray, Future]] = queue.Queue()
+        self.batches = 0
+        self.rows = 0
+        self.last_batch_ms = 0.0
+        threading.Thread(target=self._loop, name="lyrics-batcher", daemon=True).start()
+
+    def predict_proba(self, X: np.ndarray, timeout: Optional[float] = None) -> np.ndarray:
+        fut: Future = Future()
+        self._q.put((np.asarray(X, dtype=np.float32), fut))
+        return fut.result(timeout)
+
+    def _collect(self) -> List[Tuple[np.ndarray, Future]]:
+        items = [self._q.get()]
+        rows = len(items[0][0])
+        deadline = time.monotonic() + self.max_wait
+        while rows < self.max_rows:
+            left = deadline - time.monotonic()
+            if left <= 0:
+                break
+            try:
+                item = self._q.get(timeout=left)
+            except queue.Empty:
+                break
+            items.append(item)
+            rows += len(item[0])
+        return items
+
+    def _loop(self) -> None:
+        while True:
+            items = self._collect()
+            try:
+                t0 = time.perf_counter()
+                out = self.model.predict_proba(np.concatenate([x for x, _ in items]))
+                seconds = time.perf_counter() - t0
+            except Exception as e:
+                for _, fut in items:
+                    fut.set_exception(e)
+                continue
+            self.batches += 1
+            self.rows += len(out)
+            self.last_batch_ms = round(seconds * 1000, 3)
+            metrics.LYRICS_BATCH_SECONDS.observe(seconds)
+            metrics.LYRICS_BATCH_ROWS.observe(len(out))
+            pos = 0
+            for x, fut in items:
+                fut.set_result(out[pos:pos + len(x)])
+                pos += len(x)
+
+_lock = threading.Lock()
+_service: Optional[Tuple[int, Batcher, float]] = None  # (pid, batcher, 加载耗时)
+
+def load(path: Optional[str] = None) -> Batcher:
+    """加载并校验模型、启动批处理线程；fork 出的子进程(pid 变化)会重新加载"""
+    global _service
+    with _lock:
+        if _service is not None and _service[0] == os.getpid():
+            return _service[1]
+        path = path or settings.LYRICS_MODEL_PATH or DEFAULT_MODEL
+        t0 = time.perf_counter()
+        model = ForestModel.load(path)
+        seconds = time.perf_counter() - t0
+        metrics.LYRICS_MODEL_LOAD_SECONDS.observe(seconds)
+        batcher = Batcher(model, settings.LYRICS_BATCH_MAX_ROWS,
+                          settings.LYRICS_BATCH_WAIT_MS / 1000)
+        _service = (os.getpid(), batcher, seconds)
+        log.info("lyrics model %s loaded in %.1f ms (%d trees, %d nodes)",
+                 path, seconds * 1000, len(model.roots), len(model.left))
+        return batcher
+
+def reset() -> None:
+    """丢弃已加载的模型(测试或热更新后使用)"""
+    global _service
+    with _lock:
+        _service = None
+
+def stats() -> Dict[str, Any]:
+    svc = _service
+    if svc is None or svc[0] != os.getpid():
+        return {"loaded": False}
+    _, b, seconds = svc
+    return {"loaded": True, "path": b.model.path, "load_ms": round(seconds * 1000, 3),
+            "batches": b.batches, "rows": b.rows, "last_batch_ms": b.last_batch_ms}
+
+def _syllables(template: str, n: int) -> str:
+    return "".join(template[i % len(template)] for i in range(n)) if template else ""
+
+def fill(out_dir: str) -> Dict[str, Any]:
+    """读 out_dir 下的 phrases.json / features.npy，为每句填上 text 并原子写回"""
+    path = os.path.join(out_dir, phrases.PHRASES_NAME)
+    with open(path, encoding="utf-8") as f:
+        doc = json.load(f)
+    if doc.get("feature_names") != list(phrases.FEATURES):
+        raise ModelError("phrases.json feature layout does not match this version")
+    batcher = load()
+    X = context_rows(phrases.load_features(out_dir), settings.LYRICS_CONTEXT_PHRASES)
+    proba = batcher.predict_proba(X, timeout=settings.CELERY_TASK_TIME_LIMIT)
+    best = proba.argmax(axis=1)
+    classes = batcher.model.classes
+    for p, k, conf in zip(doc["phrases"], best.tolist(), proba.max(axis=1).tolist()):
+        p["lyric_class"] = classes[k]
+        p["confidence"] = round(conf, 4)
+        p["text"] = _syllables(classes[k], p["note_count"])
+    doc["lyrics_model"] = os.path.basename(batcher.model.path)
+    with audio_io.atomic_open(path, "w", encoding="utf-8") as f:
+        json.dump(doc, f, ensure_ascii=False, separators=(",", ":"))
+    return {"phrases": len(best), "classes": int(len(np.unique(best)))}
+
+# ========== 测试模型 ==========
+TEST_CLASSES = ["哈基米", "哈基米哦南北绿豆", "阿西噶哈呀库那路", "曼波", "哦马自立曼波"]
+
+def make_test_model(path: str, n_trees: int = 8, depth: int = 5, seed: int = 0) -> None:
+    """用随机乐句的特征分布生成一个随机切分的小森林，仅用于测试/冒烟"""
+    from app.core import midi
+    rng = np.random.default_rng(seed)
+    cells = np.sort(rng.choice(20000, 3000, replace=False))
+    step = 60 / 120 / 4
+    notes = midi.Notes(cells * step, step * np.minimum(np.diff(cells, append=cells[-1] + 2), 8),
+                       rng.integers(48, 84, len(cells)), np.full(len(cells), 90))
+    _, feats = phrases.analyze(notes, 120)
+    X = context_rows(feats, 4)
+
+    class _Tree:
+        pass
+    trees = []
+    n_inner = 2 ** depth - 1
+    for _ in range(n_trees):
+        n = 2 ** (depth + 1) - 1
+        t = _Tree()
+        idx = np.arange(n)
+        t.children_left = np.where(idx < n_inner, 2 * idx + 1, -1)
+        t.children_right = np.where(idx < n_inner, 2 * idx + 2, -1)
+        t.feature = np.where(idx < n_inner, rng.integers(0, X.shape[1], n), -2)
+        picked = X[rng.integers(0, len(X), n), t.feature.clip(0)]
+        t.threshold = np.where(idx < n_inner, picked, -2.0)
+        t.value = rng.dirichlet(np.full(len(TEST_CLASSES), 0.3), n)
+        t.max_depth = depth
+        trees.append(t)
+    export_forest(path, trees, TEST_CLASSES)
+
+if __name__ == "__main__":
+    import sys
+    make_test_model(sys.argv[1] if len(sys.argv) > 1 else DEFAULT_MODEL)
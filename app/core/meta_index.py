@@ -0,0 +1,289 @@
+import base64
+import json
+import logging
+import os
+import sqlite3
+import sys
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.core.config import settings
+
+log = logging.getLogger(__name__)
+
+# meta.json 仍是唯一可信来源，这里只是可随时重建的二级索引
+_PROJECTS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS projects (
+    project_id  TEXT PRIMARY KEY,
+    created_at  TEXT,
+    is_featured INTEGER NOT NULL DEFAULT 0,
+    meta        TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_projects_created ON projects(created_at DESC);
+CREATE INDEX IF NOT EXISTS idx_projects_featured ON projects(is_featured, created_at DESC);
+CREATE INDEX IF NOT EXISTS idx_projects_running ON projects(json_extract(meta, '$.job_started_at'))
+    WHERE json_extract(meta, '$.job_status') = 'RUNNING';
+"""
+
+_PUBLISHED_SCHEMA = """
+CREATE TABLE IF NOT EXISTS published (
+    public_id    TEXT PRIMARY KEY,
+    published_at TEXT NOT NULL,
+    meta         TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_published_at ON published(published_at DESC, public_id DESC);
+"""
+
+_local = threading.local()
+
+def index_path() -> str:
+    return settings.META_INDEX_PATH or os.path.join(settings.TEMP_DIR, "meta_index.sqlite3")
+
+def published_index_path() -> str:
+    # 与发布文件放在一起，临时目录清理不影响展示区
+    return settings.PUBLISH_INDEX_PATH or os.path.join(settings.PUBLISH_DIR, "index.sqlite3")
+
+def _projects_base() -> str:
+    return os.path.join(settings.TEMP_DIR, "projects")
+
+def open_db(path: str, schema: str, rebuild_fn=None) -> sqlite3.Connection:
+    """按 线程+进程+路径 缓存连接，避免 fork 后复用父进程连接"""
+    key = (os.getpid(), path)
+    conns = getattr(_local, "conns", None)
+    if conns is None:
+        conns = _local.conns = {}
+    conn = conns.get(key)
+    if conn is not None:
+        return conn
+    fresh = not os.path.exists(path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    conn = sqlite3.connect(path, timeout=10.0, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.executescript(schema)
+    conns[key] = conn
+    if fresh and rebuild_fn is not None:
+        # 首次创建索引时从已有 meta.json 回填，兼容旧数据
+        rebuild_fn(conn)
+    return conn
+
+def _connect() -> sqlite3.Connection:
+    return open_db(index_path(), _PROJECTS_SCHEMA, _rebuild)
+
+def _connect_published() -> sqlite3.Connection:
+    return open_db(published_index_path(), _PUBLISHED_SCHEMA, _rebuild_published)
+
+def _row(meta: Dict[str, Any]) -> tuple:
+    return (
+        meta["project_id"],
+        meta.get("created_at"),
+        1 if meta.get("is_featured") else 0,
+        json.dumps(meta, ensure_ascii=False),
+    )
+
+_UPSERT = (
+    "INSERT INTO projects(project_id, created_at, is_featured, meta) VALUES (?, ?, ?, ?) "
+    "ON CONFLICT(project_id) DO UPDATE SET "
+    "created_at=excluded.created_at, is_featured=excluded.is_featured, meta=excluded.meta"
+)
+
+def upsert_project(project_id: str, meta: Dict[str, Any]) -> None:
+    """meta.json 写入后同步索引；失败只记日志，可通过 rebuild 修复"""
+    try:
+        _connect().execute(_UPSERT, _row({**meta, "project_id": project_id}))
+    except sqlite3.Error:
+        log.exception("meta index upsert failed for %s", project_id)
+
+def delete_project(project_id: str) -> None:
+    try:
+        _connect().execute("DELETE FROM projects WHERE project_id = ?", (project_id,))
+    except sqlite3.Error:
+        log.exception("meta index delete failed for %s", project_id)
+
+def recent_projects(limit: int = 40) -> List[Dict[str, Any]]:
+    cur = _connect().execute(
+        "SELECT meta FROM projects ORDER BY created_at DESC LIMIT ?", (int(limit),)
+    )
+    return [json.loads(m) for (m,) in cur]
+
+def featured_projects(limit: int = 40) -> List[Dict[str, Any]]:
+    cur = _connect().execute(
+        "SELECT meta FROM projects WHERE is_featured = 1 ORDER BY created_at DESC LIMIT ?",
+        (int(limit),),
+    )
+    return [json.loads(m) for (m,) in cur]
+
+def projects_created_before(cutoff: str, after: Optional[Tuple[str, str]] = None,
+                            limit: int = 100) -> List[Tuple[str, str, Dict[str, Any]]]:
+    """created_at 早于 cutoff 的项目，按 (created_at, project_id) 升序做 keyset 分批"""
+    if after is None:
+        cur = _connect().execute(
+            "SELECT created_at, project_id, meta FROM projects WHERE created_at < ? "
+            "ORDER BY created_at, project_id LIMIT ?", (cutoff, int(limit)))
+    else:
+        cur = _connect().execute(
+            "SELECT created_at, project_id, meta FROM projects WHERE created_at < ? "
+            "AND (created_at, project_id) > (?, ?) ORDER BY created_at, project_id LIMIT ?",
+            (cutoff, *after, int(limit)))
+    return [(c, pid, json.loads(m)) for c, pid, m in cur]
+
+def recent_job_seconds(limit: int = 20) -> List[float]:
+    """最近完成任务的耗时(秒)，供排队时间估算"""
+    cur = _connect().execute(
+        "SELECT json_extract(meta, '$.job_seconds') AS s FROM projects "
+        "WHERE s IS NOT NULL ORDER BY created_at DESC LIMIT ?", (int(limit),))
+    return [float(s) for (s,) in cur]
+
+def running_jobs(started_after: str) -> int:
+    """started_after 之后开始、仍处于 RUNNING 的任务数(更早的视为 worker 崩溃遗留)"""
+    (n,) = _connect().execute(
+        "SELECT COUNT(*) FROM projects WHERE json_extract(meta, '$.job_status') = 'RUNNING' "
+        "AND json_extract(meta, '$.job_started_at') >= ?", (started_after,)).fetchone()
+    return int(n)
+
+def _read_meta_file(project_id: str) -> Optional[Dict[str, Any]]:
+    p = os.path.join(_projects_base(), project_id, "meta.json")
+    try:
+        with open(p, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def _rebuild(conn: sqlite3.Connection) -> int:
+    base = _projects_base()
+    pids = []
+    if os.path.isdir(base):
+        pids = [e.name for e in os.scandir(base) if e.is_dir()]
+    rows = []
+    for pid in pids:
+        meta = _read_meta_file(pid)
+        if meta is not None:
+            rows.append(_row({**meta, "project_id": pid}))
+    _replace_all(conn, "projects", _UPSERT, rows)
+    return len(rows)
+
+def _replace_all(conn: sqlite3.Connection, table: str, sql: str, rows: List[tuple]) -> None:
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.execute(f"DELETE FROM {table}")
+        conn.executemany(sql, rows)
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+
+def rebuild() -> int:
+    """从 TEMP_DIR/projects/*/meta.json 全量重建索引，返回写入条数"""
+    return _rebuild(_connect())
+
+# ========== 发布索引 ==========
+_UPSERT_PUBLISHED = (
+    "INSERT INTO published(public_id, published_at, meta) VALUES (?, ?, ?) "
+    "ON CONFLICT(public_id) DO UPDATE SET "
+    "published_at=excluded.published_at, meta=excluded.meta"
+)
+
+def _published_row(meta: Dict[str, Any]) -> tuple:
+    return (meta["public_id"], meta.get("published_at") or "", json.dumps(meta, ensure_ascii=False))
+
+def upsert_published(meta: Dict[str, Any]) -> None:
+    try:
+        _connect_published().execute(_UPSERT_PUBLISHED, _published_row(meta))
+    except sqlite3.Error:
+        log.exception("published index upsert failed for %s", meta.get("public_id"))
+
+def delete_published(public_id: str) -> None:
+    try:
+        _connect_published().execute("DELETE FROM published WHERE public_id = ?", (public_id,))
+    except sqlite3.Error:
+        log.exception("published index delete failed for %s", public_id)
+
+def encode_cursor(published_at: str, public_id: str) -> str:
+    raw = json.dumps([published_at, public_id], separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+def decode_cursor(cursor: str) -> Tuple[str, str]:
+    """游标对客户端不透明；格式不对统一抛 ValueError"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        published_at, public_id = json.loads(raw)
+    except Exception as e:
+        raise ValueError("invalid cursor") from e
+    if not isinstance(published_at, str) or not isinstance(public_id, str):
+        raise ValueError("invalid cursor")
+    return published_at, public_id
+
+def published_page(limit: int,
+                   cursor: Optional[str] = None) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """按 (published_at, public_id) 倒序做 keyset 分页，返回 (items, next_cursor)"""
+    conn = _connect_published()
+    if cursor:
+        after = decode_cursor(cursor)
+        cur = conn.execute(
+            "SELECT published_at, public_id, meta FROM published "
+            "WHERE (published_at, public_id) < (?, ?) "
+            "ORDER BY published_at DESC, public_id DESC LIMIT ?",
+            (*after, int(limit) + 1),
+        )
+    else:
+        cur = conn.execute(
+            "SELECT published_at, public_id, meta FROM published "
+            "ORDER BY published_at DESC, public_id DESC LIMIT ?",
+            (int(limit) + 1,),
+        )
+    rows = cur.fetchall()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1][0], rows[-1][1])
+    return [json.loads(m) for (_, _, m) in rows], next_cursor
+
+def published_before(cutoff: str, after: Optional[Tuple[str, str]] = None,
+                     limit: int = 100) -> List[Tuple[str, str, Dict[str, Any]]]:
+    """published_at 早于 cutoff 的条目，按 (published_at, public_id) 升序做 keyset 分批"""
+    if after is None:
+        cur = _connect_published().execute(
+            "SELECT published_at, public_id, meta FROM published WHERE published_at < ? "
+            "ORDER BY published_at, public_id LIMIT ?", (cutoff, int(limit)))
+    else:
+        cur = _connect_published().execute(
+            "SELECT published_at, public_id, meta FROM published WHERE published_at < ? "
+            "AND (published_at, public_id) > (?, ?) ORDER BY published_at, public_id LIMIT ?",
+            (cutoff, *after, int(limit)))
+    return [(p, pid, json.loads(m)) for p, pid, m in cur]
+
+def all_published() -> List[Dict[str, Any]]:
+    cur = _connect_published().execute(
+        "SELECT meta FROM published ORDER BY published_at DESC, public_id DESC"
+    )
+    return [json.loads(m) for (m,) in cur]
+
+def _rebuild_published(conn: sqlite3.Connection) -> int:
+    base = settings.PUBLISH_DIR
+    rows = []
+    if os.path.isdir(base):
+        for e in os.scandir(base):
+            if not e.is_dir():
+                continue
+            try:
+                with open(os.path.join(e.path, "meta.json"), encoding="utf-8") as f:
+                    meta = json.load(f)
+            except (OSError, ValueError):
+                continue
+            rows.append(_published_row({**meta, "public_id": meta.get("public_id") or e.name}))
+    _replace_all(conn, "published", _UPSERT_PUBLISHED, rows)
+    return len(rows)
+
+def rebuild_published() -> int:
+    """从 PUBLISH_DIR/*/meta.json 全量重建发布索引"""
+    return _rebuild_published(_connect_published())
+
+if __name__ == "__main__":
+    # 用法: python -m app.core.meta_index rebuild
+    if sys.argv[1:] != ["rebuild"]:
+        print("usage: python -m app.core.meta_index rebuild", file=sys.stderr)
+        sys.exit(2)
+    n = rebuild()
+    print(f"indexed {n} projects into {index_path()}")
+    n = rebuild_published()
+    print(f"indexed {n} published items into {published_index_path()}")
@@ -0,0 +1,166 @@
+import os
+import shutil
+import threading
+import time
+from typing import Dict, Iterable, Set, Tuple
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from prometheus_client.core import GaugeMetricFamily
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.core.config import settings
+
+# Prometheus 指标：API 与 worker 共用同一组定义
+# 设置 PROMETHEUS_MULTIPROC_DIR 时各进程(uvicorn 多 worker、celery prefork 子进程)写共享目录，
+# /metrics 汇总该目录；API 与 worker 挂同一个卷即可在一处抓取全部指标
+
+if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+    # 无标签指标在定义时就会创建 mmap 文件，目录需先存在
+    os.makedirs(os.environ["PROMETHEUS_MULTIPROC_DIR"], exist_ok=True)
+
+_STAGE_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+REQUEST_SECONDS = Histogram(
+    "hachimi_http_request_seconds", "HTTP 请求耗时", ["method", "route", "status"])
+UPLOAD_BYTES = Counter("hachimi_upload_bytes_total", "上传落盘字节数", ["stage"])
+UPLOAD_SECONDS = Histogram(
+    "hachimi_upload_seconds", "单个上传的接收+落盘耗时", ["stage"], buckets=_STAGE_BUCKETS)
+STAGE_SECONDS = Histogram(
+    "hachimi_stage_seconds", "流水线阶段耗时", ["stage"], buckets=_STAGE_BUCKETS)
+JOB_SECONDS = Histogram(
+    "hachimi_job_seconds", "整条流水线耗时", ["status"], buckets=_STAGE_BUCKETS)
+QUEUE_WAIT_SECONDS = Histogram(
+    "hachimi_queue_wait_seconds", "任务从入队到开始执行的等待时间", buckets=_STAGE_BUCKETS)
+STAGE_CACHE = Counter("hachimi_stage_cache_total", "阶段缓存事件", ["result"])  # hit/miss/eviction
+# result: hit/encoded/fallback/failed/eviction
+TRANSCODE = Counter("hachimi_transcode_total", "压缩副本请求", ["format", "result"])
+TRANSCODE_SECONDS = Histogram(
+    "hachimi_transcode_seconds", "单次编码耗时", ["format"], buckets=_STAGE_BUCKETS)
+SWEEP_DELETED = Counter(
+    "hachimi_sweep_deleted_total", "过期清理删除的条目数", ["kind"])  # project/published
+SWEEP_RECLAIMED_BYTES = Counter(
+    "hachimi_sweep_reclaimed_bytes_total", "过期清理回收的字节数", ["kind"])
+LYRICS_MODEL_LOAD_SECONDS = Histogram(
+    "hachimi_lyrics_model_load_seconds", "填词模型加载+校验耗时(每进程一次)",
+    buckets=_STAGE_BUCKETS)
+LYRICS_BATCH_SECONDS = Histogram(
+    "hachimi_lyrics_batch_seconds", "填词单批推理耗时",
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1))
+LYRICS_BATCH_ROWS = Histogram(
+    "hachimi_lyrics_batch_rows", "填词单批行数", buckets=(1, 8, 32, 64, 128, 256, 512, 1024, 4096))
+
+def observe_stage_timings(timings: Dict[str, float]) -> None:
+    for stage, seconds in timings.items():
+        STAGE_SECONDS.labels(stage).observe(seconds)
+
+# ========== 磁盘占用：抓取时计算，遍历结果缓存一段时间 ==========
+_DISK_TTL = 60.0
+
+def _tree_bytes(root: str, seen: Set[Tuple[int, int]]) -> int:
+    """按 (st_dev, st_ino) 去重累加文件大小；发布目录与项目目录之间的硬链接只计一次"""
+    total = 0
+    for dirpath, _, filenames in os.walk(root):
+        for fn in filenames:
+            try:
+                st = os.lstat(os.path.join(dirpath, fn))
+            except OSError:
+                continue
+            key = (st.st_dev, st.st_ino)
+            if key not in seen:
+                seen.add(key)
+                total += st.st_size
+    return total
+
+class DiskCollector:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._cached: Tuple[float, Dict[str, Tuple[int, int]]] = (0.0, {})
+        self._refreshing = False
+
+    def _dirs(self) -> Dict[str, str]:
+        return {"temp": settings.TEMP_DIR, "publish": settings.PUBLISH_DIR}
+
+    def _measure(self) -> Dict[str, Tuple[int, int]]:
+        # 遍历在锁外进行，同一时刻只有一个抓取在遍历，其余直接返回上一次的结果
+        with self._lock:
+            at, data = self._cached
+            if self._refreshing or (data and time.monotonic() - at < _DISK_TTL):
+                return data
+            self._refreshing = True
+        try:
+            data = {}
+            seen: Set[Tuple[int, int]] = set()  # 跨目录的硬链接只计入先遍历的 temp
+            for name, path in self._dirs().items():
+                if os.path.isdir(path):
+                    data[name] = (_tree_bytes(path, seen), shutil.disk_usage(path).free)
+            with self._lock:
+                self._cached = (time.monotonic(), data)
+        finally:
+            with self._lock:
+                self._refreshing = False
+        return data
+
+    def collect(self) -> Iterable[GaugeMetricFamily]:
+        used = GaugeMetricFamily("hachimi_dir_used_bytes", "目录内文件总字节数", labels=["dir"])
+        free = GaugeMetricFamily("hachimi_dir_free_bytes", "目录所在文件系统剩余字节数",
+                                 labels=["dir"])
+        for name, (u, f) in self._measure().items():
+            used.add_metric([name], u)
+            free.add_metric([name], f)
+        yield used
+        yield free
+
+_disk_collector = DiskCollector()
+
+def multiprocess_enabled() -> bool:
+    return bool(os.environ.get("PROMETHEUS_MULTIPROC_DIR"))
+
+if not multiprocess_enabled():
+    REGISTRY.register(_disk_collector)
+
+def render() -> Tuple[bytes, str]:
+    """/metrics 的响应体与 Content-Type"""
+    registry = REGISTRY
+    if multiprocess_enabled():
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        registry.register(_disk_collector)
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+def mark_process_dead(pid: int) -> None:
+    if multiprocess_enabled():
+        multiprocess.mark_process_dead(pid)
+
+class MetricsMiddleware:
+    """按路由模板(而不是原始路径)记录请求耗时，避免 project_id 等造成标签爆炸"""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        status = 500
+        t0 = time.perf_counter()
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            REQUEST_SECONDS.labels(
+                scope["method"], getattr(route, "path", "unmatched"), str(status),
+            ).observe(time.perf_counter() - t0)
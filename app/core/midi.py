@@ -0,0 +1,270 @@
+import os
+import struct
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+
+from app.core import audio_io
+
+# MIDI 量化：SMF 解析成列式数组(起始/时长秒、音高、力度)，按 BPM 的 16 分音符网格
+# 批量吸附、过滤异常时长、折叠到人声音域、消除重叠(单声部)，再整块编码写回 SMF。
+# 除逐字节解析事件流外全部是 NumPy 向量运算。
+
+QUANTIZED_NAME = "quantized.mid"
+PPQ = 480                  # 写出的 quantized.mid 每四分音符 tick 数
+GRID_DIVISION = 4          # 每拍 4 格 = 16 分音符
+VOCAL_RANGE = (48, 84)     # C3 - C6
+MIN_NOTE_SECONDS = 0.05    # 更短的视为误触/检测噪声
+MAX_NOTE_BEATS = 8.0       # 更长的截断到该拍数
+
+class Notes:
+    """列式音符表；各数组等长，按 onset 排序与否由产生方决定"""
+    __slots__ = ("onset", "duration", "pitch", "velocity")
+
+    def __init__(self, onset: np.ndarray, duration: np.ndarray, pitch: np.ndarray,
+                 velocity: np.ndarray):
+        self.onset = np.asarray(onset, dtype=np.float64)
+        self.duration = np.asarray(duration, dtype=np.float64)
+        self.pitch = np.asarray(pitch, dtype=np.int16)
+        self.velocity = np.asarray(velocity, dtype=np.uint8)
+
+    def __len__(self) -> int:
+        return len(self.onset)
+
+    def take(self, idx) -> "Notes":
+        return Notes(self.onset[idx], self.duration[idx], self.pitch[idx], self.velocity[idx])
+
+    @classmethod
+    def empty(cls) -> "Notes":
+        return cls(np.zeros(0), np.zeros(0), np.zeros(0), np.zeros(0))
+
+# ========== 解析 ==========
+def _read_vlq(d: bytes, i: int) -> Tuple[int, int]:
+    b = d[i]
+    i += 1
+    v = b & 0x7F
+    while b & 0x80:
+        b = d[i]
+        i += 1
+        v = (v << 7) | (b & 0x7F)
+    return v, i
+
+def _parse_track(d: bytes, i: int, end: int, out: List[list],
+                 tempos: List[Tuple[int, int]]) -> None:
+    on_t, off_t, pitches, vels = out
+    tick = 0
+    running = 0
+    # (通道, 音高) -> 未结束的 [(起始 tick, 力度)]，同音重叠按先进先出配对
+    held: Dict[int, list] = {}
+    while i < end:
+        b = d[i]
+        i += 1
+        delta = b & 0x7F
+        while b & 0x80:
+            b = d[i]
+            i += 1
+            delta = (delta << 7) | (b & 0x7F)
+        tick += delta
+        status = d[i]
+        if status & 0x80:
+            i += 1
+            if status < 0xF0:
+                running = status
+        else:
+            if not running:
+                raise ValueError("data byte without running status")
+            status = running
+        kind = status & 0xF0
+        if kind == 0x90 or kind == 0x80:
+            pitch, vel = d[i], d[i + 1]
+            i += 2
+            key = ((status & 0x0F) << 7) | pitch
+            if kind == 0x90 and vel:
+                stack = held.get(key)
+                if stack is None:
+                    held[key] = [(tick, vel)]
+                else:
+                    stack.append((tick, vel))
+            else:
+                stack = held.get(key)
+                if stack:
+                    t0, v0 = stack.pop(0)
+                    on_t.append(t0)
+                    off_t.append(tick)
+                    pitches.append(pitch)
+                    vels.append(v0)
+        elif status == 0xFF:
+            mtype = d[i]
+            n, i = _read_vlq(d, i + 1)
+            if mtype == 0x51 and n == 3:
+                tempos.append((tick, (d[i] << 16) | (d[i + 1] << 8) | d[i + 2]))
+            elif mtype == 0x2F:
+                break
+            i += n
+        elif status == 0xF0 or status == 0xF7:
+            n, i = _read_vlq(d, i)
+            i += n
+        elif kind == 0xC0 or kind == 0xD0:
+            i += 1
+        elif status < 0xF0:
+            i += 2
+        else:
+            raise ValueError(f"unsupported status byte 0x{status:02x}")
+    # 没有 note-off 的音符延续到轨道结束
+    for key, stack in held.items():
+        for t0, v0 in stack:
+            on_t.append(t0)
+            off_t.append(tick)
+            pitches.append(key & 0x7F)
+            vels.append(v0)
+
+def _ticks_to_seconds(ticks: np.ndarray, division: int,
+                      tempos: List[Tuple[int, int]]) -> np.ndarray:
+    """按速度表把 tick 换算成秒(分段线性)，默认 120BPM"""
+    tempos = sorted(tempos)
+    if not tempos or tempos[0][0] > 0:
+        tempos.insert(0, (0, 500000))
+    t_ticks = np.array([t for t, _ in tempos], dtype=np.float64)
+    spt = np.array([us for _, us in tempos], dtype=np.float64) / 1e6 / division  # 每 tick 秒数
+    seg_start = np.concatenate([[0.0], np.cumsum(np.diff(t_ticks) * spt[:-1])])
+    seg = np.searchsorted(t_ticks, ticks, side="right") - 1
+    return seg_start[seg] + (ticks - t_ticks[seg]) * spt[seg]
+
+def parse(data: bytes) -> Notes:
+    """解析 SMF(格式 0/1)；头不合法或事件流损坏抛 ValueError"""
+    if len(data) < 14 or data[:4] != b"MThd":
+        raise ValueError("not a standard MIDI file")
+    (hlen,) = struct.unpack(">I", data[4:8])
+    _, _, division = struct.unpack(">HHH", data[8:14])
+    if division & 0x8000:
+        raise ValueError("SMPTE time division is not supported")
+    if division == 0:
+        raise ValueError("invalid time division")
+    cols: List[list] = [[], [], [], []]
+    tempos: List[Tuple[int, int]] = []
+    pos = 8 + hlen
+    while pos + 8 <= len(data):
+        cid, clen = data[pos:pos + 4], struct.unpack(">I", data[pos + 4:pos + 8])[0]
+        start, end = pos + 8, min(pos + 8 + clen, len(data))
+        if cid == b"MTrk":
+            try:
+                _parse_track(data, start, end, cols, tempos)
+            except IndexError:
+                raise ValueError("truncated MIDI track")
+        pos = start + clen
+    if not cols[0]:
+        return Notes.empty()
+    on_t = np.array(cols[0], dtype=np.float64)
+    off_t = np.array(cols[1], dtype=np.float64)
+    onset = _ticks_to_seconds(on_t, division, tempos)
+    end_s = _ticks_to_seconds(off_t, division, tempos)
+    order = np.argsort(onset, kind="stable")
+    notes = Notes(onset, end_s - onset, np.array(cols[2]), np.array(cols[3]))
+    return notes.take(order)
+
+def read(path: str) -> Notes:
+    with open(path, "rb") as f:
+        return parse(f.read())
+
+# ========== 量化与清理 ==========
+def fold_to_range(pitch: np.ndarray, low: int, high: int) -> np.ndarray:
+    """超出音域的音按整八度移入；音域不足一个八度时只能截断"""
+    p = pitch.astype(np.int32)
+    if high - low >= 11:
+        p = np.where(p < low, p + 12 * -(-(low - p) // 12), p)
+        p = np.where(p > high, p - 12 * -(-(p - high) // 12), p)
+    return np.clip(p, low, high)
+
+def quantize(notes: Notes, bpm: float, division: int = GRID_DIVISION,
+             min_seconds: float = MIN_NOTE_SECONDS, max_beats: float = MAX_NOTE_BEATS,
+             vocal_range: Tuple[int, int] = VOCAL_RANGE) -> Tuple[Notes, Dict[str, int]]:
+    """吸附到 bpm 网格并整理成单声部旋律，返回 (音符, 各步骤处理数量)"""
+    step = 60.0 / bpm / division
+    stats = {"input": len(notes), "dropped_short": 0, "clamped_long": 0, "transposed": 0,
+             "dropped_overlap": 0, "trimmed_overlap": 0, "output": 0}
+    keep = notes.duration >= min_seconds
+    stats["dropped_short"] = int(len(notes) - np.count_nonzero(keep))
+    notes = notes.take(keep)
+    if not len(notes):
+        return notes, stats
+
+    start = np.rint(notes.onset / step).astype(np.int64)
+    end = np.rint((notes.onset + notes.duration) / step).astype(np.int64)
+    max_cells = int(round(max_beats * division))
+    length = np.clip(end - start, 1, None)
+    stats["clamped_long"] = int(np.count_nonzero(length > max_cells))
+    length = np.minimum(length, max_cells)
+
+    pitch = fold_to_range(notes.pitch, *vocal_range)
+    stats["transposed"] = int(np.count_nonzero(pitch != notes.pitch))
+
+    # 同一格起始的音只留一个(力度大者优先，其次音高)，再把每个音截到下一个音开始
+    order = np.lexsort((-pitch, -notes.velocity.astype(np.int32), start))
+    start, length, pitch, vel = start[order], length[order], pitch[order], notes.velocity[order]
+    first = np.ones(len(start), dtype=bool)
+    first[1:] = start[1:] != start[:-1]
+    stats["dropped_overlap"] = int(len(start) - np.count_nonzero(first))
+    start, length, pitch, vel = start[first], length[first], pitch[first], vel[first]
+    end = start + length
+    nxt = np.append(start[1:], np.iinfo(np.int64).max)
+    trimmed = end > nxt
+    stats["trimmed_overlap"] = int(np.count_nonzero(trimmed))
+    end = np.minimum(end, nxt)
+
+    stats["output"] = len(start)
+    return Notes(start * step, (end - start) * step, pitch, vel), stats
+
+# ========== 写出 ==========
+def _vlq_lengths(v: np.ndarray) -> np.ndarray:
+    return 1 + (v >= 1 << 7).astype(np.int64) + (v >= 1 << 14) + (v >= 1 << 21)
+
+def _encode_events(ticks: np.ndarray, status: np.ndarray, data1: np.ndarray,
+                   data2: np.ndarray) -> bytes:
+    """按 tick 排好序的三字节通道事件整块编码为 [delta VLQ][status][d1][d2]"""
+    delta = np.diff(ticks, prepend=0)
+    nb = _vlq_lengths(delta)
+    size = nb + 3
+    offsets = np.cumsum(size) - size
+    out = np.zeros(int(size.sum()), dtype=np.uint8)
+    for k in range(4):
+        m = nb > k
+        shift = 7 * (nb[m] - 1 - k)
+        cont = np.where(k < nb[m] - 1, 0x80, 0)
+        out[offsets[m] + k] = ((delta[m] >> shift) & 0x7F) | cont
+    base = offsets + nb
+    out[base] = status
+    out[base + 1] = data1
+    out[base + 2] = data2
+    return out.tobytes()
+
+def encode(notes: Notes, bpm: float, ppq: int = PPQ, channel: int = 0) -> bytes:
+    """单轨(格式 0) SMF：速度事件 + 音符；同一 tick 上先关后开"""
+    tpq_s = bpm / 60.0 * ppq
+    on = np.rint(notes.onset * tpq_s).astype(np.int64)
+    off = np.maximum(np.rint((notes.onset + notes.duration) * tpq_s).astype(np.int64), on + 1)
+    n = len(notes)
+    ticks = np.concatenate([off, on])
+    is_on = np.concatenate([np.zeros(n, np.int8), np.ones(n, np.int8)])
+    order = np.lexsort((is_on, ticks))
+    pitch = np.concatenate([notes.pitch, notes.pitch]).astype(np.uint8)[order]
+    vel = np.concatenate([np.full(n, 64), np.maximum(notes.velocity, 1)]).astype(np.uint8)[order]
+    status = np.where(is_on[order] == 1, 0x90 | channel, 0x80 | channel).astype(np.uint8)
+    body = _encode_events(ticks[order], status, pitch, vel)
+    tempo = int(round(60e6 / bpm))
+    track = (b"\x00\xff\x51\x03" + tempo.to_bytes(3, "big") + body + b"\x00\xff\x2f\x00")
+    return (b"MThd" + struct.pack(">IHHH", 6, 0, 1, ppq)
+            + b"MTrk" + struct.pack(">I", len(track)) + track)
+
+def write(path: str, notes: Notes, bpm: float, ppq: int = PPQ) -> None:
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with audio_io.atomic_open(path) as f:
+        f.write(encode(notes, bpm, ppq))
+
+def quantize_file(src: str, dst: str, bpm: float, **kwargs: Any) -> Dict[str, Any]:
+    """读 src、量化、写 dst，返回统计；解析失败抛 ValueError"""
+    notes, stats = quantize(read(src), bpm, **kwargs)
+    write(dst, notes, bpm)
+    if len(notes):
+        stats["pitch_range"] = [int(notes.pitch.min()), int(notes.pitch.max())]
+        stats["duration"] = round(float((notes.onset + notes.duration).max()), 3)
+    return {"bpm": bpm, **stats}
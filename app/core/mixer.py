@@ -0,0 +1,220 @@
+from contextlib import ExitStack
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from app.core import audio_io
+
+# 流式混音：各分轨经 memmap 按块读取，统一采样率/声道后加增益、限幅，
+# 一次遍历同时写出 vocal / fullmix / 预览片段。每路只缓存一两个块，峰值内存与曲长无关。
+
+def db_to_gain(db: float) -> float:
+    return 10 ** (db / 20)
+
+def _conform(block: np.ndarray, channels: int) -> np.ndarray:
+    """声道数对齐：单声道复制到各声道，多声道下混取平均"""
+    if block.shape[1] == channels:
+        return block
+    if block.shape[1] == 1:
+        return np.repeat(block, channels, axis=1)
+    mono = block.mean(axis=1, keepdims=True, dtype=np.float32)
+    return mono if channels == 1 else np.repeat(mono, channels, axis=1)
+
+class _Resampler:
+    """流式线性插值重采样；输出第 j 帧取输入位置 j*sr_in/sr_out，与分块方式无关"""
+
+    def __init__(self, sr_in: int, sr_out: int, frames_in: int, channels: int):
+        self.sr_in, self.sr_out = sr_in, sr_out
+        self.total_out = -(-frames_in * sr_out // sr_in)
+        self.done = 0                 # 已输出帧数
+        self.base = 0                 # self._tail 第 0 帧对应的输入帧号
+        self._tail = np.zeros((0, channels), np.float32)
+
+    def _emit(self, buf: np.ndarray, n: int) -> np.ndarray:
+        t = np.arange(self.done, self.done + n, dtype=np.float64)
+        t = t * self.sr_in / self.sr_out - self.base
+        idx = np.floor(t).astype(np.int64)
+        frac = (t - idx).astype(np.float32)[:, None]
+        nxt = np.minimum(idx + 1, len(buf) - 1)
+        self.done += n
+        return buf[idx] * (1 - frac) + buf[nxt] * frac
+
+    def process(self, block: np.ndarray) -> np.ndarray:
+        buf = np.concatenate([self._tail, block])
+        # 只输出右邻帧已到达的位置
+        limit = (self.base + len(buf) - 1) * self.sr_out
+        n = min(-(-limit // self.sr_in), self.total_out) - self.done
+        out = self._emit(buf, max(n, 0))
+        self.base += len(buf) - 1
+        self._tail = buf[-1:]
+        return out
+
+    def flush(self) -> np.ndarray:
+        if self.done >= self.total_out or not len(self._tail):
+            return self._tail[:0]
+        return self._emit(self._tail, self.total_out - self.done)
+
+class _StemReader:
+    """按输出时间轴取 n 帧；超出分轨长度的部分补零"""
+
+    def __init__(self, path: str, sr: int, channels: int, block_frames: int):
+        self.mm, self.info = audio_io.memmap_wav(path)
+        self.channels = channels
+        self.block_frames = block_frames
+        self.pos = 0
+        self.rs = None
+        if self.info.sr != sr:
+            self.rs = _Resampler(self.info.sr, sr, self.info.frames, channels)
+        self.frames = self.rs.total_out if self.rs else self.info.frames
+        self._pending = np.zeros((0, channels), np.float32)
+
+    def read(self, n: int) -> np.ndarray:
+        parts, have = [self._pending], len(self._pending)
+        while have < n and self.pos < self.info.frames:
+            raw = self.mm[self.pos:self.pos + self.block_frames]
+            self.pos += len(raw)
+            block = _conform(audio_io.to_float32(raw, self.info.sample_format), self.channels)
+            if self.rs:
+                block = self.rs.process(block)
+                if self.pos >= self.info.frames:
+                    block = np.concatenate([block, self.rs.flush()])
+            parts.append(block)
+            have += len(block)
+        buf = np.concatenate(parts) if len(parts) > 1 else parts[0]
+        if len(buf) < n:
+            buf = np.concatenate([buf, np.zeros((n - len(buf), self.channels), np.float32)])
+        self._pending = buf[n:]
+        return buf[:n]
+
+class Limiter:
+    """前瞻峰值限幅：每 step 帧一个子块，子块所需增益做 ±hold 子块的滑动最小值，
+    子块边界之间线性插值。插值端点不超过本子块所需增益，因此输出不会过冲；
+    输出相对输入延迟 (hold+1) 个子块，由 process/flush 内部缓存，调用方只看到连续的帧流。"""
+
+    def __init__(self, ceiling: float, channels: int, step: int = 64, hold: int = 8):
+        self.ceiling = ceiling
+        self.step, self.hold = step, hold
+        self._buf = np.zeros((0, channels), np.float32)
+        self._rhist = np.ones(hold + 1)
+        self.limited_blocks = 0
+
+    def _required(self, buf: np.ndarray, n_sub: int) -> np.ndarray:
+        peak = np.zeros(n_sub, np.float32)
+        full = len(buf) // self.step
+        if full:
+            peak[:full] = np.abs(buf[:full * self.step].reshape(full, -1)).max(axis=1)
+        if n_sub > full:
+            peak[full] = np.abs(buf[full * self.step:]).max(initial=0.0)
+        return np.minimum(1.0, self.ceiling / np.maximum(peak, 1e-12))
+
+    def _run(self, final: bool) -> np.ndarray:
+        h, step = self.hold, self.step
+        n_sub = -(-len(self._buf) // step) if final else len(self._buf) // step
+        r = self._required(self._buf, n_sub)
+        if final:
+            r = np.concatenate([r, np.ones(h + 2)])
+        rr = np.concatenate([self._rhist, r])           # rr[i] 对应子块 i-(h+1)
+        n_emit = n_sub if final else len(r) - h - 1
+        if n_emit <= 0:
+            return self._buf[:0]
+        w = np.lib.stride_tricks.sliding_window_view(rr, 2 * h + 1).min(axis=1)  # w[j] 对应子块 j-1
+        b = np.minimum(w[:n_emit + 1], w[1:n_emit + 2])  # 子块 k 起点增益
+        ramp = np.arange(step, dtype=np.float32) / step
+        gain = (b[:-1, None] + (b[1:] - b[:-1])[:, None] * ramp).reshape(-1).astype(np.float32)
+        self.limited_blocks += int(np.count_nonzero(b[:-1] < 1.0))
+        n = min(n_emit * step, len(self._buf))
+        out = np.clip(self._buf[:n] * gain[:n, None], -self.ceiling, self.ceiling)
+        self._buf = self._buf[n:]
+        self._rhist = rr[n_emit:n_emit + h + 1]
+        return out
+
+    def process(self, block: np.ndarray) -> np.ndarray:
+        self._buf = np.concatenate([self._buf, block])
+        return self._run(final=False)
+
+    def flush(self) -> np.ndarray:
+        return self._run(final=True)
+
+class _PreviewWindow:
+    """从完整混音流里截取 [start, start+n) 并做淡入淡出"""
+
+    def __init__(self, writer: audio_io.WavWriter, start: int, n: int, fade: int):
+        self.writer, self.start, self.end = writer, start, start + n
+        self.fade = max(1, min(fade, n // 2))
+        self.pos = 0
+
+    def write(self, block: np.ndarray) -> None:
+        lo, hi = max(self.start, self.pos), min(self.end, self.pos + len(block))
+        if lo < hi:
+            idx = np.arange(lo, hi)
+            env = np.minimum(1.0, np.minimum(idx - self.start + 1, self.end - idx) / self.fade)
+            self.writer.write(block[lo - self.pos:hi - self.pos] * env[:, None].astype(np.float32))
+        self.pos += len(block)
+
+def _preview_range(total: int, sr: int, start_s: float, seconds: float):
+    n = min(total, int(seconds * sr))
+    start = max(0, min(int(start_s * sr), total - n))
+    return start, n
+
+def render_stem(src: str, dst: str, *, sr: int = 44100, channels: int = 2, gain_db: float = 0.0,
+                sample_format: str = "float32",
+                block_frames: int = audio_io.BLOCK_FRAMES) -> Dict[str, Any]:
+    """单路分轨统一到混音采样率/声道并乘增益后写出；默认 float32，混音时不引入额外量化"""
+    stem = _StemReader(src, sr, channels, block_frames)
+    gain = db_to_gain(gain_db)
+    with audio_io.WavWriter(dst, sr, channels, sample_format) as w:
+        for pos in range(0, stem.frames, block_frames):
+            w.write(stem.read(min(block_frames, stem.frames - pos)) * gain)
+    return {"frames": stem.frames, "sr": sr, "channels": channels}
+
+def mix_stems(vocal_path: str, accomp_path: Optional[str], vocal_out: str, full_out: str,
+              preview_out: Optional[str] = None, *, sr: int = 44100, channels: int = 2,
+              vocal_gain_db: float = 0.0, accomp_gain_db: float = 0.0, ceiling_dbfs: float = -1.0,
+              preview_start: float = 0.0, preview_seconds: float = 30.0, preview_fade: float = 0.05,
+              sample_format: str = "pcm16",
+              block_frames: int = audio_io.BLOCK_FRAMES) -> Dict[str, Any]:
+    """混合人声与伴奏分轨并写出 vocal/fullmix/预览，返回长度与限幅统计"""
+    vocal = _StemReader(vocal_path, sr, channels, block_frames)
+    stems: List[_StemReader] = [vocal]
+    gains = [db_to_gain(vocal_gain_db)]
+    if accomp_path:
+        stems.append(_StemReader(accomp_path, sr, channels, block_frames))
+        gains.append(db_to_gain(accomp_gain_db))
+    total = max(s.frames for s in stems)
+    ceiling = db_to_gain(ceiling_dbfs)
+    vlim, flim = Limiter(ceiling, channels), Limiter(ceiling, channels)
+    p_start, p_len = _preview_range(total, sr, preview_start, preview_seconds)
+
+    with ExitStack() as stack:
+        vw = stack.enter_context(audio_io.WavWriter(vocal_out, sr, channels, sample_format))
+        fw = stack.enter_context(audio_io.WavWriter(full_out, sr, channels, sample_format))
+        preview = None
+        if preview_out:
+            pw = stack.enter_context(audio_io.WavWriter(preview_out, sr, channels, sample_format))
+            preview = _PreviewWindow(pw, p_start, p_len, int(preview_fade * sr))
+
+        def emit_full(block: np.ndarray) -> None:
+            fw.write(block)
+            if preview:
+                preview.write(block)
+
+        for pos in range(0, total, block_frames):
+            n = min(block_frames, total - pos)
+            voc = vocal.read(n) * gains[0]
+            mix = voc.copy()
+            for stem, g in zip(stems[1:], gains[1:]):
+                mix += stem.read(n) * g
+            vw.write(vlim.process(voc))
+            emit_full(flim.process(mix))
+        vw.write(vlim.flush())
+        emit_full(flim.flush())
+
+    return {
+        "frames": total,
+        "sr": sr,
+        "channels": channels,
+        "duration": round(total / sr, 3),
+        "preview": ({"start": round(p_start / sr, 3), "seconds": round(p_len / sr, 3)}
+                    if preview_out else None),
+        "limited_ms": round(flim.limited_blocks * flim.step / sr * 1000, 1),
+    }
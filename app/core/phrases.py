@@ -0,0 +1,153 @@
+import json
+import os
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+
+from app.core import audio_io, midi
+
+# 乐句分析：量化后的音符 → 乐句划分 + 每句特征矩阵，全程按数组一次算完
+# 断句：休止间隔 ≥ rest_beats 拍断开；同一句超过 max_bars 小节时按小节周期强制断开
+# 输出 lyrics/phrases.json(人可读，含每句音符与特征) 与 lyrics/features.npy(float32，可直接 mmap)
+
+PHRASES_NAME = "phrases.json"
+FEATURES_NAME = "features.npy"
+FORMAT_VERSION = 1
+
+# features.npy 的列顺序；时间类特征单位为拍
+FEATURES = (
+    "note_count", "duration_beats", "mean_note_beats", "std_note_beats",
+    "pitch_min", "pitch_max", "pitch_range", "start_pitch", "end_pitch",
+    "pitch_change_rate", "contour_slope", "offbeat_ratio",
+    "position", "gap_before_beats", "after_rest",
+)
+_COL = {name: i for i, name in enumerate(FEATURES)}
+
+def segment(on: np.ndarray, end: np.ndarray, rest_beats: float, max_bars: int,
+            beats_per_bar: int) -> Tuple[np.ndarray, np.ndarray]:
+    """on/end 为按起点排序的拍位置；返回 (每句首音下标, 每句是否因休止断开)"""
+    n = len(on)
+    rest = np.ones(n, dtype=bool)
+    rest[1:] = on[1:] - end[:-1] >= rest_beats
+    seg_first = np.flatnonzero(rest)[np.cumsum(rest) - 1]
+    window = np.floor((on - on[seg_first]) / (max_bars * beats_per_bar)).astype(np.int64)
+    boundary = rest.copy()
+    boundary[1:] |= window[1:] != window[:-1]
+    starts = np.flatnonzero(boundary)
+    return starts, rest[starts]
+
+def extract(on: np.ndarray, dur: np.ndarray, pitch: np.ndarray, starts: np.ndarray,
+            after_rest: np.ndarray) -> np.ndarray:
+    """按句聚合成 (句数, len(FEATURES)) 的 float32 矩阵"""
+    n, m = len(on), len(starts)
+    count = np.diff(np.append(starts, n))
+    last = starts + count - 1
+    ids = np.repeat(np.arange(m), count)
+    end = on + dur
+    p = pitch.astype(np.float64)
+    f = np.zeros((m, len(FEATURES)), dtype=np.float64)
+
+    f[:, _COL["note_count"]] = count
+    f[:, _COL["duration_beats"]] = end[last] - on[starts]
+    mean = np.add.reduceat(dur, starts) / count
+    f[:, _COL["mean_note_beats"]] = mean
+    var = np.add.reduceat(dur * dur, starts) / count - mean * mean
+    f[:, _COL["std_note_beats"]] = np.sqrt(np.clip(var, 0, None))
+    f[:, _COL["pitch_min"]] = np.minimum.reduceat(p, starts)
+    f[:, _COL["pitch_max"]] = np.maximum.reduceat(p, starts)
+    f[:, _COL["pitch_range"]] = f[:, _COL["pitch_max"]] - f[:, _COL["pitch_min"]]
+    f[:, _COL["start_pitch"]] = p[starts]
+    f[:, _COL["end_pitch"]] = p[last]
+
+    same = ids[1:] == ids[:-1]
+    step = np.abs(np.diff(p))
+    moved = np.bincount(ids[1:][same], weights=step[same], minlength=m)
+    f[:, _COL["pitch_change_rate"]] = moved / np.maximum(count - 1, 1)
+
+    # 句内音高对起拍位置的最小二乘斜率(半音/拍)
+    x = on - on[starts][ids]
+    sx, sy = np.add.reduceat(x, starts), np.add.reduceat(p, starts)
+    sxx, sxy = np.add.reduceat(x * x, starts), np.add.reduceat(x * p, starts)
+    den = sxx - sx * sx / count
+    f[:, _COL["contour_slope"]] = np.divide(sxy - sx * sy / count, den, out=np.zeros(m),
+                                            where=den > 1e-9)
+
+    offbeat = np.abs(on - np.rint(on)) > 1e-6
+    f[:, _COL["offbeat_ratio"]] = np.add.reduceat(offbeat.astype(np.float64), starts) / count
+    f[:, _COL["position"]] = np.arange(m) / max(m - 1, 1)
+    prev_end = np.concatenate([[0.0], end[last[:-1]]])
+    f[:, _COL["gap_before_beats"]] = on[starts] - prev_end
+    f[:, _COL["after_rest"]] = after_rest
+    return f.astype(np.float32)
+
+def contour_labels(f: np.ndarray) -> np.ndarray:
+    """flat/arch/valley/rising/falling：音域窄为 flat，峰/谷明显高/低于首尾为 arch/valley"""
+    lo, hi = f[:, _COL["pitch_min"]], f[:, _COL["pitch_max"]]
+    first, last = f[:, _COL["start_pitch"]], f[:, _COL["end_pitch"]]
+    return np.select(
+        [hi - lo <= 2, hi >= np.maximum(first, last) + 2, lo <= np.minimum(first, last) - 2,
+         last > first, last < first],
+        ["flat", "arch", "valley", "rising", "falling"], default="flat",
+    )
+
+def analyze(notes: midi.Notes, bpm: float, rest_beats: float = 1.0, max_bars: int = 2,
+            beats_per_bar: int = 4) -> Tuple[Dict[str, Any], np.ndarray]:
+    """返回 (phrases.json 文档, 特征矩阵)；notes 需按起点排序(量化输出即满足)"""
+    doc: Dict[str, Any] = {
+        "version": FORMAT_VERSION, "bpm": bpm, "beats_per_bar": beats_per_bar,
+        "rest_beats": rest_beats, "max_bars": max_bars, "feature_names": list(FEATURES),
+    }
+    if not len(notes):
+        doc.update(summary={"phrases": 0, "notes": 0, "duration": 0.0}, phrases=[])
+        return doc, np.zeros((0, len(FEATURES)), dtype=np.float32)
+    beat = 60.0 / bpm
+    on, dur = notes.onset / beat, notes.duration / beat
+    starts, after_rest = segment(on, on + dur, rest_beats, max_bars, beats_per_bar)
+    feats = extract(on, dur, notes.pitch, starts, after_rest)
+    labels = contour_labels(feats)
+
+    bounds = np.append(starts, len(notes))
+    onset_s = np.round(notes.onset, 4).tolist()
+    dur_s = np.round(notes.duration, 4).tolist()
+    pitch = notes.pitch.tolist()
+    rows = np.round(feats.astype(np.float64), 4).tolist()
+    phrases: List[Dict[str, Any]] = []
+    for i, (a, b) in enumerate(zip(bounds[:-1].tolist(), bounds[1:].tolist())):
+        phrases.append({
+            "index": i,
+            "start": onset_s[a],
+            "end": round(onset_s[b - 1] + dur_s[b - 1], 4),
+            "note_count": b - a,
+            "contour": str(labels[i]),
+            "notes": [[onset_s[k], dur_s[k], pitch[k]] for k in range(a, b)],
+            "features": dict(zip(FEATURES, rows[i])),
+            "text": None,  # 由填词阶段补上
+        })
+    doc["summary"] = {
+        "phrases": len(phrases),
+        "notes": len(notes),
+        "duration": round(float((notes.onset + notes.duration).max()), 3),
+        "pitch_range": [int(notes.pitch.min()), int(notes.pitch.max())],
+        "mean_phrase_beats": round(float(feats[:, _COL["duration_beats"]].mean()), 3),
+        "contours": {k: int(v) for k, v in zip(*np.unique(labels, return_counts=True))},
+    }
+    doc["phrases"] = phrases
+    return doc, feats
+
+def write(out_dir: str, doc: Dict[str, Any], feats: np.ndarray) -> None:
+    os.makedirs(out_dir, exist_ok=True)
+    with audio_io.atomic_open(os.path.join(out_dir, FEATURES_NAME)) as f:
+        np.save(f, np.ascontiguousarray(feats))
+    with audio_io.atomic_open(os.path.join(out_dir, PHRASES_NAME), "w", encoding="utf-8") as f:
+        json.dump(doc, f, ensure_ascii=False, separators=(",", ":"))
+
+def analyze_file(midi_path: str, out_dir: str, bpm: float, **kwargs: Any) -> Dict[str, Any]:
+    """分析 MIDI 写出 phrases.json / features.npy，返回 summary"""
+    doc, feats = analyze(midi.read(midi_path), bpm, **kwargs)
+    doc["source"] = os.path.basename(midi_path)
+    write(out_dir, doc, feats)
+    return doc["summary"]
+
+def load_features(out_dir: str) -> np.ndarray:
+    """只读映射 features.npy，不读入内存"""
+    return np.load(os.path.join(out_dir, FEATURES_NAME), mmap_mode="r")
@@ -1,65 +1,233 @@
-import os,wave,struct,time
-from typing import Dict, Any, Callable, Optional
-from app.core.storage import stage_dir,file_url,record_stage_artifacts,mark_stage_skipped,write_result
-
-STEPS = ["separate", "midi", "lyrics", "synthesize", "preview"]
-
-def _write_silence_wav(dst_path: str, seconds: float =1.0, sr: int =16000) -> None:
-    n_frames = int(seconds *sr)
-    os.makedirs(os.path.dirname(dst_path), exist_ok=True)
-    with wave.open(dst_path, "w") as wf:
-        wf.setnchannels(1)
-        wf.setsampwidth(2)
-        wf.setframerate(sr)
-        silence = struct.pack("<h",0)
-        for _ in range(n_frames):
-            wf.writeframesraw(silence)
-            
+import logging
+import os
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from app.core import lyrics_model, metrics, midi, mixer, phrases, separation, stage_cache, transcode
+from app.core.audio_io import wav_info, write_silence
+from app.core.config import settings
+from app.core.dag import Stage, run_graph, topo_order
+from app.core.storage import (
+    analyze_artifact,
+    file_sha256,
+    file_url,
+    link_or_copy,
+    mark_stage_skipped,
+    meta_batch,
+    record_stage_artifacts,
+    stage_dir,
+    upload_sha256,
+    write_result,
+)
+
+#阶段实现变化时递增版本号，让旧缓存自然失效
+STAGE_VERSIONS = {"separate": 2, "accompaniment": 1, "synthesize": 2, "phrases": 1}
+
+# 伴奏后处理产物：已统一到混音格式并乘过伴奏增益，合成阶段直接叠加
+ACCOMP_MIX_NAME = "accompaniment_mix.wav"
+
+def _input_hash(project_id: str, path: str) -> str:
+    return upload_sha256(project_id, path) or file_sha256(path)
+
+def _cached_stage(src_hash: Optional[str], bpm: int, stage: str, out_dir: str, names: List[str],
+                  produce: Callable[[], None], params: str = "") -> bool:
+    """命中缓存则直接链接产物，否则执行 produce 并回填缓存；返回是否命中"""
+    if src_hash is None:
+        produce()
+        return False
+    key = stage_cache.cache_key(src_hash, bpm, stage, STAGE_VERSIONS[stage], params)
+    if stage_cache.fetch(key, out_dir, names):
+        return True
+    produce()
+    stage_cache.store(key, out_dir, names)
+    return False
+
+log = logging.getLogger(__name__)
+
+def _separation_params() -> Dict[str, Any]:
+    return {
+        "model": settings.SEPARATION_MODEL,
+        "memory_mb": settings.SEPARATION_MEMORY_MB,
+        "workers": settings.SEPARATION_WORKERS,
+        "overlap_seconds": settings.SEPARATION_OVERLAP_SECONDS,
+    }
+
+def _separation_key() -> str:
+    # workers 只影响并行度和窗口边界(边界处交叉淡化)，不计入缓存键
+    return repr(sorted((k, v) for k, v in _separation_params().items() if k != "workers"))
+
+def _separate(in_path: str, vocals_path: str, accomp_path: str) -> None:
+    """分窗分离写出两路分轨；非 WAV 输入尚无解码，保留 1 秒占位分轨"""
+    try:
+        wav_info(in_path)
+    except (OSError, ValueError) as e:
+        log.warning("separation skipped for %s: %s", in_path, e)
+        write_silence(vocals_path, 1.0)
+        write_silence(accomp_path, 1.0)
+        return
+    separation.separate_file(in_path, vocals_path, accomp_path, **_separation_params())
+
+def _mix_params() -> Dict[str, Any]:
+    return {
+        "sr": settings.MIX_SAMPLE_RATE,
+        "channels": settings.MIX_CHANNELS,
+        "vocal_gain_db": settings.MIX_VOCAL_GAIN_DB,
+        "accomp_gain_db": settings.MIX_ACCOMP_GAIN_DB,
+        "ceiling_dbfs": settings.MIX_CEILING_DBFS,
+        "preview_start": settings.PREVIEW_START_SECONDS,
+        "preview_seconds": settings.PREVIEW_SECONDS,
+    }
+
+def _mix(vocals_path: str, accomp_path: Optional[str], out_dir: str, **overrides: Any) -> None:
+    """单次遍历写出 vocal.wav / fullmix.wav，预览片段先放在合成目录，由预览阶段链接过去"""
+    mixer.mix_stems(
+        vocals_path, accomp_path,
+        os.path.join(out_dir, "vocal.wav"), os.path.join(out_dir, "fullmix.wav"),
+        os.path.join(out_dir, "preview.wav"),
+        **dict(_mix_params(), **overrides),
+    )
+
+def _accomp_params() -> Dict[str, Any]:
+    return {
+        "sr": settings.MIX_SAMPLE_RATE,
+        "channels": settings.MIX_CHANNELS,
+        "gain_db": settings.MIX_ACCOMP_GAIN_DB,
+    }
+
+def _emit_waveforms(job_id: str, stage: str, names: List[str]) -> None:
+    """为阶段音频产物生成峰值/响度摘要，前端画波形不用下载整段 WAV"""
+    for name in names:
+        analyze_artifact(job_id, stage, name)
+
 def run_pipeline_stub(job_id: str, in_path: str, bpm: int, on_step: Optional[Callable[[str, int], None]]= None):
-    #分离产物
-    if on_step: on_step("separate", 1)
-    voc = os.path.join(stage_dir(job_id, "separate"), "vocals.wav")
-    acc = os.path.join(stage_dir(job_id, "separate"), "accompaniment.wav")
-    _write_silence_wav(voc, 1.0)
-    _write_silence_wav(acc, 1.0)
+    #一次运行内的元数据写入合并为一次落盘
+    with meta_batch(job_id):
+        return _run_pipeline(job_id, in_path, bpm, on_step)
+
+# ========== 阶段图：每个阶段声明输入/输出，依赖就绪即可并发 ==========
+# separate 之后分两支：伴奏后处理 ‖ MIDI → 歌词；合成汇合后再分两支：预览 ‖ 终混编码
+def _stage_separate(ctx: Dict[str, Any]) -> Dict[str, Any]:
+    job_id, bpm = ctx["job_id"], ctx["bpm"]
+    sep_dir = stage_dir(job_id, "separate")
+    voc = os.path.join(sep_dir, "vocals.wav")
+    acc = os.path.join(sep_dir, "accompaniment.wav")
+    _cached_stage(ctx["src_hash"], bpm, "separate", sep_dir, ["vocals.wav", "accompaniment.wav"],
+                  lambda: _separate(ctx["in_path"], voc, acc),
+                  params=_separation_key())
+    _emit_waveforms(job_id, "separate", ["vocals.wav", "accompaniment.wav"])
     record_stage_artifacts(job_id, "separate",{
         "vocals.wav": file_url(job_id, "separate", "vocals.wav"),
         "accompaniment.wav": file_url(job_id, "separate", "accompaniment.wav"),
     })
-    
-    if on_step: on_step("midi",2)
-    time.sleep(0.2)
-    
-    if on_step: on_step("lyrics", 3)
-    time.sleep(0.2)
-    
-    if on_step: on_step("synthesize", 4)
+    return {"vocals_path": voc, "accompaniment_path": acc}
+
+def _stage_accompaniment(ctx: Dict[str, Any]) -> Dict[str, Any]:
+    """伴奏重采样/声道对齐/增益提前做完，与 MIDI、歌词分支并行"""
+    job_id, bpm = ctx["job_id"], ctx["bpm"]
+    syn_dir = stage_dir(job_id, "synth")
+    out = os.path.join(syn_dir, ACCOMP_MIX_NAME)
+    params = _accomp_params()
+    # 伴奏内容取决于分离参数，一并计入缓存键
+    _cached_stage(ctx["src_hash"], bpm, "accompaniment", syn_dir, [ACCOMP_MIX_NAME],
+                  lambda: mixer.render_stem(ctx["accompaniment_path"], out, **params),
+                  params=repr(sorted(params.items())) + _separation_key())
+    return {"accomp_mix_path": out}
+
+def _stage_midi(ctx: Dict[str, Any]) -> Dict[str, Any]:
+    src = latest_midi_upload(ctx["job_id"])
+    if src is None:
+        time.sleep(0.2)  # 音高检测尚未接入，没有用户 MIDI 时保持占位
+        return {"notes": None}
+    quantize_midi(ctx["job_id"], src, ctx["bpm"])
+    return {"notes": os.path.join(stage_dir(ctx["job_id"], "midi"), midi.QUANTIZED_NAME)}
+
+def _stage_lyrics(ctx: Dict[str, Any]) -> Dict[str, Any]:
+    if ctx["notes"] is None:
+        time.sleep(0.2)
+        return {"phrases": None}
+    analyze_phrases(ctx["job_id"], ctx["notes"], ctx["bpm"])
+    lyrics_model.fill(stage_dir(ctx["job_id"], "lyrics"))
+    return {"phrases": os.path.join(stage_dir(ctx["job_id"], "lyrics"), phrases.PHRASES_NAME)}
+
+def _stage_synthesize(ctx: Dict[str, Any]) -> Dict[str, Any]:
+    job_id, bpm = ctx["job_id"], ctx["bpm"]
     syn_dir = stage_dir(job_id, "synth")
     vocal = os.path.join(syn_dir, "vocal.wav")
     full = os.path.join(syn_dir, "fullmix.wav")
-    _write_silence_wav(vocal, 1.0)
-    _write_silence_wav(full, 1.0)
+    key_params = sorted(_mix_params().items())
+    if ctx["phrases"] is not None:
+        # 同一段音频换了 MIDI/歌词，不能命中旧的合成结果
+        key_params.append(("phrases", file_sha256(ctx["phrases"])))
+    # 伴奏已乘过增益
+    _cached_stage(ctx["src_hash"], bpm, "synthesize", syn_dir,
+                  ["vocal.wav", "fullmix.wav", "preview.wav"],
+                  lambda: _mix(ctx["vocals_path"], ctx["accomp_mix_path"], syn_dir,
+                               accomp_gain_db=0.0),
+                  params=repr(key_params))
+    return {"vocal_path": vocal, "fullmix_path": full,
+            "preview_src": os.path.join(syn_dir, "preview.wav")}
+
+def _stage_preview(ctx: Dict[str, Any]) -> Dict[str, Any]:
+    job_id = ctx["job_id"]
+    prv_dir = stage_dir(job_id, "preview")
+    prv = os.path.join(prv_dir, "preview.wav")
+    # 预览片段已在混音时顺带写出，这里只做链接
+    link_or_copy(ctx["preview_src"], prv)
+    _emit_waveforms(job_id, "preview", ["preview.wav"])
+    return {"preview_path": prv}
+
+def _stage_encode(ctx: Dict[str, Any]) -> Dict[str, Any]:
+    """终混收尾：波形摘要、登记产物，按配置预编码压缩格式；与预览阶段并行"""
+    job_id = ctx["job_id"]
+    _emit_waveforms(job_id, "synth", ["vocal.wav", "fullmix.wav"])
     record_stage_artifacts(job_id, "synth", {
         "vocal.wav": file_url(job_id, "synth", "vocal.wav"),
         "fullmix.wav": file_url(job_id, "synth", "fullmix.wav"),
     })
-    
-    if on_step: on_step("preview", 5)
-    prv = os.path.join(stage_dir(job_id, "preview"), "preview.wav")
-    _write_silence_wav(prv, 0.5)
+    formats = [f.strip() for f in settings.PIPELINE_ENCODE_FORMATS.split(",") if f.strip()]
+    renditions = {}
+    if formats:
+        renditions = transcode.warm([ctx["vocal_path"], ctx["fullmix_path"]], formats)
+    return {"renditions": renditions}
+
+PIPELINE: List[Stage] = [
+    Stage("separate", _stage_separate, inputs=("in_path", "src_hash"),
+          outputs=("vocals_path", "accompaniment_path"), cpu=True),
+    Stage("accompaniment", _stage_accompaniment, inputs=("accompaniment_path",),
+          outputs=("accomp_mix_path",), cpu=True),
+    Stage("midi", _stage_midi, inputs=("vocals_path",), outputs=("notes",)),
+    Stage("lyrics", _stage_lyrics, inputs=("notes",), outputs=("phrases",)),
+    Stage("synthesize", _stage_synthesize, inputs=("phrases", "vocals_path", "accomp_mix_path"),
+          outputs=("vocal_path", "fullmix_path", "preview_src"), cpu=True),
+    Stage("preview", _stage_preview, inputs=("preview_src",), outputs=("preview_path",)),
+    Stage("encode", _stage_encode, inputs=("vocal_path", "fullmix_path"), outputs=("renditions",)),
+]
+STEPS = [st.name for st in topo_order(PIPELINE, ("job_id", "in_path", "bpm", "src_hash"))]
+
+def _run_pipeline(job_id: str, in_path: str, bpm: int,
+                  on_step: Optional[Callable[[str, int], None]] = None):
+    ctx = {"job_id": job_id, "in_path": in_path, "bpm": int(bpm),
+           "src_hash": _input_hash(job_id, in_path)}
+    ctx, timings = run_graph(
+        PIPELINE, ctx, on_step=on_step,
+        max_workers=settings.PIPELINE_MAX_WORKERS,
+        process_pool=settings.PIPELINE_PROCESS_POOL,
+    )
+    metrics.observe_stage_timings(timings)
     
     payload = {
         "job_id": job_id,
         "bpm_used": int(bpm),
         "steps": STEPS,
         "outputs": {
-            "result_path": full,
-            "preview_path": prv,
+            "result_path": ctx["fullmix_path"],
+            "preview_path": ctx["preview_path"],
         },
         "urls":{
             "result_url": file_url(job_id, "synth", "fullmix.wav"),
             "preview_url": file_url(job_id, "preview", "preview.wav")
         },
+        "stage_timings": timings,
     }
     write_result(job_id, payload)
     return payload
@@ -72,6 +240,55 @@ def _lastest_upload_path(project_id: str) -> Optional[str]:
     files.sort(reverse=True)
     return os.path.join(up, files[0])
 
+def latest_midi_upload(project_id: str) -> Optional[str]:
+    """项目 midi/ 目录里最新上传的 MIDI(不含量化产物)"""
+    d = stage_dir(project_id, "midi")
+    if not os.path.isdir(d):
+        return None
+    files = [os.path.join(d, fn) for fn in os.listdir(d)
+             if fn.lower().endswith((".mid", ".midi")) and fn != midi.QUANTIZED_NAME]
+    return max(files, key=os.path.getmtime) if files else None
+
+def quantize_midi(project_id: str, src: str, bpm: int) -> Dict[str, Any]:
+    """按 bpm 量化上传的 MIDI 写出 midi/quantized.mid 并登记产物；MIDI 损坏抛 ValueError"""
+    out_dir = stage_dir(project_id, "midi")
+    stats = midi.quantize_file(src, os.path.join(out_dir, midi.QUANTIZED_NAME), bpm)
+    record_stage_artifacts(project_id, "midi", {
+        "midi": file_url(project_id, "midi", os.path.basename(src)),
+        "quantized": file_url(project_id, "midi", midi.QUANTIZED_NAME),
+    })
+    return stats
+
+def stub_quantize_midi(project_id: str, filename: str, bpm: int) -> Dict[str, Any]:
+    """阶段任务入口：量化 midi/ 下已上传的文件"""
+    src = os.path.join(stage_dir(project_id, "midi"), filename)
+    if not os.path.exists(src):
+        raise FileNotFoundError(src)
+    stats = quantize_midi(project_id, src, bpm)
+    return {"ok": True, "midi_url": file_url(project_id, "midi", filename),
+            "quantized_url": file_url(project_id, "midi", midi.QUANTIZED_NAME), "stats": stats}
+
+def _phrase_params() -> Dict[str, Any]:
+    return {
+        "rest_beats": settings.PHRASE_REST_BEATS,
+        "max_bars": settings.PHRASE_MAX_BARS,
+        "beats_per_bar": settings.PHRASE_BEATS_PER_BAR,
+    }
+
+def analyze_phrases(project_id: str, midi_path: str, bpm: int) -> bool:
+    """量化 MIDI → lyrics/phrases.json + features.npy；按 MIDI 内容哈希缓存，返回是否命中"""
+    out_dir = stage_dir(project_id, "lyrics")
+    params = _phrase_params()
+    hit = _cached_stage(file_sha256(midi_path), bpm, "phrases", out_dir,
+                        [phrases.PHRASES_NAME, phrases.FEATURES_NAME],
+                        lambda: phrases.analyze_file(midi_path, out_dir, bpm, **params),
+                        params=repr(sorted(params.items())))
+    record_stage_artifacts(project_id, "lyrics", {
+        "phrases_json": file_url(project_id, "lyrics", phrases.PHRASES_NAME),
+        "features": file_url(project_id, "lyrics", phrases.FEATURES_NAME),
+    })
+    return hit
+
 def stub_separate(project_id: str, bpm: int, allow_missing: bool = False) -> Dict[str, Any]:
     src = _lastest_upload_path(project_id)
     if not src:
@@ -82,8 +299,11 @@ def stub_separate(project_id: str, bpm: int, allow_missing: bool = False) -> Dic
     out_dir = stage_dir(project_id, "separate")
     vocals = os.path.join(out_dir, "vocals.wav")
     accomp = os.path.join(out_dir, "accompaniment.wav")
-    _write_silence_wav(vocals, seconds=1.0)
-    _write_silence_wav(accomp, seconds=1.0)
+    _cached_stage(_input_hash(project_id, src), bpm, "separate", out_dir,
+                  ["vocals.wav", "accompaniment.wav"],
+                  lambda: _separate(src, vocals, accomp),
+                  params=_separation_key())
+    _emit_waveforms(project_id, "separate", ["vocals.wav", "accompaniment.wav"])
     files = {
         "vocals.wav": file_url(project_id, "separate","vocals.wav"),
         "accompaniment.wav": file_url(project_id,"separate", "accompaniment.wav"),
@@ -94,13 +314,31 @@ def stub_separate(project_id: str, bpm: int, allow_missing: bool = False) -> Dic
 def stub_synthesize(project_id:str, fmt:str="wav", allow_missing:bool = False) -> Dict[str,Any]:
     #无依赖时可以跳过
     out_dir = stage_dir(project_id, "synth")
-    vocal = os.path.join(out_dir, f"vocal.{fmt}")
-    full = os.path.join(out_dir, f"fullmix.{fmt}")
-    _write_silence_wav(vocal if fmt=="wav" else vocal.replace(f".{fmt}",".wav"), seconds=1.0)
-    _write_silence_wav(full if fmt=="wav" else vocal.replace(f".{fmt}",".wav"), seconds=1.0)
-    files = {
-        os.path.basename(vocal):file_url(project_id,"synth",os.path.basename(vocal)),
-        os.path.basename(full):file_url(project_id, "synth", os.path.basename(full)),
-    }
+    vocal = os.path.join(out_dir, "vocal.wav")
+    full = os.path.join(out_dir, "fullmix.wav")
+    sep_dir = stage_dir(project_id, "separate")
+    vocals_src = os.path.join(sep_dir, "vocals.wav")
+    accomp_src = os.path.join(sep_dir, "accompaniment.wav")
+    if os.path.isfile(vocals_src):
+        #已有分离结果时按分轨混音
+        _mix(vocals_src, accomp_src if os.path.isfile(accomp_src) else None, out_dir)
+    else:
+        write_silence(vocal, seconds=1.0)
+        write_silence(full, seconds=1.0)
+    _emit_waveforms(project_id, "synth", ["vocal.wav", "fullmix.wav"])
+    #先出 WAV 母版，再转成请求的压缩格式；编码器不可用时如实返回 wav
+    outputs = [vocal, full]
+    if fmt != "wav":
+        encoded = [transcode.transcode(p, fmt) for p in outputs]
+        if all(encoded):
+            outputs = []
+            for src, rendition in zip([vocal, full], encoded):
+                dst = os.path.splitext(src)[0] + f".{fmt}"
+                link_or_copy(rendition, dst)
+                outputs.append(dst)
+        else:
+            fmt = "wav"
+    names = [os.path.basename(p) for p in outputs]
+    files = {fn: file_url(project_id, "synth", fn) for fn in names}
     record_stage_artifacts(project_id,"synth",files)
-    return {"ok":True, "vocal_url":files[os.path.basename(vocal)],"fullmix_url":files[os.path.basename(full)]}
+    return {"ok":True, "format": fmt, "vocal_url":files[names[0]],"fullmix_url":files[names[1]]}
@@ -0,0 +1,175 @@
+import abc
+import importlib
+import inspect
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import ExitStack
+from typing import Any, Deque, Dict, Optional, Tuple, Type, Union
+
+import numpy as np
+
+from app.core import audio_io
+
+# 分离运行器：输入按带重叠的窗口切块，线程池并行跑模型，重叠区线性交叉淡化后按顺序流式写出两路分轨。
+# 窗口长度由内存预算推出(预算 / 并行窗口数 / 每帧估算字节)，峰值内存与曲长无关。
+# 模型声明 context(单侧感受野)时，窗口再向两侧多读这么多帧、算完裁掉，局部模型的结果与整段处理一致；
+# 全局模型(如 Demucs 类)context 为 0，由交叉淡化消除接缝。
+
+class SeparationModel(abc.ABC):
+    """可插拔模型接口：separate 输入 (frames, channels) float32，返回同形状的 (人声, 伴奏)"""
+
+    name = "base"
+    context = 0                 # 单侧需要的额外上下文帧数
+    bytes_per_sample = 32       # 每帧每声道的峰值工作内存估算(字节)，用于从预算推算窗口长度
+
+    def prepare(self, sr: int, channels: int) -> None:
+        """按输入采样率/声道初始化，每个文件调用一次"""
+
+    @abc.abstractmethod
+    def separate(self, x: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """x 为含上下文的整个窗口，返回与 x 等长的两路"""
+
+def _fft_filter(x: np.ndarray, h: np.ndarray) -> np.ndarray:
+    """零填充的 same 卷积，长度与 x 相同"""
+    n = len(x) + len(h) - 1
+    nfft = 1 << (n - 1).bit_length()
+    y = np.fft.irfft(np.fft.rfft(x, nfft) * np.fft.rfft(h, nfft), nfft)
+    off = len(h) // 2
+    return y[off:off + len(x)].astype(np.float32)
+
+class CenterBandModel(SeparationModel):
+    """轻量 CPU 测试模型：人声取声像居中(中声道)的 150-4000Hz 带通，伴奏为原信号减人声"""
+
+    name = "center_band"
+    taps = 257
+    context = taps // 2
+    bytes_per_sample = 48
+
+    def __init__(self, low_hz: float = 150.0, high_hz: float = 4000.0):
+        self.low_hz, self.high_hz = low_hz, high_hz
+        self.h: Optional[np.ndarray] = None
+
+    def prepare(self, sr: int, channels: int) -> None:
+        n = np.arange(self.taps) - self.taps // 2
+        hi = min(self.high_hz, sr * 0.45) / sr
+        lo = self.low_hz / sr
+        h = 2 * hi * np.sinc(2 * hi * n) - 2 * lo * np.sinc(2 * lo * n)
+        self.h = (h * np.hamming(self.taps)).astype(np.float64)
+
+    def separate(self, x: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        mid = x.mean(axis=1, dtype=np.float64)
+        vocals = np.repeat(_fft_filter(mid, self.h)[:, None], x.shape[1], axis=1)
+        return vocals, x - vocals
+
+MODELS: Dict[str, Type[SeparationModel]] = {
+    CenterBandModel.name: CenterBandModel,
+}
+
+def load_model(spec: Union[str, SeparationModel]) -> SeparationModel:
+    """内置名字，或 "包.模块:类名" 形式的外部实现"""
+    if isinstance(spec, SeparationModel):
+        return spec
+    if spec in MODELS:
+        return MODELS[spec]()
+    module, sep, attr = spec.partition(":")
+    if not sep:
+        raise ValueError(f"unknown separation model {spec!r}")
+    cls = getattr(importlib.import_module(module), attr)
+    if not (isinstance(cls, type) and issubclass(cls, SeparationModel)):
+        raise ValueError(f"{spec} is not a SeparationModel")
+    if inspect.isabstract(cls):
+        # 在加载时报错，而不是跑到第一个窗口才失败
+        raise ValueError(f"{spec} does not implement {', '.join(sorted(cls.__abstractmethods__))}")
+    return cls()
+
+def plan(model: SeparationModel, sr: int, channels: int, memory_mb: float, workers: int,
+         overlap_seconds: float) -> Tuple[int, int]:
+    """返回 (hop, overlap)：每个窗口实际处理 hop + 2*overlap + 2*context 帧"""
+    overlap = int(overlap_seconds * sr)
+    # 输入块 + 两路输出 + 模型工作区
+    per_frame = channels * (model.bytes_per_sample + 3 * 4)
+    span = int(memory_mb * 1024 * 1024 / workers / per_frame)
+    hop = span - 2 * overlap - 2 * model.context
+    if hop < max(2 * overlap, 1):
+        raise ValueError(f"memory budget {memory_mb}MB too small for {workers} workers "
+                         f"at {sr}Hz x{channels}")
+    return hop, overlap
+
+def separate_file(src: str, vocals_out: str, accomp_out: str,
+                  model: Union[str, SeparationModel] = "center_band", *,
+                  memory_mb: float = 256.0, workers: int = 2, overlap_seconds: float = 0.25,
+                  sample_format: str = "pcm16") -> Dict[str, Any]:
+    """分窗分离 src 并流式写出两路分轨，返回窗口规划与耗时"""
+    t0 = time.perf_counter()
+    model = load_model(model)
+    mm, info = audio_io.memmap_wav(src)
+    n, ch = info.frames, info.channels
+    model.prepare(info.sr, ch)
+    hop, ov = plan(model, info.sr, ch, memory_mb, workers, overlap_seconds)
+    hop = max(min(hop, n), 2 * ov, 1)  # 短文件不按预算分配整窗
+    ctx = model.context
+    windows = max(1, -(-n // hop))
+    ramp = ((np.arange(2 * ov, dtype=np.float32) + 0.5) / max(2 * ov, 1))[:, None]
+
+    def read(lo: int, hi: int) -> np.ndarray:
+        """取 [lo, hi) 帧，超出文件的部分补零"""
+        out = np.zeros((hi - lo, ch), np.float32)
+        a, b = max(lo, 0), min(hi, n)
+        if a < b:
+            out[a - lo:b - lo] = audio_io.to_float32(mm[a:b], info.sample_format)
+        return out
+
+    def run(k: int) -> Tuple[np.ndarray, np.ndarray]:
+        # 输出覆盖 [k*hop - ov, (k+1)*hop + ov)
+        s = k * hop
+        v, a = model.separate(read(s - ov - ctx, s + hop + ov + ctx))
+        end = len(v) - ctx
+        return np.asarray(v[ctx:end], np.float32), np.asarray(a[ctx:end], np.float32)
+
+    with ExitStack() as stack:
+        writers = [stack.enter_context(audio_io.WavWriter(p, info.sr, ch, sample_format))
+                   for p in (vocals_out, accomp_out)]
+        tails: Optional[Tuple[np.ndarray, ...]] = None
+
+        def emit(start: int, blocks) -> None:
+            lo, hi = max(start, 0), min(start + len(blocks[0]), n)
+            if lo < hi:
+                for w, b in zip(writers, blocks):
+                    w.write(b[lo - start:hi - start])
+
+        def consume(k: int, outs: Tuple[np.ndarray, np.ndarray]) -> None:
+            nonlocal tails
+            s = k * hop
+            heads = tuple(o[:2 * ov] for o in outs)
+            if tails is not None:
+                heads = tuple(t * (1 - ramp) + h * ramp for t, h in zip(tails, heads))
+            emit(s - ov, heads)
+            emit(s + ov, tuple(o[2 * ov:hop] for o in outs))
+            tails = tuple(o[hop:hop + 2 * ov] for o in outs)
+
+        pending: Deque[Tuple[int, Future]] = deque()
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="separate") as pool:
+            # 在途窗口不超过 workers 个，内存上限即预算
+            for k in range(windows):
+                if len(pending) >= workers:
+                    i, fut = pending.popleft()
+                    consume(i, fut.result())
+                pending.append((k, pool.submit(run, k)))
+            while pending:
+                i, fut = pending.popleft()
+                consume(i, fut.result())
+        if tails is not None:
+            emit(windows * hop - ov, tails)
+
+    return {
+        "model": model.name,
+        "frames": n,
+        "sr": info.sr,
+        "channels": ch,
+        "windows": windows,
+        "hop": hop,
+        "overlap": ov,
+        "workers": workers,
+        "seconds": round(time.perf_counter() - t0, 3),
+    }
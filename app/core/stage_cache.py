@@ -0,0 +1,131 @@
+import hashlib
+import logging
+import os
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Dict, Iterable, Optional
+
+from app.core import metrics
+from app.core.config import settings
+from app.core.meta_index import open_db
+from app.core.storage import link_or_copy
+
+log = logging.getLogger(__name__)
+
+# 内容寻址的阶段产物缓存：key = (输入音频哈希, bpm, 阶段名, 阶段版本)
+# 条目目录一旦 rename 到位即视为完整；项目目录里拿到的是硬链接，淘汰条目不影响已有项目
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    key       TEXT PRIMARY KEY,
+    bytes     INTEGER NOT NULL,
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_entries_lru ON entries(last_used);
+"""
+
+_counter_lock = threading.Lock()
+_counters: Dict[str, int] = {"hits": 0, "misses": 0, "evictions": 0}
+
+def cache_dir() -> str:
+    return settings.STAGE_CACHE_DIR or os.path.join(settings.TEMP_DIR, "stage_cache")
+
+def _ledger() -> sqlite3.Connection:
+    return open_db(os.path.join(cache_dir(), "ledger.sqlite3"), _SCHEMA)
+
+def _entry_dir(key: str) -> str:
+    return os.path.join(cache_dir(), key[:2], key)
+
+_METRIC_LABELS = {"hits": "hit", "misses": "miss", "evictions": "eviction"}
+
+def _count(name: str, n: int = 1) -> None:
+    with _counter_lock:
+        _counters[name] += n
+    if n:
+        metrics.STAGE_CACHE.labels(_METRIC_LABELS[name]).inc(n)
+
+def cache_key(input_sha256: str, bpm: int, stage: str, version: int, params: str = "") -> str:
+    """params 为影响产物的其他配置(如混音参数)，为空时 key 与旧版一致"""
+    raw = f"{input_sha256}|{int(bpm)}|{stage}|{int(version)}"
+    if params:
+        raw += f"|{params}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+def fetch(key: str, dst_dir: str, names: Iterable[str]) -> bool:
+    """命中时把条目里的文件链接进 dst_dir 并返回 True"""
+    if not settings.STAGE_CACHE_ENABLED:
+        return False
+    entry = _entry_dir(key)
+    names = list(names)
+    try:
+        for fn in names:
+            link_or_copy(os.path.join(entry, fn), os.path.join(dst_dir, fn))
+    except OSError:
+        # 条目不存在或正被淘汰，按未命中处理
+        _count("misses")
+        return False
+    try:
+        _ledger().execute("UPDATE entries SET last_used = ? WHERE key = ?", (time.time(), key))
+    except sqlite3.Error:
+        log.exception("stage cache ledger update failed")
+    _count("hits")
+    return True
+
+def store(key: str, src_dir: str, names: Iterable[str]) -> None:
+    """把 src_dir 下的产物收进缓存；并发写同一 key 时先到者生效"""
+    if not settings.STAGE_CACHE_ENABLED:
+        return
+    entry = _entry_dir(key)
+    if os.path.isdir(entry):
+        return
+    os.makedirs(os.path.dirname(entry), exist_ok=True)
+    tmp = f"{entry}.{uuid.uuid4().hex}.tmp"
+    os.makedirs(tmp)
+    total = 0
+    try:
+        for fn in names:
+            dst = os.path.join(tmp, fn)
+            link_or_copy(os.path.join(src_dir, fn), dst)
+            total += os.path.getsize(dst)
+        os.rename(tmp, entry)
+    except OSError:
+        shutil.rmtree(tmp, ignore_errors=True)
+        if not os.path.isdir(entry):
+            raise
+        return
+    try:
+        _ledger().execute(
+            "INSERT OR REPLACE INTO entries(key, bytes, last_used) VALUES (?, ?, ?)",
+            (key, total, time.time()),
+        )
+    except sqlite3.Error:
+        log.exception("stage cache ledger insert failed")
+    evict()
+
+def evict(max_bytes: Optional[int] = None) -> int:
+    """按最近使用时间淘汰，直到总量不超过预算；返回淘汰条目数"""
+    budget = settings.STAGE_CACHE_MAX_MB * 1024 * 1024 if max_bytes is None else max_bytes
+    conn = _ledger()
+    (used,) = conn.execute("SELECT COALESCE(SUM(bytes), 0) FROM entries").fetchone()
+    if used <= budget:
+        return 0
+    removed = 0
+    for key, size in conn.execute("SELECT key, bytes FROM entries ORDER BY last_used").fetchall():
+        if used <= budget:
+            break
+        shutil.rmtree(_entry_dir(key), ignore_errors=True)
+        conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+        used -= size
+        removed += 1
+    _count("evictions", removed)
+    return removed
+
+def stats() -> Dict[str, int]:
+    with _counter_lock:
+        out = dict(_counters)
+    (out["entries"], out["bytes"]) = _ledger().execute(
+        "SELECT COUNT(*), COALESCE(SUM(bytes), 0) FROM entries"
+    ).fetchone()
+    return out
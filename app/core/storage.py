@@ -1,13 +1,28 @@
-import os
+import copy
+import datetime as _dt
+import hashlib
 import json
+import os
 import shutil
-import datetime as _dt
-from typing import Dict, Any, Optional
+import stat
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows 本地开发：退化为仅进程内锁
+    fcntl = None
 
 from fastapi import HTTPException
-from starlette.responses import FileResponse
+from starlette.concurrency import run_in_threadpool
 
+from app.core import audio_io, meta_index, metrics, transcode, waveform
 from app.core.config import settings
+from app.core.http_files import IMMUTABLE_CACHE, REVALIDATE_CACHE, CachedFileResponse, file_version
+
 
 def _safe_join(base: str, *paths: str) -> str:
     base = os.path.abspath(base)
@@ -25,94 +40,322 @@ def meta_path(project_id: str) -> str:
 def result_json_path(project_id: str) -> str:
     return os.path.join(project_root(project_id), "result.json")
 
+def now_iso() -> str:
+    return _dt.datetime.now(_dt.timezone.utc).isoformat().replace('+00:00', 'Z')
+
+def _write_json_atomic(path: str, obj: Any) -> None:
+    with audio_io.atomic_open(path, "w", encoding="utf-8") as f:
+        json.dump(obj, f, ensure_ascii=False, indent=2)
+
+_FICLONE = 0x40049409  # linux/fs.h: _IOW(0x94, 9, int)
+
+def _reflink(src: str, dst: str) -> bool:
+    """btrfs/xfs 等支持 FICLONE 时做写时复制克隆，失败返回 False"""
+    if fcntl is None:
+        return False
+    try:
+        with open(src, "rb") as fs, open(dst, "wb") as fd:
+            fcntl.ioctl(fd.fileno(), _FICLONE, fs.fileno())
+    except OSError:
+        _discard(dst)
+        return False
+    shutil.copystat(src, dst)
+    return True
+
+def link_or_copy(src: str, dst: str) -> str:
+    """按 硬链接 → reflink → 复制 的顺序落地到 dst(原子替换)，返回实际使用的方式"""
+    tmp = audio_io.temp_path(dst)
+    try:
+        os.link(src, tmp)
+        how = "link"
+    except OSError:
+        if not os.path.isfile(src):
+            raise
+        if _reflink(src, tmp):
+            how = "reflink"
+        else:
+            shutil.copy2(src, tmp)
+            how = "copy"
+    try:
+        os.replace(tmp, dst)
+    except BaseException:
+        _discard(tmp)
+        raise
+    return how
+
+def file_sha256(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(_UPLOAD_CHUNK), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+# ========== 元数据层：进程内缓存 + 批量合并写 + 项目级文件锁 ==========
+_state_lock = threading.RLock()
+_meta_cache: Dict[str, Tuple[int, int, Dict[str, Any]]] = {}  # meta路径 -> (mtime_ns, size, meta)
+_meta_batches: Dict[str, Dict[str, Any]] = {}  # project_id -> {"pid", "view": meta, "ops": [...]}
+_initialized: Dict[str, int] = {}  # 已确认目录结构存在的项目根目录 -> 根目录 inode
+_project_locks: Dict[Tuple[int, str], "_ProjectLock"] = {}
+
+class _ProjectLock:
+    """进程内可重入锁 + 跨进程 flock(meta.json.lock)；最外层获取时才加文件锁"""
+
+    def __init__(self, lock_file: str):
+        self.lock_file = lock_file
+        self._rlock = threading.RLock()
+        self._depth = 0
+        self._fd: Optional[int] = None
+
+    def __enter__(self):
+        self._rlock.acquire()
+        if self._depth == 0 and fcntl is not None:
+            try:
+                os.makedirs(os.path.dirname(self.lock_file), exist_ok=True)
+                self._fd = os.open(self.lock_file, os.O_RDWR | os.O_CREAT, 0o644)
+                fcntl.flock(self._fd, fcntl.LOCK_EX)
+            except BaseException:
+                if self._fd is not None:
+                    os.close(self._fd)
+                    self._fd = None
+                self._rlock.release()
+                raise
+        self._depth += 1
+        return self
+
+    def __exit__(self, *exc):
+        self._depth -= 1
+        if self._depth == 0 and self._fd is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+            self._fd = None
+        self._rlock.release()
+
+def project_lock(project_id: str) -> _ProjectLock:
+    lock_file = meta_path(project_id) + ".lock"
+    key = (os.getpid(), lock_file)
+    with _state_lock:
+        lk = _project_locks.get(key)
+        if lk is None:
+            lk = _project_locks[key] = _ProjectLock(lock_file)
+        return lk
+
 def _ensure_meta_file(project_id: str) -> None:
     """确保元数据文件存在，避免递归调用"""
     meta_file = meta_path(project_id)
-    if not os.path.exists(meta_file):
+    if os.path.exists(meta_file):
+        return
+    with project_lock(project_id):
+        if os.path.exists(meta_file):
+            return
         initial_meta = {
             "project_id": project_id,
-            "created_at": _dt.datetime.now(_dt.timezone.utc).isoformat().replace('+00:00', 'Z'),
+            "created_at": now_iso(),
             "is_featured": False,
             "stage_artifacts": {},
         }
-        os.makedirs(os.path.dirname(meta_file), exist_ok=True)
-        with open(meta_file, "w", encoding="utf-8") as f:
-            json.dump(initial_meta, f, ensure_ascii=False, indent=2)
+        _write_meta_file(project_id, initial_meta)
 
 def ensure_project_initialized(project_id: str) -> str:
-    """初始化项目目录结构，避免递归调用 save_project_meta"""
+    """初始化项目目录结构，避免递归调用 save_project_meta；根目录未变时只需一次 stat"""
     root = project_root(project_id)
+    # 其它进程(清理任务)可能已删掉或重建目录，只在根目录仍是同一个 inode 时信任缓存
+    try:
+        ino = os.stat(root).st_ino
+    except FileNotFoundError:
+        ino = None
+    if ino is not None and _initialized.get(root) == ino:
+        return root
     for d in ("uploads", "separate", "midi", "lyrics", "synth", "preview", "mix", "pub"):
         os.makedirs(os.path.join(root, d), exist_ok=True)
     
     # 使用内部函数避免递归
     _ensure_meta_file(project_id)
+    _initialized[root] = os.stat(root).st_ino
     return root
 
+def forget_project(project_id: str) -> None:
+    """项目目录被删除后清理进程内缓存"""
+    root = project_root(project_id)
+    with _state_lock:
+        _initialized.pop(root, None)
+        _meta_cache.pop(meta_path(project_id), None)
+
 def stage_dir(project_id: str, stage: str) -> str:
     ensure_project_initialized(project_id)
     return _safe_join(project_root(project_id), stage)
 
 # 元数据操作
-def load_project_meta(project_id: str) -> Dict[str, Any]:
-    _ensure_meta_file(project_id)  # 确保文件存在
+def _write_meta_file(project_id: str, meta: Dict[str, Any]) -> None:
+    p = meta_path(project_id)
+    os.makedirs(os.path.dirname(p), exist_ok=True)
+    _write_json_atomic(p, meta)
+    st = os.stat(p)
+    with _state_lock:
+        _meta_cache[p] = (st.st_mtime_ns, st.st_size, copy.deepcopy(meta))
+    meta_index.upsert_project(project_id, meta)
+
+def _read_meta_file(project_id: str) -> Dict[str, Any]:
+    """按 mtime/size 校验缓存，命中时只需一次 stat"""
     p = meta_path(project_id)
+    try:
+        st = os.stat(p)
+    except FileNotFoundError:
+        _ensure_meta_file(project_id)
+        st = os.stat(p)
+    cached = _meta_cache.get(p)
+    if cached and cached[0] == st.st_mtime_ns and cached[1] == st.st_size:
+        return copy.deepcopy(cached[2])
     try:
         with open(p, "r", encoding="utf-8") as f:
-            return json.load(f)
+            meta = json.load(f)
     except Exception:
         return {"project_id": project_id, "created_at": None, "is_featured": False, "stage_artifacts": {}}
+    with _state_lock:
+        _meta_cache[p] = (st.st_mtime_ns, st.st_size, meta)
+    return copy.deepcopy(meta)
+
+def _active_batch(project_id: str) -> Optional[Dict[str, Any]]:
+    # fork 出的子进程(进程池阶段)会继承父进程的批处理状态，这里只认本进程创建的
+    batch = _meta_batches.get(project_id)
+    if batch is not None and batch["pid"] == os.getpid():
+        return batch
+    return None
+
+def load_project_meta(project_id: str) -> Dict[str, Any]:
+    batch = _active_batch(project_id)
+    if batch is not None:
+        return copy.deepcopy(batch["view"])
+    return _read_meta_file(project_id)
+
+def _mutate_project_meta(project_id: str, op: Callable[[Dict[str, Any]], Any]) -> Dict[str, Any]:
+    """对元数据做一次读-改-写；批处理中只记录操作，退出时在锁内对最新文件重放"""
+    with _state_lock:
+        batch = _active_batch(project_id)
+        if batch is not None:
+            op(batch["view"])
+            batch["ops"].append(op)
+            return copy.deepcopy(batch["view"])
+    with project_lock(project_id):
+        meta = _read_meta_file(project_id)
+        op(meta)
+        _write_meta_file(project_id, meta)
+        return meta
+
+@contextmanager
+def meta_batch(project_id: str) -> Iterator[None]:
+    """合并一次流水线运行内的所有元数据写入，退出时只落盘一次"""
+    view = _read_meta_file(project_id)
+    with _state_lock:
+        nested = _active_batch(project_id) is not None
+        if not nested:
+            _meta_batches[project_id] = {"pid": os.getpid(), "view": view, "ops": []}
+    if nested:
+        yield
+        return
+    try:
+        yield
+    finally:
+        with project_lock(project_id):
+            with _state_lock:
+                batch = _meta_batches.pop(project_id)
+            if batch["ops"]:
+                # 重放到最新的磁盘版本上，不会覆盖其他进程在此期间的修改
+                meta = _read_meta_file(project_id)
+                for op in batch["ops"]:
+                    op(meta)
+                _write_meta_file(project_id, meta)
 
 def save_project_meta(project_id: str, meta: Dict[str, Any]) -> None:
-    p = meta_path(project_id)
-    os.makedirs(os.path.dirname(p), exist_ok=True)
-    with open(p, "w", encoding="utf-8") as f:
-        json.dump(meta, f, ensure_ascii=False, indent=2)
+    snapshot = copy.deepcopy(meta)
+    def op(m: Dict[str, Any]) -> None:
+        m.clear()
+        m.update(copy.deepcopy(snapshot))
+    _mutate_project_meta(project_id, op)
 
 def update_project_meta(project_id: str, patch: Dict[str, Any]) -> Dict[str, Any]:
-    meta = load_project_meta(project_id)
-    meta.update(patch)
-    save_project_meta(project_id, meta)
-    return meta
+    patch = copy.deepcopy(patch)
+    return _mutate_project_meta(project_id, lambda m: m.update(patch))
 
 # 记录阶段处理产物
 def record_stage_artifacts(project_id: str, stage: str, files: Dict[str, Optional[str]], skipped: bool = False) -> Dict[str, Any]:
-    meta = load_project_meta(project_id)
-    meta.setdefault("stage_artifacts", {})
-    meta["stage_artifacts"][stage] = {
-        "files": files,
+    entry = {
+        "files": dict(files),
         "skipped": skipped,
-        "at": _dt.datetime.now(_dt.timezone.utc).isoformat().replace('+00:00', 'Z')
+        "at": now_iso(),
     }
-    save_project_meta(project_id, meta)
+    def op(m: Dict[str, Any]) -> None:
+        m.setdefault("stage_artifacts", {})[stage] = copy.deepcopy(entry)
+    meta = _mutate_project_meta(project_id, op)
     return meta["stage_artifacts"][stage]
 
 def mark_stage_skipped(project_id: str, stage: str) -> Dict[str, Any]:
     return record_stage_artifacts(project_id, stage, files={}, skipped=True)
 
 # 上传与结果处理
+_UPLOAD_CHUNK = 1024 * 1024
+
+def _write_chunk(f, hasher, chunk: bytes) -> None:
+    hasher.update(chunk)
+    f.write(chunk)
+
+def _discard(path: str) -> None:
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
 async def save_upload(project_id: str, upload, stage: str = "uploads", dst_name: Optional[str] = None) -> str:
-    ensure_project_initialized(project_id)
+    """流式落盘：写盘与哈希放到线程池，超限立即中止，写完后原子改名"""
     sd = stage_dir(project_id, stage)
     name = dst_name or upload.filename
     if not name:
         raise ValueError("Filename is required")
     dst = _safe_join(sd, name)
-    with open(dst, "wb") as f:
+    limit = settings.MAX_UPLOAD_MB * 1024 * 1024
+    tmp = f"{dst}.{uuid.uuid4().hex}.part"
+    hasher = hashlib.sha256()
+    size = 0
+    t0 = time.perf_counter()
+    f = await run_in_threadpool(open, tmp, "wb")
+    try:
         while True:
-            chunk = await upload.read(1024 * 1024)
+            chunk = await upload.read(_UPLOAD_CHUNK)
             if not chunk:
                 break
-            f.write(chunk)
+            size += len(chunk)
+            if size > limit:
+                raise HTTPException(status_code=413,
+                                    detail=f"文件超过 {settings.MAX_UPLOAD_MB}MB 上限")
+            await run_in_threadpool(_write_chunk, f, hasher, chunk)
+        await run_in_threadpool(f.close)
+        await run_in_threadpool(os.replace, tmp, dst)
+    except BaseException:
+        f.close()
+        await run_in_threadpool(_discard, tmp)
+        raise
+    metrics.UPLOAD_BYTES.labels(stage).inc(size)
+    metrics.UPLOAD_SECONDS.labels(stage).observe(time.perf_counter() - t0)
+    record_upload(project_id, stage, name, hasher.hexdigest(), size)
     return dst
 
+def record_upload(project_id: str, stage: str, name: str, sha256: str, size: int) -> None:
+    """登记上传文件的内容哈希，供后续阶段去重"""
+    entry = {"sha256": sha256, "size": size, "at": now_iso()}
+    def op(m: Dict[str, Any]) -> None:
+        m.setdefault("uploads", {})[f"{stage}/{name}"] = entry
+    _mutate_project_meta(project_id, op)
+
+def upload_sha256(project_id: str, path: str) -> Optional[str]:
+    """返回已登记的上传文件哈希，路径不在项目内或未登记时返回 None"""
+    rel = os.path.relpath(os.path.abspath(path), os.path.abspath(project_root(project_id)))
+    entry = load_project_meta(project_id).get("uploads", {}).get(rel.replace(os.sep, "/"))
+    return entry.get("sha256") if entry else None
+
 def save_job_meta(project_id: str, meta: Dict[str, Any]) -> None:
     update_project_meta(project_id, patch=meta)
 
 def write_result(project_id: str, payload: Dict[str, Any]) -> None:
-    p = result_json_path(project_id)
-    with open(p, "w", encoding="utf-8") as f:
-        json.dump(payload, f, ensure_ascii=False, indent=2)
+    _write_json_atomic(result_json_path(project_id), payload)
 
 def read_result(project_id: str) -> Optional[Dict[str, Any]]:
     p = result_json_path(project_id)
@@ -126,6 +369,21 @@ def file_url(project_id: str, stage: str, filename: str) -> str:
     """生成文件访问URL，与路由统一"""
     return f"/hachimi_ai_mad/projects/{project_id}/{stage}/{filename}"
 
+# 波形峰值 sidecar 放在项目 waveform/ 目录，摘要记在 meta["waveforms"]["<stage>/<file>"]
+_WAVEFORM_DIR = "waveform"
+
+def analyze_artifact(project_id: str, stage: str, filename: str) -> Dict[str, Any]:
+    """为阶段产出的音频生成多级峰值文件并登记响度摘要"""
+    src = os.path.join(stage_dir(project_id, stage), filename)
+    peaks_name = waveform.sidecar_name(stage, filename)
+    summary = waveform.write_sidecar(
+        src, os.path.join(project_root(project_id), _WAVEFORM_DIR, peaks_name))
+    summary["peaks_url"] = file_url(project_id, _WAVEFORM_DIR, peaks_name)
+    def op(m: Dict[str, Any]) -> None:
+        m.setdefault("waveforms", {})[f"{stage}/{filename}"] = copy.deepcopy(summary)
+    _mutate_project_meta(project_id, op)
+    return summary
+
 def list_artifacts(project_id: str) -> Dict[str, Any]:
     ensure_project_initialized(project_id)
     root = project_root(project_id)
@@ -134,7 +392,7 @@ def list_artifacts(project_id: str) -> Dict[str, Any]:
     # 扫描目录中的文件
     for stage in os.listdir(root):
         sd = os.path.join(root, stage)
-        if not os.path.isdir(sd):
+        if not os.path.isdir(sd) or stage == _WAVEFORM_DIR:
             continue
         files = {}
         for fn in os.listdir(sd):
@@ -151,16 +409,47 @@ def list_artifacts(project_id: str) -> Dict[str, Any]:
         if entry.get("skipped"):
             stages[stg]["skipped"] = True
             stages[stg]["at"] = entry.get("at")
+    for key, summary in meta.get("waveforms", {}).items():
+        stg, _, fn = key.partition("/")
+        if stg in stages:
+            stages[stg].setdefault("waveforms", {})[fn] = summary
     
     return stages
 
-def serve_file(project_id: str, kind: str, filename: str) -> FileResponse:
-    """文件响应接口，参数名与路由统一"""
-    sd = stage_dir(project_id, kind)
-    fp = _safe_join(sd, filename)
-    if not os.path.exists(fp):
+def _stat_file(fp: str) -> os.stat_result:
+    try:
+        st = os.stat(fp)
+    except (FileNotFoundError, NotADirectoryError):
+        raise HTTPException(status_code=404, detail="file not found")
+    if not stat.S_ISREG(st.st_mode):
         raise HTTPException(status_code=404, detail="file not found")
-    return FileResponse(fp, filename=os.path.basename(fp))
+    return st
+
+def _rendition(fp: str, st: os.stat_result,
+               fmt: Optional[str]) -> Tuple[str, os.stat_result, Dict[str, Any]]:
+    """fmt 为压缩格式时换成转码副本(首次请求现场编码)；编码器不可用时退回原文件"""
+    if not fmt or fmt == "wav" or not fp.endswith(".wav"):
+        return fp, st, {"filename": os.path.basename(fp)}
+    try:
+        out = transcode.transcode(fp, fmt, st)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"unsupported format {fmt!r}")
+    except transcode.TranscodeError:
+        raise HTTPException(status_code=502, detail="转码失败")
+    if out is None:
+        return fp, st, {"filename": os.path.basename(fp),
+                        "headers": {"X-Transcode-Fallback": "wav"}}
+    name = f"{os.path.splitext(os.path.basename(fp))[0]}.{transcode.FORMATS[fmt][0]}"
+    return out, os.stat(out), {"filename": name, "media_type": transcode.media_type(fmt)}
+
+def serve_file(project_id: str, kind: str, filename: str,
+               fmt: Optional[str] = None) -> CachedFileResponse:
+    """文件响应接口，参数名与路由统一；只读访问，不触发项目目录初始化"""
+    if not kind or kind in (".", "..") or "/" in kind or os.sep in kind:
+        raise HTTPException(status_code=400, detail="invalid path")
+    fp = _safe_join(_safe_join(project_root(project_id), kind), filename)
+    fp, st, extra = _rendition(fp, _stat_file(fp), fmt)
+    return CachedFileResponse(fp, stat_result=st, **extra)
 
 # 发布功能
 def _pub_dir(public_id: str) -> str:
@@ -169,90 +458,94 @@ def _pub_dir(public_id: str) -> str:
     return d
 
 def publish_job(project_id: str) -> Dict[str, Any]:
-    """发布任务结果，返回完整JSON"""
-    # 查找预览文件
-    preview_candidates = []
-    for stage in ("preview", "synth", "mix"):
-        sd = stage_dir(project_id, stage)
-        if not os.path.isdir(sd):
-            continue
-        for fn in os.listdir(sd):
-            if fn.endswith(".wav"):
-                preview_candidates.append((stage, fn))
-    if not preview_candidates:
+    """发布任务结果，返回完整JSON；发布文件链接到项目产物，不复制字节"""
+    root = project_root(project_id)
+    # 固定选取：结果用合成的 fullmix，预览用预览阶段产物(缺失时退回 fullmix)
+    result_src = os.path.join(root, "synth", "fullmix.wav")
+    preview_src = os.path.join(root, "preview", "preview.wav")
+    if not os.path.isfile(result_src):
         raise FileNotFoundError("no artifacts to publish")
+    if not os.path.isfile(preview_src):
+        preview_src = result_src
     
     public_id = project_id
     pub = _pub_dir(public_id)
-    stage, fn = preview_candidates[0]
-    
-    # 复制文件到发布目录
-    shutil.copy2(os.path.join(stage_dir(project_id, stage), fn), os.path.join(pub, "preview.wav"))
-    shutil.copy2(os.path.join(stage_dir(project_id, stage), fn), os.path.join(pub, "result.wav"))
+    link_or_copy(preview_src, os.path.join(pub, "preview.wav"))
+    link_or_copy(result_src, os.path.join(pub, "result.wav"))
     
     # 构建完整元数据
     project_meta = load_project_meta(project_id)
+    # 波形峰值随音频一起链接过去，摘要写进展示区元数据
+    waveforms = {}
+    for kind, src in (("preview", preview_src), ("result", result_src)):
+        stage, fn = os.path.relpath(src, root).split(os.sep, 1)
+        summary = project_meta.get("waveforms", {}).get(f"{stage}/{fn}")
+        peaks_src = os.path.join(root, _WAVEFORM_DIR, waveform.sidecar_name(stage, fn))
+        if summary is None or not os.path.isfile(peaks_src):
+            continue
+        dst = os.path.join(pub, f"{kind}.peaks")
+        link_or_copy(peaks_src, dst)
+        peaks_v = file_version(os.stat(dst))
+        waveforms[kind] = {
+            **summary,
+            "peaks_url": f"/hachimi_ai_mad/showcase/{public_id}/{kind}/peaks?v={peaks_v}",
+        }
+    preview_v = file_version(os.stat(os.path.join(pub, "preview.wav")))
+    result_v = file_version(os.stat(os.path.join(pub, "result.wav")))
     meta = {
         "public_id": public_id,
         "project_id": project_id,
         "project_name": project_meta.get("project_name", "Unknown"),
         "pen_name": project_meta.get("pen_name", "Anonymous"),
-        "published_at": _dt.datetime.now(_dt.timezone.utc).isoformat().replace('+00:00', 'Z'),
-        "preview_url": f"/hachimi_ai_mad/showcase/{public_id}/preview",
-        "result_url": f"/hachimi_ai_mad/showcase/{public_id}/result",
+        "published_at": now_iso(),
+        # 带内容版本号的地址可被 CDN/浏览器长期缓存，重新发布后地址随之变化
+        "preview_url": f"/hachimi_ai_mad/showcase/{public_id}/preview?v={preview_v}",
+        "result_url": f"/hachimi_ai_mad/showcase/{public_id}/result?v={result_v}",
         "created_at": project_meta.get("created_at"),
-        "is_featured": project_meta.get("is_featured", False)
+        "is_featured": project_meta.get("is_featured", False),
+        "waveform": waveforms,
     }
     
     # 保存发布元数据
-    with open(os.path.join(pub, "meta.json"), "w", encoding="utf-8") as f:
-        json.dump(meta, f, ensure_ascii=False, indent=2)
+    _write_json_atomic(os.path.join(pub, "meta.json"), meta)
+    meta_index.upsert_published(meta)
     
     return meta
 
 def list_published() -> Any:
-    base = settings.PUBLISH_DIR
-    if not os.path.isdir(base):
-        return []
-    items = []
-    for pid in os.listdir(base):
-        pr = os.path.join(base, pid)
-        if not os.path.isdir(pr):
-            continue
-        meta_file = os.path.join(pr, "meta.json")
-        if os.path.exists(meta_file):
-            with open(meta_file, "r", encoding="utf-8") as f:
-                items.append(json.load(f))
-    items.sort(key=lambda m: m.get("published_at") or "", reverse=True)
-    return items
+    return meta_index.all_published()
 
-def serve_published(public_id: str, filename: str) -> FileResponse:
-    """返回已发布项目的文件，参数名统一为public_id"""
+def list_published_page(limit: int = 20, cursor: Optional[str] = None) -> Dict[str, Any]:
+    """展示区分页，cursor 非法时抛 ValueError"""
+    items, next_cursor = meta_index.published_page(limit, cursor)
+    return {"items": items, "next_cursor": next_cursor}
+
+def serve_published(public_id: str, filename: str, version: Optional[str] = None,
+                    fmt: Optional[str] = None) -> CachedFileResponse:
+    """返回已发布项目的文件，参数名统一为public_id；带版本号且匹配时允许长期缓存"""
     fp = _safe_join(os.path.join(settings.PUBLISH_DIR, public_id), filename)
-    if not os.path.exists(fp):
-        raise HTTPException(status_code=404, detail="file not found")
-    return FileResponse(fp, filename=os.path.basename(fp))
+    st = _stat_file(fp)
+    # 版本号按源文件计算，压缩副本随源文件一起失效
+    immutable = version is not None and version == file_version(st)
+    fp, st, extra = _rendition(fp, st, fmt)
+    if "X-Transcode-Fallback" in extra.get("headers", {}):
+        # 编码器不可用时同一 URL 暂时返回 WAV，不能让客户端长期缓存
+        immutable = False
+    cache_control = IMMUTABLE_CACHE if immutable else REVALIDATE_CACHE
+    return CachedFileResponse(fp, stat_result=st, cache_control=cache_control, **extra)
+
+def warm_published(public_id: str) -> Dict[str, Any]:
+    """发布后预先转码预览/结果，首个访客不用等编码"""
+    pub = os.path.join(settings.PUBLISH_DIR, public_id)
+    done = transcode.warm([os.path.join(pub, "preview.wav"), os.path.join(pub, "result.wav")])
+    return {os.path.basename(src): sorted(fmts) for src, fmts in done.items()}
 
 def feature_project(project_id: str) -> Dict[str, Any]:
-    meta = load_project_meta(project_id)
-    meta["is_featured"] = True
-    save_project_meta(project_id, meta)
-    return meta
+    return update_project_meta(project_id, {"is_featured": True})
 
 def list_recent_projects(limit: int = 40) -> Any:
-    base = os.path.join(settings.TEMP_DIR, "projects")
-    if not os.path.isdir(base):
-        return []
-    items = []
-    for pid in os.listdir(base):
-        pr = os.path.join(base, pid)
-        if not os.path.isdir(pr):
-            continue
-        meta = load_project_meta(pid)
-        items.append(meta)
-    items.sort(key=lambda m: m.get("created_at") or "", reverse=True)
-    return items[:limit]
+    """按 created_at 倒序取最近项目，走索引不扫目录"""
+    return meta_index.recent_projects(limit)
 
 def list_featured_projects(limit: int = 40) -> Any:
-    featured = [m for m in list_recent_projects(1000) if m.get("is_featured")]
-    return featured[:limit]
\ No newline at end of file
+    return meta_index.featured_projects(limit)
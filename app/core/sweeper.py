@@ -0,0 +1,156 @@
+import argparse
+import datetime as _dt
+import logging
+import os
+import shutil
+import sys
+import time
+from typing import Any, Dict, Optional
+
+from app.core import meta_index, metrics, storage
+from app.core.config import settings
+
+log = logging.getLogger(__name__)
+
+# 按 RESULT_TTL_HOURS / PUBLISHED_TTL_DAYS 清理过期项目与发布条目
+# 通过元数据索引按时间范围分批取候选，不扫描目录；删除有速率上限，避免抢占磁盘 I/O
+
+def _iso(t: _dt.datetime) -> str:
+    return t.astimezone(_dt.timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+def _parse_iso(s: Optional[str]) -> Optional[_dt.datetime]:
+    if not s:
+        return None
+    try:
+        return _dt.datetime.fromisoformat(s.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+
+def _tree_bytes(root: str) -> int:
+    """统计删除后真正能回收的字节：仍被硬链接引用的文件不计入"""
+    total = 0
+    for dirpath, _, filenames in os.walk(root):
+        for fn in filenames:
+            try:
+                st = os.lstat(os.path.join(dirpath, fn))
+            except OSError:
+                continue
+            if st.st_nlink <= 1:
+                total += st.st_size
+    return total
+
+class _RateLimiter:
+    def __init__(self, per_sec: float):
+        self.interval = 1.0 / per_sec if per_sec > 0 else 0.0
+        self._next = time.monotonic()
+
+    def wait(self) -> None:
+        if not self.interval:
+            return
+        now = time.monotonic()
+        if now < self._next:
+            time.sleep(self._next - now)
+        self._next = max(now, self._next) + self.interval
+
+def _is_running(meta: Dict[str, Any], now: _dt.datetime) -> bool:
+    if meta.get("job_status") != "RUNNING":
+        return False
+    # 超过任务硬超时两倍仍是 RUNNING，视为 worker 崩溃遗留，可以回收
+    started = _parse_iso(meta.get("job_started_at")) or _parse_iso(meta.get("created_at"))
+    if started is None:
+        return True
+    return (now - started).total_seconds() < 2 * settings.CELERY_TASK_TIME_LIMIT
+
+def sweep_projects(now: Optional[_dt.datetime] = None, dry_run: bool = False,
+                   limiter: Optional[_RateLimiter] = None,
+                   budget: Optional[int] = None) -> Dict[str, int]:
+    now = now or _dt.datetime.now(_dt.timezone.utc)
+    cutoff = _iso(now - _dt.timedelta(hours=settings.RESULT_TTL_HOURS))
+    limiter = limiter or _RateLimiter(settings.SWEEP_MAX_DELETES_PER_SEC)
+    budget = settings.SWEEP_MAX_PER_RUN if budget is None else budget
+    stats = {"projects_deleted": 0, "projects_skipped_running": 0, "project_bytes": 0}
+    after = None
+    while budget > 0:
+        batch = meta_index.projects_created_before(
+            cutoff, after, limit=min(settings.SWEEP_BATCH_SIZE, budget))
+        if not batch:
+            break
+        for created_at, pid, meta in batch:
+            after = (created_at, pid)
+            if _is_running(meta, now):
+                stats["projects_skipped_running"] += 1
+                continue
+            limiter.wait()
+            root = storage.project_root(pid)
+            stats["project_bytes"] += _tree_bytes(root)
+            if not dry_run:
+                with storage.project_lock(pid):
+                    shutil.rmtree(root, ignore_errors=True)
+                meta_index.delete_project(pid)
+                storage.forget_project(pid)
+            stats["projects_deleted"] += 1
+            budget -= 1
+    return stats
+
+def sweep_published(now: Optional[_dt.datetime] = None, dry_run: bool = False,
+                    limiter: Optional[_RateLimiter] = None,
+                    budget: Optional[int] = None) -> Dict[str, int]:
+    stats = {"published_deleted": 0, "published_bytes": 0}
+    if not settings.PUBLISHED_TTL_DAYS:  # None/0 表示发布内容永久保留
+        return stats
+    now = now or _dt.datetime.now(_dt.timezone.utc)
+    cutoff = _iso(now - _dt.timedelta(days=settings.PUBLISHED_TTL_DAYS))
+    limiter = limiter or _RateLimiter(settings.SWEEP_MAX_DELETES_PER_SEC)
+    budget = settings.SWEEP_MAX_PER_RUN if budget is None else budget
+    after = None
+    while budget > 0:
+        batch = meta_index.published_before(
+            cutoff, after, limit=min(settings.SWEEP_BATCH_SIZE, budget))
+        if not batch:
+            break
+        for published_at, public_id, _ in batch:
+            after = (published_at, public_id)
+            limiter.wait()
+            root = os.path.join(settings.PUBLISH_DIR, public_id)
+            stats["published_bytes"] += _tree_bytes(root)
+            if not dry_run:
+                shutil.rmtree(root, ignore_errors=True)
+                meta_index.delete_published(public_id)
+            stats["published_deleted"] += 1
+            budget -= 1
+    return stats
+
+def sweep(now: Optional[_dt.datetime] = None, dry_run: bool = False) -> Dict[str, Any]:
+    """执行一轮清理，返回删除数量、回收字节与耗时"""
+    t0 = time.monotonic()
+    limiter = _RateLimiter(settings.SWEEP_MAX_DELETES_PER_SEC)
+    stats: Dict[str, Any] = {}
+    stats.update(sweep_projects(now, dry_run, limiter))
+    stats.update(sweep_published(now, dry_run, limiter))
+    stats["reclaimed_bytes"] = stats["project_bytes"] + stats["published_bytes"]
+    if not dry_run:
+        metrics.SWEEP_DELETED.labels("project").inc(stats["projects_deleted"])
+        metrics.SWEEP_DELETED.labels("published").inc(stats["published_deleted"])
+        metrics.SWEEP_RECLAIMED_BYTES.labels("project").inc(stats["project_bytes"])
+        metrics.SWEEP_RECLAIMED_BYTES.labels("published").inc(stats["published_bytes"])
+    stats["seconds"] = round(time.monotonic() - t0, 3)
+    stats["dry_run"] = dry_run
+    log.info("sweep finished: %s", stats)
+    return stats
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="清理过期项目与发布条目")
+    ap.add_argument("--dry-run", action="store_true", help="只统计，不删除")
+    ap.add_argument("--loop", action="store_true",
+                    help="常驻运行，按 SWEEP_INTERVAL_MINUTES 间隔执行")
+    args = ap.parse_args(argv)
+    from app.core.logging import setup_logging
+    setup_logging()
+    while True:
+        sweep(dry_run=args.dry_run)
+        if not args.loop:
+            return 0
+        time.sleep(settings.SWEEP_INTERVAL_MINUTES * 60)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,19 +1,89 @@
-from app.workers.celery_app import celery_app
-from app.core.pipeline_stub import run_pipeline_stub, STEPS
+import logging
+import time
 
+from app.core import events, metrics, storage, transcode
+from app.core.config import settings
+from app.core.pipeline_stub import STEPS, stub_quantize_midi, stub_separate, stub_synthesize
+from app.core.pipeline_stub import run_pipeline_stub as _run_pipeline_stub
 from app.workers.celery_app import celery_app
-from app.core.pipeline_stub import run_pipeline_stub as _run_pipeline_stub, STEPS
+from app.workers.queues import PRIORITY_BACKGROUND
 
-@celery_app.task(name="tasks.run_pipeline", bind=True)
-def run_pipeline_task(self, project_id: str, in_path: str, bpm: int) -> dict:
+log = logging.getLogger(__name__)
+
+def run_pipeline_job(project_id: str, in_path: str, bpm: int, update_state) -> dict:
+    """流水线任务体；update_state(state, meta) 由执行后端提供(celery 任务或本地任务池)"""
     total = len(STEPS)
 
     def on_step(step: str, index: int):
         progress = round(index / total, 4)
-        self.update_state(state="PROGRESS", meta={"stage": step, "progress": progress})
+        update_state(state="PROGRESS", meta={"stage": step, "progress": progress})
+        events.publish(project_id, "progress",
+                       {"status": "PROGRESS", "stage": step, "progress": progress})
+
+    update_state(state="STARTED", meta={"stage": "boot", "progress": 0.0})
+    enqueued_at = storage.load_project_meta(project_id).get("enqueued_at")
+    if enqueued_at:
+        metrics.QUEUE_WAIT_SECONDS.observe(max(0.0, time.time() - enqueued_at))
+    events.publish(project_id, "status", {"status": "STARTED", "stage": "boot", "progress": 0.0})
+    # 记录运行状态，过期清理会跳过仍在运行的项目
+    storage.update_project_meta(project_id,
+                                {"job_status": "RUNNING", "job_started_at": storage.now_iso()})
+    t0 = time.monotonic()
+    try:
+        payload = _run_pipeline_stub(project_id, in_path, bpm, on_step=on_step)
+    except Exception as e:
+        storage.update_project_meta(project_id, {"job_status": "FAILED"})
+        metrics.JOB_SECONDS.labels("FAILED").observe(time.monotonic() - t0)
+        events.publish(project_id, "status", {"status": "FAILED", "message": str(e)})
+        raise
+    # 耗时供准入控制估算排队时间
+    job_seconds = time.monotonic() - t0
+    metrics.JOB_SECONDS.labels("SUCCEEDED").observe(job_seconds)
+    storage.update_project_meta(project_id,
+                                {"job_status": "SUCCEEDED", "job_seconds": round(job_seconds, 3)})
+    events.publish(project_id, "status",
+                   {"status": "SUCCEEDED", "progress": 1.0, "urls": payload.get("urls", {})})
+    return payload
+
+@celery_app.task(name="tasks.run_pipeline", bind=True)
+def run_pipeline_task(self, project_id: str, in_path: str, bpm: int) -> dict:
+    return run_pipeline_job(project_id, in_path, bpm, update_state=self.update_state)
+
+# ========== 阶段级任务：按 app/workers/queues.py 路由到各自队列 ==========
+@celery_app.task(name="tasks.stage_separate")
+def stage_separate_task(project_id: str, bpm: int, allow_missing: bool = False) -> dict:
+    return stub_separate(project_id, bpm=bpm, allow_missing=allow_missing)
+
+@celery_app.task(name="tasks.stage_synthesize")
+def stage_synthesize_task(project_id: str, fmt: str = "wav", allow_missing: bool = False) -> dict:
+    return stub_synthesize(project_id, fmt=fmt, allow_missing=allow_missing)
+
+@celery_app.task(name="tasks.stage_quantize_midi")
+def stage_quantize_midi_task(project_id: str, filename: str, bpm: int) -> dict:
+    return stub_quantize_midi(project_id, filename, bpm)
 
-    self.update_state(state="STARTED", meta={"stage": "boot", "progress": 0.0})
-    payload = _run_pipeline_stub(project_id, in_path, bpm, on_step=on_step)
+@celery_app.task(name="tasks.publish")
+def publish_task(project_id: str) -> dict:
+    payload = storage.publish_job(project_id)
+    # 预热压缩副本另起低优先级任务，不拖慢发布响应；eager 模式下子任务会在本请求里同步执行，
+    # 此时不预热，由首个访客请求时编码
+    inline = settings.CELERY_EAGER and settings.EXECUTION_BACKEND != "local"
+    if settings.TRANSCODE_PUBLISH_FORMATS and transcode.encoder_available() and not inline:
+        from app.workers import dispatch
+        from app.workers.local_executor import QueueFull
+        try:
+            dispatch.submit(transcode_published_task, {"public_id": payload["public_id"]},
+                            priority=PRIORITY_BACKGROUND)
+        except QueueFull:
+            # 发布已经完成，预热只是优化，任务池满时跳过
+            log.warning("transcode warm-up for %s skipped: queue full", payload["public_id"])
     return payload
 
+@celery_app.task(name="tasks.transcode_published")
+def transcode_published_task(public_id: str) -> dict:
+    return storage.warm_published(public_id)
 
+@celery_app.task(name="tasks.sweep_expired")
+def sweep_expired_task(dry_run: bool = False) -> dict:
+    from app.core.sweeper import sweep
+    return sweep(dry_run=dry_run)
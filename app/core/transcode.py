@@ -0,0 +1,183 @@
+import logging
+import os
+import shutil
+import sqlite3
+import subprocess
+import threading
+import time
+import uuid
+from concurrent.futures import Future
+from typing import Dict, Iterable, List, Optional
+
+from app.core import metrics
+from app.core.config import settings
+from app.core.http_files import file_version
+from app.core.meta_index import open_db
+
+log = logging.getLogger(__name__)
+
+# 压缩格式转码：WAV 产物首次以压缩格式请求时(或发布时预热)调用本地 ffmpeg 生成，
+# 副本放在源文件旁的 .renditions/ 下，文件名带源文件版本，源被替换后旧副本自然失效，
+# 按 LRU 总量回收。
+# 同一副本的并发请求只编码一次；ffmpeg 不可用时调用方退回原 WAV。
+
+# 格式 -> (扩展名, Content-Type, ffmpeg 编码参数)；临时文件扩展名是 .tmp，需显式指定封装格式
+FORMATS = {
+    "mp3": ("mp3", "audio/mpeg", ("-c:a", "libmp3lame", "-b:a", "128k", "-f", "mp3")),
+    "opus": ("opus", "audio/ogg", ("-c:a", "libopus", "-b:a", "64k", "-f", "ogg")),
+}
+RENDITIONS_DIR = ".renditions"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS renditions (
+    path      TEXT PRIMARY KEY,
+    bytes     INTEGER NOT NULL,
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_renditions_lru ON renditions(last_used);
+"""
+
+class TranscodeError(RuntimeError):
+    pass
+
+_inflight_lock = threading.Lock()
+_inflight: Dict[str, Future] = {}
+_slots_lock = threading.Lock()
+_slots: Optional[threading.BoundedSemaphore] = None
+
+def _ledger() -> sqlite3.Connection:
+    return open_db(os.path.join(settings.TEMP_DIR, "transcode.sqlite3"), _SCHEMA)
+
+def _encoder_slots() -> threading.BoundedSemaphore:
+    global _slots
+    with _slots_lock:
+        if _slots is None:
+            _slots = threading.BoundedSemaphore(settings.TRANSCODE_WORKERS)
+        return _slots
+
+def encoder_available() -> bool:
+    return shutil.which(settings.TRANSCODE_FFMPEG) is not None
+
+def supported_formats() -> List[str]:
+    return ["wav", *FORMATS] if encoder_available() else ["wav"]
+
+def media_type(fmt: str) -> str:
+    return FORMATS[fmt][1] if fmt in FORMATS else "audio/wav"
+
+def rendition_path(src: str, fmt: str, st: Optional[os.stat_result] = None) -> str:
+    st = st or os.stat(src)
+    stem = os.path.splitext(os.path.basename(src))[0]
+    name = f"{stem}.{file_version(st)}.{FORMATS[fmt][0]}"
+    return os.path.join(os.path.dirname(src), RENDITIONS_DIR, name)
+
+def _touch(path: str) -> None:
+    try:
+        _ledger().execute("UPDATE renditions SET last_used = ? WHERE path = ?", (time.time(), path))
+    except sqlite3.Error:
+        log.exception("transcode ledger update failed")
+
+def _encode(src: str, fmt: str, dst: str) -> None:
+    os.makedirs(os.path.dirname(dst), exist_ok=True)
+    tmp = f"{dst}.{uuid.uuid4().hex}.tmp"
+    cmd = [settings.TRANSCODE_FFMPEG, "-nostdin", "-hide_banner", "-loglevel", "error", "-y",
+           "-i", src, "-vn", *FORMATS[fmt][2], tmp]
+    try:
+        with _encoder_slots():
+            t0 = time.perf_counter()
+            proc = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                                  timeout=settings.TRANSCODE_TIMEOUT)
+            metrics.TRANSCODE_SECONDS.labels(fmt).observe(time.perf_counter() - t0)
+        if proc.returncode != 0 or not os.path.isfile(tmp):
+            err = proc.stderr.decode("utf-8", "replace").strip()[-500:]
+            raise TranscodeError(err or f"exit {proc.returncode}")
+        os.replace(tmp, dst)
+    except subprocess.TimeoutExpired:
+        raise TranscodeError(f"encode timed out after {settings.TRANSCODE_TIMEOUT}s")
+    finally:
+        try:
+            os.remove(tmp)
+        except FileNotFoundError:
+            pass
+    try:
+        _ledger().execute(
+            "INSERT OR REPLACE INTO renditions(path, bytes, last_used) VALUES (?, ?, ?)",
+            (dst, os.path.getsize(dst), time.time()),
+        )
+    except sqlite3.Error:
+        log.exception("transcode ledger insert failed")
+    evict(keep=dst)
+
+def transcode(src: str, fmt: str, st: Optional[os.stat_result] = None) -> Optional[str]:
+    """返回 src 的 fmt 副本路径，必要时现场编码；编码器不可用返回 None，未知格式抛 ValueError"""
+    if fmt not in FORMATS:
+        raise ValueError(f"unsupported format {fmt!r}")
+    if not encoder_available():
+        metrics.TRANSCODE.labels(fmt, "fallback").inc()
+        return None
+    dst = rendition_path(src, fmt, st)
+    if os.path.isfile(dst):
+        metrics.TRANSCODE.labels(fmt, "hit").inc()
+        _touch(dst)
+        return dst
+    with _inflight_lock:
+        fut = _inflight.get(dst)
+        owner = fut is None
+        if owner:
+            fut = _inflight[dst] = Future()
+    if not owner:
+        return fut.result(timeout=settings.TRANSCODE_TIMEOUT)
+    try:
+        # 跨进程并发时可能重复编码，但结果原子替换，读方总是看到完整文件
+        if not os.path.isfile(dst):
+            _encode(src, fmt, dst)
+            metrics.TRANSCODE.labels(fmt, "encoded").inc()
+        fut.set_result(dst)
+    except BaseException as e:
+        metrics.TRANSCODE.labels(fmt, "failed").inc()
+        fut.set_exception(e)
+        raise
+    finally:
+        with _inflight_lock:
+            _inflight.pop(dst, None)
+    return dst
+
+def warm(paths: Iterable[str],
+         formats: Optional[Iterable[str]] = None) -> Dict[str, Dict[str, str]]:
+    """预先生成各格式副本(发布时调用)；单个失败只记日志，返回 {源路径: {格式: 副本路径}}"""
+    formats = [f for f in (formats or settings.TRANSCODE_PUBLISH_FORMATS.split(",")) if f.strip()]
+    out: Dict[str, Dict[str, str]] = {}
+    for src in paths:
+        for fmt in formats:
+            try:
+                dst = transcode(src, fmt.strip())
+            except (TranscodeError, ValueError, OSError):
+                log.exception("transcode %s -> %s failed", src, fmt)
+                continue
+            if dst:
+                out.setdefault(src, {})[fmt.strip()] = dst
+    return out
+
+def evict(max_bytes: Optional[int] = None, keep: Optional[str] = None) -> int:
+    """按最近使用时间淘汰副本，直到总量不超过预算；返回淘汰个数"""
+    budget = settings.TRANSCODE_CACHE_MAX_MB * 1024 * 1024 if max_bytes is None else max_bytes
+    conn = _ledger()
+    (used,) = conn.execute("SELECT COALESCE(SUM(bytes), 0) FROM renditions").fetchone()
+    if used <= budget:
+        return 0
+    removed = 0
+    rows = conn.execute("SELECT path, bytes FROM renditions ORDER BY last_used").fetchall()
+    for path, size in rows:
+        if used <= budget:
+            break
+        if path == keep:
+            continue
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        conn.execute("DELETE FROM renditions WHERE path = ?", (path,))
+        used -= size
+        removed += 1
+    if removed:
+        metrics.TRANSCODE.labels("all", "eviction").inc(removed)
+    return removed
@@ -0,0 +1,181 @@
+import hashlib
+import os
+import uuid
+from typing import Any, AsyncIterator, Dict, Optional, Tuple
+
+from fastapi import HTTPException
+from starlette.concurrency import run_in_threadpool
+
+from app.core import metrics, storage
+from app.core.config import settings
+
+# 可续传分片上传：init 预分配目标文件，各分片先落到独立临时文件，sha256 校验通过后
+# 才按偏移拼进同一文件(可并行)，校验失败的重传不会覆盖已收好的数据；
+# 整文件也校验 sha256；commit 时原子改名为正式上传文件，不再复制数据。
+# 状态记在项目 meta["resumable"] 里，断线后 GET 状态即可知道还缺哪些分片。
+# 未提交的数据文件与分片临时文件放在 uploads/.resumable/ 子目录，只扫描文件的
+# 最新上传查找不会拿到它们。
+_RESUMABLE_DIR = ".resumable"
+
+def _state(project_id: str) -> Dict[str, Any]:
+    try:
+        uuid.UUID(project_id)
+    except ValueError:
+        raise HTTPException(status_code=404, detail="upload not found")
+    if not os.path.isfile(storage.meta_path(project_id)):
+        raise HTTPException(status_code=404, detail="upload not found")
+    st = storage.load_project_meta(project_id).get("resumable")
+    if not st:
+        raise HTTPException(status_code=404, detail="upload not found")
+    return st
+
+def _data_path(project_id: str, st: Dict[str, Any]) -> str:
+    return os.path.join(storage.stage_dir(project_id, "uploads"), _RESUMABLE_DIR, st["filename"])
+
+def _part_range(st: Dict[str, Any], index: int) -> Tuple[int, int]:
+    if not 0 <= index < st["parts_total"]:
+        raise HTTPException(status_code=404, detail="part index out of range")
+    start = index * st["part_size"]
+    return start, min(start + st["part_size"], st["size"])
+
+def describe(project_id: str, st: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    st = st or _state(project_id)
+    received = sorted(int(i) for i in st["parts"])
+    return {
+        "upload_id": project_id,
+        "filename": st["filename"],
+        "size": st["size"],
+        "part_size": st["part_size"],
+        "parts_total": st["parts_total"],
+        "received": received,
+        "missing": [i for i in range(st["parts_total"]) if str(i) not in st["parts"]],
+        "status": st["status"],
+    }
+
+def init_upload(filename: str, size: int, sha256: Optional[str] = None) -> Dict[str, Any]:
+    name = os.path.basename(filename or "")
+    if not name or name.startswith("."):
+        raise HTTPException(status_code=400, detail="invalid filename")
+    if size <= 0 or size > settings.RESUMABLE_MAX_MB * 1024 * 1024:
+        raise HTTPException(status_code=413, detail=f"文件超过 {settings.RESUMABLE_MAX_MB}MB 上限")
+    part_size = settings.UPLOAD_PART_MB * 1024 * 1024
+    project_id = str(uuid.uuid4())
+    st = {
+        "filename": name,
+        "size": int(size),
+        "part_size": part_size,
+        "parts_total": -(-int(size) // part_size),
+        "sha256": sha256.lower() if sha256 else None,
+        "parts": {},
+        "status": "open",
+        "created_at": storage.now_iso(),
+    }
+    # 稀疏预分配：各分片直接写到最终偏移，提交时无需拼接
+    data = _data_path(project_id, st)
+    os.makedirs(os.path.dirname(data), exist_ok=True)
+    with open(data, "wb") as f:
+        f.truncate(st["size"])
+    storage.update_project_meta(project_id, {"resumable": st})
+    return describe(project_id, st)
+
+def _write_chunk(f, hasher, chunk: bytes) -> None:
+    hasher.update(chunk)
+    f.write(chunk)
+
+def _splice(src: str, dst: str, offset: int) -> None:
+    """把已校验的分片临时文件写到数据文件的 offset 处"""
+    fd = os.open(dst, os.O_WRONLY)
+    try:
+        with open(src, "rb") as f:
+            while True:
+                buf = f.read(1024 * 1024)
+                if not buf:
+                    break
+                view = memoryview(buf)
+                while view:
+                    n = os.pwrite(fd, view, offset)
+                    view = view[n:]
+                    offset += n
+    finally:
+        os.close(fd)
+
+def _remove(path: str) -> None:
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+async def write_part(project_id: str, index: int, body: AsyncIterator[bytes],
+                     part_sha256: str) -> Dict[str, Any]:
+    """请求体先流式写到分片临时文件；长度或哈希不符时直接丢弃，已登记的同一分片保持不变"""
+    st = _state(project_id)
+    if st["status"] != "open":
+        raise HTTPException(status_code=409, detail="upload already committed")
+    start, end = _part_range(st, index)
+    hasher = hashlib.sha256()
+    received = 0
+    data = _data_path(project_id, st)
+    tmp = f"{data}.part{index}.{uuid.uuid4().hex}.tmp"
+    try:
+        f = await run_in_threadpool(open, tmp, "wb")
+        try:
+            async for chunk in body:
+                if not chunk:
+                    continue
+                if received + len(chunk) > end - start:
+                    raise HTTPException(status_code=413,
+                                        detail=f"分片 {index} 应为 {end - start} 字节")
+                await run_in_threadpool(_write_chunk, f, hasher, chunk)
+                received += len(chunk)
+        finally:
+            await run_in_threadpool(f.close)
+        if received != end - start:
+            raise HTTPException(status_code=400,
+                                detail=f"分片 {index} 应为 {end - start} 字节，收到 {received}")
+        digest = hasher.hexdigest()
+        if digest != part_sha256.lower():
+            raise HTTPException(status_code=422, detail=f"分片 {index} sha256 不匹配")
+        await run_in_threadpool(_splice, tmp, data, start)
+    finally:
+        await run_in_threadpool(_remove, tmp)
+    metrics.UPLOAD_BYTES.labels("resumable").inc(end - start)
+    with storage.project_lock(project_id):
+        meta = storage.load_project_meta(project_id)
+        if meta["resumable"]["status"] != "open":
+            raise HTTPException(status_code=409, detail="upload already committed")
+        meta["resumable"]["parts"][str(index)] = digest
+        storage.save_project_meta(project_id, meta)
+    return {"index": index, "size": end - start, "sha256": digest}
+
+def commit_upload(project_id: str) -> str:
+    """校验分片齐全与整文件哈希，改名为正式上传文件并登记哈希，返回文件路径"""
+    with storage.project_lock(project_id):
+        st = _state(project_id)
+        if st["status"] != "open":
+            raise HTTPException(status_code=409, detail="upload already committed")
+        missing = describe(project_id, st)["missing"]
+        if missing:
+            raise HTTPException(status_code=409,
+                                detail={"message": "分片未上传完整", "missing": missing})
+        src = _data_path(project_id, st)
+        digest = storage.file_sha256(src)
+        if st["sha256"] and digest != st["sha256"]:
+            raise HTTPException(status_code=422, detail="整文件 sha256 不匹配")
+        dst = os.path.join(storage.stage_dir(project_id, "uploads"), st["filename"])
+        os.replace(src, dst)
+        storage.record_upload(project_id, "uploads", st["filename"], digest, st["size"])
+        storage.update_project_meta(
+            project_id, {"resumable": {**st, "status": "committed", "sha256": digest}})
+    return dst
+
+def abort_upload(project_id: str) -> None:
+    with storage.project_lock(project_id):
+        st = _state(project_id)
+        if st["status"] != "open":
+            raise HTTPException(status_code=409, detail="upload already committed")
+        try:
+            os.remove(_data_path(project_id, st))
+        except FileNotFoundError:
+            pass
+        storage.update_project_meta(
+            project_id, {"resumable": {**st, "status": "aborted", "parts": {}}})
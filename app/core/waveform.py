@@ -0,0 +1,193 @@
+import math
+import os
+import struct
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.core import audio_io
+
+# 波形峰值与响度摘要：一次流式遍历音频，同时得到
+#  - 多级 min/max 峰值(每桶 256/1024/4096/16384 帧，int8 量化)，前端按缩放级别取用
+#  - 时长、峰值/RMS(dBFS)、积分响度(LUFS，BS.1770 门限)
+# 峰值写成很小的二进制 sidecar(.peaks)，摘要存进元数据随 list_artifacts / 展示区返回
+
+LEVELS = (256, 1024, 4096, 16384)
+_MAGIC = b"HPK1"
+_HEADER = struct.Struct("<4sHHIQ")  # magic, version, 级别数, 采样率, 总帧数
+_LEVEL = struct.Struct("<II")       # 每桶帧数, 桶数
+
+def _db(x: float) -> Optional[float]:
+    return round(10 * math.log10(x), 2) if x > 0 else None
+
+# ========== K 加权(BS.1770)：两级 biquad，按任意采样率重算系数 ==========
+def k_weighting_coeffs(sr: int):
+    """返回 [(b, a), (b, a)]：高架约 +4dB@1.68kHz、高通 38Hz(与 libebur128 相同的双线性变换参数)"""
+    f0, g, q = 1681.974450955533, 3.999843853973347, 0.7071752369554196
+    k = math.tan(math.pi * f0 / sr)
+    vh = 10 ** (g / 20)
+    vb = vh ** 0.4996667741545416
+    a0 = 1 + k / q + k * k
+    shelf = ((vh + vb * k / q + k * k, 2 * (k * k - vh), vh - vb * k / q + k * k),
+             (a0, 2 * (k * k - 1), 1 - k / q + k * k))
+    f0, q = 38.13547087602444, 0.5003270373238773
+    k = math.tan(math.pi * f0 / sr)
+    a0 = 1 + k / q + k * k
+    # 规范里高通分子固定为 (1, -2, 1)，只有分母归一化
+    highpass = ((1.0, -2.0, 1.0), (1.0, 2 * (k * k - 1) / a0, (1 - k / q + k * k) / a0))
+    return [shelf, highpass]
+
+def k_weighting_impulse(sr: int, n: int) -> np.ndarray:
+    """K 加权滤波器的前 n 点冲激响应；高通约 4ms 时间常数，100ms 后残余可忽略"""
+    x = np.zeros(n)
+    x[0] = 1.0
+    for b, a in k_weighting_coeffs(sr):
+        b0, b1, b2 = (v / a[0] for v in b)
+        a1, a2 = a[1] / a[0], a[2] / a[0]
+        y = np.zeros(n)
+        x1 = x2 = y1 = y2 = 0.0
+        for i in range(n):  # 只跑一次 n 点，不在音频数据上逐点循环
+            y[i] = b0 * x[i] + b1 * x1 + b2 * x2 - a1 * y1 - a2 * y2
+            x2, x1, y2, y1 = x1, x[i], y1, y[i]
+        x = y
+    return x
+
+class _Analyzer:
+    """逐块喂入 float32 (frames, channels)，块边界不影响结果"""
+
+    def __init__(self, sr: int, channels: int):
+        self.sr = sr
+        self.channels = channels
+        self.frames = 0
+        self.sum_sq = 0.0
+        self.peak = 0.0
+        self.mins: List[np.ndarray] = []
+        self.maxs: List[np.ndarray] = []
+        self._env_carry = np.empty((0, 2), dtype=np.float32)
+        # 响度：K 加权用截断冲激响应做重叠保留 FFT 卷积(与 IIR 逐点滤波等价到 1e-9 以内)，
+        # 再按 100ms 子块累计均方；400ms 门限块由相邻 4 个子块合成
+        self.hop = max(1, sr // 10)
+        self._k = k_weighting_impulse(sr, self.hop)
+        self._k_spec: Dict[int, np.ndarray] = {}
+        self._hist = np.zeros((len(self._k) - 1, channels))
+        self._sq_carry = np.zeros(0)
+        self.energies: List[np.ndarray] = []
+
+    def _k_filter(self, block: np.ndarray) -> np.ndarray:
+        x = np.concatenate([self._hist, block])
+        nfft = 1 << (len(x) - 1).bit_length()
+        spec = self._k_spec.get(nfft)
+        if spec is None:
+            spec = self._k_spec[nfft] = np.fft.rfft(self._k, nfft)[:, None]
+        y = np.fft.irfft(np.fft.rfft(x, nfft, axis=0) * spec, nfft, axis=0)
+        self._hist = x[len(x) - len(self._hist):]
+        return y[len(self._hist):len(x)]
+
+    def feed(self, block: np.ndarray) -> None:
+        if not len(block):
+            return
+        self.frames += len(block)
+        self.sum_sq += float(np.einsum("ij,ij->", block, block, dtype=np.float64))
+        self.peak = max(self.peak, float(np.abs(block).max()))
+        # 多声道合成一条包络：每帧取各声道的 min/max
+        env = np.stack([block.min(axis=1), block.max(axis=1)], axis=1)
+        env = np.concatenate([self._env_carry, env])
+        n = len(env) // LEVELS[0] * LEVELS[0]
+        if n:
+            buckets = env[:n].reshape(-1, LEVELS[0], 2)
+            self.mins.append(buckets[:, :, 0].min(axis=1))
+            self.maxs.append(buckets[:, :, 1].max(axis=1))
+        self._env_carry = env[n:]
+
+        # 声道权重均为 1(L/R/C)，先按帧合并各声道的平方
+        sq = np.concatenate([self._sq_carry, (self._k_filter(block) ** 2).sum(axis=1)])
+        n = len(sq) // self.hop * self.hop
+        if n:
+            self.energies.append(sq[:n].reshape(-1, self.hop).mean(axis=1))
+        self._sq_carry = sq[n:]
+
+    def _peaks(self) -> List[Tuple[int, np.ndarray, np.ndarray]]:
+        mins, maxs = list(self.mins), list(self.maxs)
+        if len(self._env_carry):
+            mins.append(self._env_carry[:, 0].min(keepdims=True))
+            maxs.append(self._env_carry[:, 1].max(keepdims=True))
+        lo = np.concatenate(mins) if mins else np.zeros(0, np.float32)
+        hi = np.concatenate(maxs) if maxs else np.zeros(0, np.float32)
+        levels = [(LEVELS[0], lo, hi)]
+        for spb in LEVELS[1:]:
+            idx = np.arange(0, len(lo), spb // LEVELS[0])
+            if not len(idx):
+                levels.append((spb, lo[:0], hi[:0]))
+                continue
+            levels.append((spb, np.minimum.reduceat(lo, idx), np.maximum.reduceat(hi, idx)))
+        return levels
+
+    def _lufs(self) -> Optional[float]:
+        e = np.concatenate(self.energies) if self.energies else np.zeros(0)
+        if len(e) < 4:
+            return None
+        blocks = np.convolve(e, np.full(4, 0.25), mode="valid")  # 400ms 块，75% 重叠
+        gated = blocks[blocks > 10 ** ((-70 + 0.691) / 10)]
+        if not len(gated):
+            return None
+        rel = gated.mean() * 10 ** (-10 / 10)
+        gated = gated[gated > rel]
+        return round(-0.691 + 10 * math.log10(gated.mean()), 2)
+
+    def finish(self) -> Tuple[Dict[str, Any], bytes]:
+        levels = self._peaks()
+        summary = {
+            "duration": round(self.frames / self.sr, 3) if self.sr else 0.0,
+            "sr": self.sr,
+            "channels": self.channels,
+            "frames": self.frames,
+            "peak_dbfs": _db(self.peak * self.peak),
+            "rms_dbfs": _db(self.sum_sq / (self.frames * self.channels)) if self.frames else None,
+            "lufs": self._lufs(),
+            "levels": [spb for spb, _, _ in levels],
+        }
+        return summary, encode_peaks(self.sr, self.frames, levels)
+
+def encode_peaks(sr: int, frames: int, levels) -> bytes:
+    parts = [_HEADER.pack(_MAGIC, 1, len(levels), sr, frames)]
+    for spb, lo, hi in levels:
+        parts.append(_LEVEL.pack(spb, len(lo)))
+    for _, lo, hi in levels:
+        q = np.stack([lo, hi], axis=1) * 127.0
+        parts.append(np.clip(np.round(q), -127, 127).astype(np.int8).tobytes())
+    return b"".join(parts)
+
+def decode_peaks(data: bytes) -> Dict[str, Any]:
+    """解析 .peaks：返回 {sr, frames, levels: {每桶帧数: int8 (桶数, 2) 的 [min, max]}}"""
+    magic, _, n_levels, sr, frames = _HEADER.unpack_from(data, 0)
+    if magic != _MAGIC:
+        raise ValueError("not a peaks file")
+    off = _HEADER.size
+    dims = []
+    for _ in range(n_levels):
+        dims.append(_LEVEL.unpack_from(data, off))
+        off += _LEVEL.size
+    levels = {}
+    for spb, n in dims:
+        levels[spb] = np.frombuffer(data, dtype=np.int8, count=2 * n, offset=off).reshape(n, 2)
+        off += 2 * n
+    return {"sr": sr, "frames": frames, "levels": levels}
+
+def analyze(path: str, block_frames: int = audio_io.BLOCK_FRAMES) -> Tuple[Dict[str, Any], bytes]:
+    """流式分析 WAV，返回 (摘要, .peaks 二进制)"""
+    info = audio_io.wav_info(path)
+    an = _Analyzer(info.sr, info.channels)
+    for block in audio_io.iter_blocks(path, block_frames):
+        an.feed(block)
+    return an.finish()
+
+def sidecar_name(stage: str, filename: str) -> str:
+    return f"{stage}.{os.path.splitext(filename)[0]}.peaks"
+
+def write_sidecar(audio_path: str, peaks_path: str) -> Dict[str, Any]:
+    """分析 audio_path 并原子写出 peaks_path，返回摘要"""
+    summary, blob = analyze(audio_path)
+    os.makedirs(os.path.dirname(peaks_path), exist_ok=True)
+    with audio_io.atomic_open(peaks_path) as f:
+        f.write(blob)
+    return summary
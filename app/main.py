@@ -1,14 +1,39 @@
-from fastapi import FastAPI
-from app.core.logging import setup_logging
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, Response
+from starlette.concurrency import run_in_threadpool
+
 from app.api.routes import router as api_router
+from app.core import metrics
+from app.core.admission import AdmissionMiddleware
+from app.core.config import settings
+from app.core.logging import setup_logging
+from app.workers import local_executor
 
 setup_logging()
-app = FastAPI(title="hachimi_ai_mad")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # local 执行后端：任务池随应用启动，退出时等待运行中的任务收尾
+    if settings.EXECUTION_BACKEND == "local":
+        local_executor.get_executor()
+    yield
+    await run_in_threadpool(local_executor.shutdown_executor)
+
+app = FastAPI(title="hachimi_ai_mad", lifespan=lifespan)
+app.add_middleware(AdmissionMiddleware)
+app.add_middleware(metrics.MetricsMiddleware)  # 最外层：被准入控制拒绝的请求也计入
 
 # 健康检查
 @app.get("/livez")
 def livez():
     return {"ok": True}
 
+# Prometheus 抓取
+@app.get("/metrics", include_in_schema=False)
+def prometheus_metrics():
+    body, content_type = metrics.render()
+    return Response(body, media_type=content_type)
+
 # 业务路由
-app.include_router(api_router)
\ No newline at end of file
+app.include_router(api_router)
@@ -1,8 +1,29 @@
 # app/workers/celery_app.py
 from celery import Celery
+from celery.signals import worker_process_init, worker_process_shutdown
+
 from app.core.config import settings
+from app.workers.queues import celery_queue_conf
+
+celery_app = Celery("hachimi_ai_mad", include=["app.core.task"])
+celery_app.conf.update(**celery_queue_conf())
+
+@worker_process_shutdown.connect
+def _mark_metrics_process_dead(pid=None, **kwargs):
+    # prefork 子进程退出时清理其多进程指标文件中的 live gauge
+    from app.core import metrics
+    metrics.mark_process_dead(pid)
 
-celery_app = Celery("hachimi_ai_mad")
+@worker_process_init.connect
+def _load_lyrics_model(**kwargs):
+    # 每个子进程启动时加载并校验填词模型，任务里不再付加载开销；失败只记日志，任务执行时会再报错
+    if not settings.LYRICS_PRELOAD:
+        return
+    from app.core import lyrics_model
+    try:
+        lyrics_model.load()
+    except lyrics_model.ModelError:
+        lyrics_model.log.exception("lyrics model preload failed")
 
 if settings.CELERY_EAGER:
     # 本地/测试：完全不依赖 Redis，且把 eager 结果存起来供 AsyncResult 查询
@@ -21,5 +42,20 @@ else:
         worker_concurrency=settings.CELERY_WORKER_CONCURRENCY,
         task_time_limit=settings.CELERY_TASK_TIME_LIMIT,
         task_track_started=True,
+        # 长任务：每个进程只预取一条，执行完才 ack，worker 异常退出时消息回到队列
+        worker_prefetch_multiplier=1,
+        task_acks_late=True,
+        task_reject_on_worker_lost=True,
+        broker_transport_options={
+            **celery_queue_conf()["broker_transport_options"],
+            "visibility_timeout": settings.CELERY_TASK_TIME_LIMIT * 2,
+        },
     )
+    # 过期项目/发布条目清理，由 celery beat 定时触发
+    celery_app.conf.beat_schedule = {
+        "sweep-expired": {
+            "task": "tasks.sweep_expired",
+            "schedule": settings.SWEEP_INTERVAL_MINUTES * 60,
+        },
+    }
 
@@ -0,0 +1,41 @@
+from typing import Any, Dict, Optional
+
+from celery.result import AsyncResult
+
+from app.core import task as tasks
+from app.core.config import settings
+from app.workers import local_executor
+from app.workers.celery_app import celery_app
+
+# 任务下发与状态查询的统一入口：EXECUTION_BACKEND=celery 走 broker(或 eager)，
+# local 走进程内任务池；两者返回的结果对象接口一致
+
+# 需要回写进度的任务在本地模式下用不依赖 celery 请求上下文的函数体
+_LOCAL_BOUND = {
+    "tasks.run_pipeline": tasks.run_pipeline_job,
+}
+
+def is_local() -> bool:
+    return settings.EXECUTION_BACKEND == "local"
+
+def submit(task, kwargs: Dict[str, Any], task_id: Optional[str] = None,
+           priority: Optional[int] = None):
+    """提交任务；本地模式下队列已满抛 local_executor.QueueFull"""
+    if is_local():
+        fn = _LOCAL_BOUND.get(task.name)
+        ex = local_executor.get_executor()
+        if fn is not None:
+            return ex.submit(fn, kwargs, task_id=task_id, bind=True)
+        return ex.submit(task.run, kwargs, task_id=task_id)
+    opts: Dict[str, Any] = {}
+    if priority is not None:
+        opts["priority"] = priority
+    return task.apply_async(kwargs=kwargs, task_id=task_id, **opts)
+
+def result(job_id: str):
+    if is_local():
+        res = local_executor.get_executor().get(job_id)
+        if res is not None:
+            return res
+        return local_executor.LocalResult(job_id)
+    return AsyncResult(job_id, app=celery_app)
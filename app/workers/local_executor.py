@@ -0,0 +1,137 @@
+import logging
+import threading
+import uuid
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, Optional
+
+from app.core.config import settings
+
+log = logging.getLogger(__name__)
+
+# 单机无 broker 部署用的进程内任务池：随 FastAPI 启停，有界排队，
+# 状态对外暴露与 celery AsyncResult 相同的 state/info/ready/get 接口，状态路由不用区分后端
+# 用线程池：任务里要回写进度，CPU 重的阶段可再通过 PIPELINE_PROCESS_POOL 放进 spawn 进程池
+
+class QueueFull(RuntimeError):
+    """排队任务数已达 LOCAL_QUEUE_SIZE"""
+
+class LocalResult:
+    def __init__(self, task_id: str, future: Optional[Future] = None):
+        self.id = task_id
+        self.future = future
+        self.state = "PENDING"
+        self.info: Any = None
+
+    def update_state(self, state: str, meta: Optional[Dict[str, Any]] = None) -> None:
+        self.state = state
+        self.info = meta
+
+    def ready(self) -> bool:
+        return self.state in ("SUCCESS", "FAILURE", "REVOKED")
+
+    def successful(self) -> bool:
+        return self.state == "SUCCESS"
+
+    def get(self, timeout: Optional[float] = None, disable_sync_subtasks: bool = True) -> Any:
+        # disable_sync_subtasks 仅为与 celery 结果接口一致，本地任务池不限制
+        if self.future is None:
+            raise TimeoutError(self.id)
+        return self.future.result(timeout)
+
+class LocalExecutor:
+    def __init__(self, max_workers: int, max_queue: int, max_results: int = 1024):
+        self.max_queue = max_queue
+        self.max_results = max_results
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="local-job")
+        self._lock = threading.Lock()
+        self._results: OrderedDict[str, LocalResult] = OrderedDict()
+        self._active = 0
+        self._closed = False
+
+    def active(self) -> int:
+        """排队中 + 运行中的任务数"""
+        with self._lock:
+            return self._active
+
+    def submit(self, fn: Callable[..., Any], kwargs: Dict[str, Any], task_id: Optional[str] = None,
+               bind: bool = False) -> LocalResult:
+        """bind=True 时以 update_state= 关键字参数把进度回写函数传给任务"""
+        res = LocalResult(task_id or str(uuid.uuid4()))
+        with self._lock:
+            if self._closed:
+                raise QueueFull("executor is shutting down")
+            if self._active >= self.max_queue:
+                raise QueueFull(f"{self._active} jobs queued")
+            self._active += 1
+            self._results[res.id] = res
+            self._results.move_to_end(res.id)
+            self._trim()
+        try:
+            res.future = self._pool.submit(self._run, res, fn, kwargs, bind)
+        except RuntimeError:
+            with self._lock:
+                self._active -= 1
+            raise QueueFull("executor is shutting down")
+        return res
+
+    def _run(self, res: LocalResult, fn, kwargs, bind: bool) -> Any:
+        try:
+            res.update_state("STARTED")
+            out = fn(update_state=res.update_state, **kwargs) if bind else fn(**kwargs)
+        except BaseException as e:
+            log.exception("local job %s failed", res.id)
+            res.update_state("FAILURE", e)
+            raise
+        else:
+            res.update_state("SUCCESS", out)
+            return out
+        finally:
+            with self._lock:
+                self._active -= 1
+
+    def _trim(self) -> None:
+        # 只淘汰已结束的旧结果，排队/运行中的任务始终可查
+        excess = len(self._results) - self.max_results
+        if excess <= 0:
+            return
+        for tid in [t for t, r in self._results.items() if r.ready()][:excess]:
+            del self._results[tid]
+
+    def get(self, task_id: str) -> Optional[LocalResult]:
+        with self._lock:
+            return self._results.get(task_id)
+
+    def shutdown(self, timeout: Optional[float] = None) -> None:
+        """不再接收新任务，撤销未开始的任务，最多等待 timeout 秒让运行中的任务结束"""
+        with self._lock:
+            self._closed = True
+            pending = list(self._results.values())
+        for r in pending:
+            if r.future is not None and r.future.cancel():
+                r.update_state("REVOKED", "cancelled on shutdown")
+                with self._lock:
+                    self._active -= 1
+        running = [r.future for r in pending if r.future is not None and not r.future.done()]
+        _, not_done = wait(running, timeout=timeout)
+        if not_done:
+            log.warning("local executor shutdown: %d jobs still running", len(not_done))
+        self._pool.shutdown(wait=False)
+
+_executor: Optional[LocalExecutor] = None
+_executor_lock = threading.Lock()
+
+def get_executor() -> LocalExecutor:
+    """惰性创建：不走 lifespan 的场景(测试客户端、脚本)也能直接提交"""
+    global _executor
+    with _executor_lock:
+        if _executor is None or _executor._closed:
+            _executor = LocalExecutor(settings.LOCAL_WORKERS, settings.LOCAL_QUEUE_SIZE)
+        return _executor
+
+def shutdown_executor(timeout: Optional[float] = None) -> None:
+    global _executor
+    with _executor_lock:
+        ex, _executor = _executor, None
+    if ex is not None:
+        ex.shutdown(settings.LOCAL_SHUTDOWN_TIMEOUT if timeout is None else timeout)
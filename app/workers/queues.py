@@ -0,0 +1,67 @@
+from typing import Dict
+
+from kombu import Queue
+
+from app.core.config import settings
+
+# 按阶段类型拆分队列：长耗时的整条流水线/分离不会堵住合成重试、发布等轻任务
+# 各队列可由独立的 worker 池消费(celery worker -Q <queue>)，按队列深度分别扩缩容
+QUEUES = ("pipeline", "separation", "synthesis", "publish", "maintenance")
+
+TASK_ROUTES = {
+    "tasks.run_pipeline": {"queue": "pipeline"},
+    "tasks.stage_separate": {"queue": "separation"},
+    "tasks.stage_synthesize": {"queue": "synthesis"},
+    "tasks.stage_quantize_midi": {"queue": "synthesis"},
+    "tasks.publish": {"queue": "publish"},
+    "tasks.transcode_published": {"queue": "publish"},
+    "tasks.sweep_expired": {"queue": "maintenance"},
+}
+
+MAX_PRIORITY = 9
+PRIORITY_STEPS = list(range(MAX_PRIORITY + 1))
+PRIORITY_SEP = ":"
+# Redis 传输按 0 → 9 的顺序取子列表，数值越小越先执行(与 AMQP 相反)
+# 交互式操作(阶段重试、发布)先于批量流水线，发布后的副本预热等后台任务最后
+PRIORITY_INTERACTIVE = 0
+PRIORITY_DEFAULT = 5
+PRIORITY_BACKGROUND = 9
+
+def celery_queue_conf() -> Dict:
+    return {
+        "task_queues": [Queue(q) for q in QUEUES],
+        "task_default_queue": "pipeline",
+        "task_routes": TASK_ROUTES,
+        "task_default_priority": PRIORITY_DEFAULT,
+        # Redis 传输用多个子列表模拟优先级
+        "broker_transport_options": {
+            "priority_steps": PRIORITY_STEPS,
+            "sep": PRIORITY_SEP,
+            "queue_order_strategy": "priority",
+        },
+    }
+
+def _priority_keys(queue: str):
+    # kombu 的 redis 传输：优先级 0 用队列名本身，其余为 "<queue><sep><priority>"
+    yield queue
+    for p in PRIORITY_STEPS[1:]:
+        yield f"{queue}{PRIORITY_SEP}{p}"
+
+def queue_depths() -> Dict[str, int]:
+    """各队列当前积压的消息数，供自动扩缩容/监控读取
+
+    eager 模式恒为 0，local 模式全部计入 pipeline
+    """
+    if settings.EXECUTION_BACKEND == "local":
+        from app.workers.local_executor import get_executor
+        return {q: get_executor().active() if q == "pipeline" else 0 for q in QUEUES}
+    if settings.CELERY_EAGER:
+        return {q: 0 for q in QUEUES}
+    import redis
+    r = redis.Redis.from_url(settings.broker_url)
+    pipe = r.pipeline(transaction=False)
+    for q in QUEUES:
+        for key in _priority_keys(q):
+            pipe.llen(key)
+    counts = iter(pipe.execute())
+    return {q: sum(next(counts) for _ in PRIORITY_STEPS) for q in QUEUES}
@@ -0,0 +1,79 @@
+"""基准脚本共用：分位数统计、RSS 采样、带提交号的 JSON 结果"""
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+from typing import Any, Dict, List, Optional
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.append(ROOT)
+
+def percentile(sorted_vals: List[float], q: float) -> float:
+    """线性插值分位数，sorted_vals 需已排序"""
+    if not sorted_vals:
+        return 0.0
+    k = (len(sorted_vals) - 1) * q
+    lo = int(k)
+    hi = min(lo + 1, len(sorted_vals) - 1)
+    return sorted_vals[lo] + (sorted_vals[hi] - sorted_vals[lo]) * (k - lo)
+
+def summarize(samples: List[float], wall_seconds: Optional[float] = None) -> Dict[str, float]:
+    """毫秒单位的 p50/p95/p99/mean/max；给出墙钟时间时附带吞吐(次/秒)"""
+    s = sorted(samples)
+    out = {
+        "count": len(s),
+        "p50_ms": round(percentile(s, 0.50) * 1000, 3),
+        "p95_ms": round(percentile(s, 0.95) * 1000, 3),
+        "p99_ms": round(percentile(s, 0.99) * 1000, 3),
+        "mean_ms": round(sum(s) / len(s) * 1000, 3) if s else 0.0,
+        "max_ms": round(s[-1] * 1000, 3) if s else 0.0,
+    }
+    if wall_seconds:
+        out["per_sec"] = round(len(s) / wall_seconds, 2)
+    return out
+
+def rss_bytes() -> int:
+    """当前常驻内存；没有 /proc 时退回进程峰值"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return peak_rss_bytes()
+
+def peak_rss_bytes() -> int:
+    ru = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return ru if sys.platform == "darwin" else ru * 1024  # linux 单位是 KB
+
+def _git_commit() -> Optional[str]:
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                             capture_output=True, text=True, timeout=5)
+        return out.stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+def write_results(name: str, args: Dict[str, Any], results: Dict[str, Any],
+                  out: Optional[str]) -> None:
+    """打印并(可选)保存结果；meta 里记录提交号与环境，便于 compare 跨提交比对"""
+    doc = {
+        "benchmark": name,
+        "meta": {
+            "commit": _git_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "args": args,
+        },
+        "results": results,
+    }
+    text = json.dumps(doc, indent=2, ensure_ascii=False)
+    print(text)
+    if out:
+        os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+        with open(out, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
@@ -0,0 +1,194 @@
+"""完整任务生命周期压测：upload+process → status 轮询 → download → publish → showcase
+
+在进程内驱动 ASGI 应用(不起端口)，执行后端为 eager celery 或 local 任务池，进度推送走进程内总线，
+无需 Redis。记录各接口与各阶段的 p50/p95/p99、吞吐与峰值 RSS。
+阶段并发共用一个进程，阶段峰值 RSS 取该阶段执行期间(含起止时刻)采样到的进程 RSS 最大值。
+
+用法: python -m benchmarks.bench_lifecycle [--jobs 20] [--concurrency 4] [--seconds 5]
+      [--backend eager|local] [--out .bench/lifecycle.json]
+"""
+import argparse
+import asyncio
+import dataclasses
+import io
+import tempfile
+import threading
+import time
+import wave
+from collections import defaultdict
+from typing import Dict, List
+
+import numpy as np
+
+from benchmarks._common import peak_rss_bytes, rss_bytes, summarize, write_results
+
+
+def make_wav(seconds: float, sr: int, seed: int) -> bytes:
+    """每个任务用不同噪声，避免阶段缓存命中掩盖真实耗时"""
+    n = int(seconds * sr)
+    data = (np.random.default_rng(seed).standard_normal(n) * 3000).astype("<i2")
+    buf = io.BytesIO()
+    with wave.open(buf, "wb") as wf:
+        wf.setnchannels(1)
+        wf.setsampwidth(2)
+        wf.setframerate(sr)
+        wf.writeframes(data.tobytes())
+    return buf.getvalue()
+
+class Recorder:
+    def __init__(self):
+        self.latency: Dict[str, List[float]] = defaultdict(list)
+        self.peak_rss: Dict[str, int] = defaultdict(int)
+        self.stages: Dict[str, List[float]] = defaultdict(list)
+        self.stage_rss: Dict[str, int] = defaultdict(int)
+        self.jobs: List[float] = []
+        self.errors: Dict[str, int] = defaultdict(int)
+        self._running: Dict[str, int] = defaultdict(int)  # 阶段名 -> 正在执行的个数
+        self._lock = threading.Lock()
+
+    async def call(self, name: str, coro):
+        t0 = time.perf_counter()
+        resp = await coro
+        self.latency[name].append(time.perf_counter() - t0)
+        self.peak_rss[name] = max(self.peak_rss[name], rss_bytes())
+        if resp.status_code >= 400:
+            self.errors[f"{name}:{resp.status_code}"] += 1
+        return resp
+
+    def sample_stages(self) -> None:
+        rss = rss_bytes()
+        with self._lock:
+            for name, n in self._running.items():
+                if n:
+                    self.stage_rss[name] = max(self.stage_rss[name], rss)
+
+    def wrap_stage(self, st):
+        """包一层阶段函数，登记执行区间并在起止时刻采样"""
+        def fn(ctx):
+            with self._lock:
+                self._running[st.name] += 1
+            self.sample_stages()
+            try:
+                return st.fn(ctx)
+            finally:
+                self.sample_stages()
+                with self._lock:
+                    self._running[st.name] -= 1
+        return dataclasses.replace(st, fn=fn)
+
+async def one_job(client, rec: Recorder, payload: bytes, idx: int, poll_interval: float) -> None:
+    t0 = time.perf_counter()
+    files = {"file": (f"in{idx}.wav", payload, "audio/wav")}
+    data = {"bpm": "120", "project_name": f"bench-{idx}", "pen_name": "bench"}
+    r = await rec.call("process",
+                       client.post("/hachimi_ai_mad/tasks/process", files=files, data=data))
+    if r.status_code != 201:
+        return
+    job_id = r.json()["job_id"]
+    while True:
+        s = await rec.call("status", client.get(f"/hachimi_ai_mad/tasks/{job_id}/status"))
+        if s.json().get("status") in ("SUCCEEDED", "FAILED"):
+            break
+        await asyncio.sleep(poll_interval)
+    d = await rec.call("download", client.get(f"/hachimi_ai_mad/tasks/{job_id}/download"))
+    if d.status_code == 200:
+        for stage, seconds in d.json().get("stage_timings", {}).items():
+            rec.stages[stage].append(seconds)
+    await rec.call("publish", client.post(f"/hachimi_ai_mad/tasks/{job_id}/publish"))
+    await rec.call("showcase", client.get("/hachimi_ai_mad/showcase", params={"limit": 20}))
+    rec.jobs.append(time.perf_counter() - t0)
+
+async def run(args) -> Dict:
+    import httpx
+
+    from app.core import pipeline_stub
+    from app.core.config import settings
+    from app.main import app
+    from app.workers import local_executor
+
+    rec = Recorder()
+    n_inputs = 1 if args.reuse_input else args.jobs
+    payloads = [make_wav(args.seconds, args.sr, seed) for seed in range(n_inputs)]
+    warmup = make_wav(0.1, args.sr, seed=2**31)
+    sem = asyncio.Semaphore(args.concurrency)
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench",
+                                 timeout=None) as client:
+        async def bounded(i: int) -> None:
+            async with sem:
+                await one_job(client, rec, payloads[i % n_inputs], i, args.poll_interval)
+
+        # 预热：导入、索引建表等一次性开销不计入
+        await one_job(client, Recorder(), warmup, -1, args.poll_interval)
+        original = pipeline_stub.PIPELINE
+        stop = threading.Event()
+        sampler = None
+        if not settings.PIPELINE_PROCESS_POOL:  # 进程池里的阶段不占本进程内存，也无法包装
+            pipeline_stub.PIPELINE = [rec.wrap_stage(st) for st in original]
+
+            def sample() -> None:
+                while not stop.wait(args.rss_interval):
+                    rec.sample_stages()
+            sampler = threading.Thread(target=sample, name="rss-sampler", daemon=True)
+            sampler.start()
+        t0 = time.perf_counter()
+        try:
+            await asyncio.gather(*(bounded(i) for i in range(args.jobs)))
+        finally:
+            wall = time.perf_counter() - t0
+            stop.set()
+            if sampler is not None:
+                sampler.join()
+            pipeline_stub.PIPELINE = original
+    local_executor.shutdown_executor()
+
+    endpoints = {}
+    for name, samples in rec.latency.items():
+        endpoints[name] = {**summarize(samples, wall),
+                           "peak_rss_mb": round(rec.peak_rss[name] / 1e6, 1)}
+    return {
+        "wall_seconds": round(wall, 3),
+        "jobs": {**summarize(rec.jobs, wall), "completed": len(rec.jobs)},
+        "endpoints": endpoints,
+        "stages": {
+            name: {**summarize(samples), "peak_rss_mb": round(rec.stage_rss[name] / 1e6, 1)}
+            for name, samples in rec.stages.items()
+        },
+        "errors": dict(rec.errors),
+        "peak_rss_mb": round(peak_rss_bytes() / 1e6, 1),
+    }
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--jobs", type=int, default=20)
+    ap.add_argument("--concurrency", type=int, default=4)
+    ap.add_argument("--seconds", type=float, default=5.0, help="输入音频时长")
+    ap.add_argument("--sr", type=int, default=44100)
+    ap.add_argument("--backend", choices=("eager", "local"), default="eager")
+    ap.add_argument("--workers", type=int, default=4, help="local 后端的任务池线程数")
+    ap.add_argument("--poll-interval", type=float, default=0.02)
+    ap.add_argument("--rss-interval", type=float, default=0.01, help="阶段 RSS 采样间隔(秒)")
+    ap.add_argument("--reuse-input", action="store_true", help="复用同一批输入(测阶段缓存命中路径)")
+    ap.add_argument("--out", default=None, help="结果 JSON 保存路径")
+    args = ap.parse_args()
+
+    from app.core.config import settings
+    tmp = tempfile.TemporaryDirectory(prefix="hachimi-bench-")
+    settings.TEMP_DIR = f"{tmp.name}/tmp"
+    settings.PUBLISH_DIR = f"{tmp.name}/publish"
+    settings.ADMISSION_ENABLED = False
+    settings.MAX_UPLOAD_MB = max(settings.MAX_UPLOAD_MB, int(args.seconds * args.sr * 2 / 1e6) + 1)
+    settings.EVENTS_BACKEND = "memory"
+    settings.EXECUTION_BACKEND = "local" if args.backend == "local" else "celery"
+    settings.CELERY_EAGER = 1  # 需在导入 app 之前设置，celery_app 导入时按它选择配置
+    settings.LOCAL_WORKERS = args.workers
+    settings.LOCAL_QUEUE_SIZE = max(settings.LOCAL_QUEUE_SIZE, args.concurrency + 1)
+    try:
+        results = asyncio.run(run(args))
+    finally:
+        tmp.cleanup()
+    write_results("lifecycle", vars(args), results, args.out)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""MIDI 量化引擎基准：解析 → 量化清理 → 编码，在 10k/100k/1M 音符规模下
+
+输入是带时值抖动、和弦重叠、超音域音符的随机演奏，量化路径上每一步都有实际工作量。
+
+用法: python -m benchmarks.bench_midi [--sizes 10000,100000,1000000] [--repeat 5]
+                                     [--out .bench/midi.json]
+"""
+import argparse
+import time
+from typing import Callable, Dict, List
+
+import numpy as np
+
+from benchmarks._common import peak_rss_bytes, summarize, write_results
+
+
+def make_performance(n: int, bpm: float, seed: int) -> bytes:
+    from app.core import midi
+    rng = np.random.default_rng(seed)
+    step = 60.0 / bpm / 4
+    cells = np.sort(rng.integers(0, n * 2, n))
+    onset = np.clip(cells * step + rng.normal(0, step / 6, n), 0, None)
+    duration = np.clip(rng.integers(1, 12, n) * step + rng.normal(0, step / 6, n), 0.005, None)
+    notes = midi.Notes(onset, duration, rng.integers(30, 100, n), rng.integers(1, 128, n))
+    return midi.encode(notes, bpm)
+
+def _time(fn: Callable[[], object], repeat: int) -> Dict[str, float]:
+    samples: List[float] = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - t0)
+    return summarize(samples)
+
+def run_size(n: int, bpm: float, repeat: int) -> Dict:
+    from app.core import midi
+    raw = make_performance(n, bpm, seed=n)
+    notes = midi.parse(raw)
+    quantized, stats = midi.quantize(notes, bpm)
+    total = _time(lambda: midi.encode(midi.quantize(midi.parse(raw), bpm)[0], bpm), repeat)
+    return {
+        "input_bytes": len(raw),
+        "stats": stats,
+        "parse": _time(lambda: midi.parse(raw), repeat),
+        "quantize": _time(lambda: midi.quantize(notes, bpm), repeat),
+        "encode": _time(lambda: midi.encode(quantized, bpm), repeat),
+        "total": total,
+        "notes_per_sec": round(n / (total["p50_ms"] / 1000), 0) if total["p50_ms"] else None,
+    }
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sizes", default="10000,100000,1000000", help="逗号分隔的音符数")
+    ap.add_argument("--bpm", type=float, default=120.0)
+    ap.add_argument("--repeat", type=int, default=5)
+    ap.add_argument("--out", default=None, help="结果 JSON 保存路径")
+    args = ap.parse_args()
+    results = {str(n): run_size(n, args.bpm, args.repeat)
+               for n in (int(x) for x in args.sizes.split(",") if x.strip())}
+    results["peak_rss_mb"] = round(peak_rss_bytes() / 1e6, 1)
+    write_results("midi", vars(args), results, args.out)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""storage 热路径微基准：meta 读写、list_artifacts、展示区分页，在 1k/10k/100k 项目规模下
+
+数据直接按 meta.json 布局生成后用 meta_index 全量重建索引，比逐个走 storage 接口快得多。
+
+用法: python -m benchmarks.bench_storage [--scales 1000,10000,100000] [--repeat 200]
+                                        [--out .bench/storage.json]
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+from typing import Callable, Dict, List
+
+from benchmarks._common import summarize, write_results
+
+
+def _iso(ts: float) -> str:
+    return time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(ts))
+
+def populate(n: int, published_ratio: float) -> List[str]:
+    from app.core import meta_index
+    from app.core.config import settings
+    base = os.path.join(settings.TEMP_DIR, "projects")
+    t0 = time.time() - n
+    pids = []
+    for i in range(n):
+        pid = f"p{i:07d}"
+        root = os.path.join(base, pid)
+        for d in ("uploads", "separate", "synth", "preview"):
+            os.makedirs(os.path.join(root, d), exist_ok=True)
+        for d, fn in (("separate", "vocals.wav"), ("synth", "fullmix.wav"),
+                      ("preview", "preview.wav")):
+            open(os.path.join(root, d, fn), "wb").close()
+        meta = {
+            "project_id": pid, "project_name": f"proj {i}", "pen_name": "bench",
+            "created_at": _iso(t0 + i), "is_featured": i % 50 == 0,
+            "stage_artifacts": {s: {"files": {}, "at": _iso(t0 + i)}
+                                for s in ("separate", "synth", "preview")},
+        }
+        with open(os.path.join(root, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        if random.random() < published_ratio:
+            pub = os.path.join(settings.PUBLISH_DIR, pid)
+            os.makedirs(pub, exist_ok=True)
+            with open(os.path.join(pub, "meta.json"), "w", encoding="utf-8") as f:
+                json.dump({"public_id": pid, "project_name": meta["project_name"],
+                           "pen_name": "bench", "published_at": meta["created_at"],
+                           "preview_url": "", "result_url": ""}, f)
+        pids.append(pid)
+    meta_index.rebuild()
+    meta_index.rebuild_published()
+    return pids
+
+def _bench(fn: Callable[[], object], repeat: int) -> Dict[str, float]:
+    samples = []
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        s = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - s)
+    return summarize(samples, time.perf_counter() - t0)
+
+def run_scale(n: int, repeat: int, published_ratio: float) -> Dict[str, Dict[str, float]]:
+    from app.core import storage
+    t0 = time.perf_counter()
+    pids = populate(n, published_ratio)
+    setup = time.perf_counter() - t0
+    rng = random.Random(n)
+    pick = lambda: rng.choice(pids)  # noqa: E731
+
+    def load_cold():
+        pid = pick()
+        storage.forget_project(pid)
+        storage.load_project_meta(pid)
+
+    hot = pick()
+    storage.load_project_meta(hot)
+    deep_cursor = None
+    for _ in range(min(10, n // 20)):  # 翻到第 10 页附近，验证 keyset 分页不随深度变慢
+        deep_cursor = storage.list_published_page(limit=20, cursor=deep_cursor)["next_cursor"]
+
+    out = {
+        "setup_seconds": round(setup, 2),
+        "meta_load_hot": _bench(lambda: storage.load_project_meta(hot), repeat),
+        "meta_load_cold": _bench(load_cold, repeat),
+        "meta_update": _bench(
+            lambda: storage.update_project_meta(pick(), {"bench": time.time()}), repeat),
+        "list_artifacts": _bench(lambda: storage.list_artifacts(pick()), repeat),
+        "list_published_page": _bench(lambda: storage.list_published_page(limit=20), repeat),
+        "list_published_page_deep": _bench(
+            lambda: storage.list_published_page(limit=20, cursor=deep_cursor), repeat),
+        "list_recent_projects": _bench(lambda: storage.list_recent_projects(), repeat),
+        # 全量导出随规模线性增长，只跑少量次数
+        "list_published_all": _bench(storage.list_published, max(1, repeat // 20)),
+    }
+    return out
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--scales", default="1000,10000",
+                    help="逗号分隔的项目数，例如 1000,10000,100000")
+    ap.add_argument("--repeat", type=int, default=200)
+    ap.add_argument("--published-ratio", type=float, default=0.5)
+    ap.add_argument("--out", default=None, help="结果 JSON 保存路径")
+    args = ap.parse_args()
+
+    from app.core.config import settings
+    results = {}
+    for n in (int(x) for x in args.scales.split(",") if x.strip()):
+        with tempfile.TemporaryDirectory(prefix="hachimi-bench-") as d:
+            # 每个规模独立目录：元数据索引与缓存都按路径区分
+            settings.TEMP_DIR = os.path.join(d, "tmp")
+            settings.PUBLISH_DIR = os.path.join(d, "publish")
+            results[str(n)] = run_scale(n, args.repeat, args.published_ratio)
+    write_results("storage", vars(args), results, args.out)
+
+if __name__ == "__main__":
+    main()
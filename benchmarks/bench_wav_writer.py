@@ -0,0 +1,73 @@
+"""WAV 写入吞吐对比：旧的逐帧 writeframesraw vs audio_io 整块写
+
+用法: python -m benchmarks.bench_wav_writer [--seconds 180] [--sr 44100] [--channels 2]
+"""
+import argparse
+import json
+import os
+import struct
+import sys
+import tempfile
+import time
+import wave
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app.core import audio_io
+
+
+def legacy_per_frame(path: str, n_frames: int, sr: int, channels: int) -> None:
+    """旧实现：每帧一次 struct.pack 结果的 writeframesraw 调用"""
+    with wave.open(path, "w") as wf:
+        wf.setnchannels(channels)
+        wf.setsampwidth(2)
+        wf.setframerate(sr)
+        frame = struct.pack("<" + "h" * channels, *([0] * channels))
+        for _ in range(n_frames):
+            wf.writeframesraw(frame)
+
+def block_writer(path: str, data: np.ndarray, sr: int) -> None:
+    audio_io.write_wav(path, data, sr, sample_format="pcm16")
+
+def block_writer_float32(path: str, data: np.ndarray, sr: int) -> None:
+    audio_io.write_wav(path, data, sr, sample_format="float32")
+
+def _timed(fn, *args) -> float:
+    t0 = time.perf_counter()
+    fn(*args)
+    return time.perf_counter() - t0
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--seconds", type=float, default=180.0)
+    ap.add_argument("--sr", type=int, default=44100)
+    ap.add_argument("--channels", type=int, default=2)
+    ap.add_argument("--skip-legacy", action="store_true")
+    args = ap.parse_args()
+
+    n_frames = int(args.seconds * args.sr)
+    rng = np.random.default_rng(0)
+    data = (rng.standard_normal((n_frames, args.channels)) * 0.1).astype(np.float32)
+    mb = n_frames * args.channels * 2 / 1e6
+    results = {"frames": n_frames, "channels": args.channels, "sr": args.sr,
+               "pcm16_mb": round(mb, 2)}
+    with tempfile.TemporaryDirectory() as d:
+        if not args.skip_legacy:
+            s = _timed(legacy_per_frame, os.path.join(d, "legacy.wav"),
+                       n_frames, args.sr, args.channels)
+            results["legacy_per_frame"] = {"seconds": round(s, 4), "mb_per_s": round(mb / s, 1)}
+        s = _timed(block_writer, os.path.join(d, "block.wav"), data, args.sr)
+        results["block_pcm16"] = {"seconds": round(s, 4), "mb_per_s": round(mb / s, 1)}
+        s = _timed(block_writer_float32, os.path.join(d, "block_f32.wav"), data, args.sr)
+        results["block_float32"] = {"seconds": round(s, 4), "mb_per_s": round(2 * mb / s, 1)}
+        s = _timed(audio_io.write_silence, os.path.join(d, "silence.wav"),
+                   args.seconds, args.sr, args.channels)
+        results["silence_pcm16"] = {"seconds": round(s, 4), "mb_per_s": round(mb / s, 1)}
+    if "legacy_per_frame" in results:
+        legacy, block = results["legacy_per_frame"], results["block_pcm16"]
+        results["speedup_pcm16"] = round(legacy["seconds"] / block["seconds"], 1)
+    print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    main()
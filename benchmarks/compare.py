@@ -0,0 +1,59 @@
+"""比较两次基准结果(bench_lifecycle / bench_storage 的 JSON)，列出耗时变化并标出回归
+
+用法: python -m benchmarks.compare base.json head.json [--metric p95_ms] [--threshold 0.2]
+超过阈值的回归存在时退出码为 1，可直接用在 CI 里
+"""
+import argparse
+import json
+import sys
+from typing import Any, Dict, Iterator, Tuple
+
+
+def _flatten(node: Any, prefix: str = "") -> Iterator[Tuple[str, float]]:
+    if isinstance(node, dict):
+        for k, v in node.items():
+            yield from _flatten(v, f"{prefix}.{k}" if prefix else k)
+    elif isinstance(node, (int, float)) and not isinstance(node, bool):
+        yield prefix, float(node)
+
+def load(path: str) -> Dict[str, Any]:
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+def compare(base: Dict[str, Any], head: Dict[str, Any], metric: str, threshold: float):
+    """返回 [(指标路径, base, head, 相对变化, 是否回归)]；metric 为空时比较所有 *_ms"""
+    b = dict(_flatten(base.get("results", {})))
+    h = dict(_flatten(head.get("results", {})))
+    rows = []
+    for key in sorted(b.keys() & h.keys()):
+        leaf = key.rsplit(".", 1)[-1]
+        if (metric and leaf != metric) or (not metric and not leaf.endswith("_ms")):
+            continue
+        if b[key] <= 0:
+            continue
+        change = (h[key] - b[key]) / b[key]
+        rows.append((key, b[key], h[key], change, change > threshold))
+    return rows
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("base")
+    ap.add_argument("head")
+    ap.add_argument("--metric", default="p95_ms", help="比较的叶子字段，传空串则比较所有 *_ms")
+    ap.add_argument("--threshold", type=float, default=0.2, help="相对变慢超过该比例视为回归")
+    args = ap.parse_args(argv)
+    base, head = load(args.base), load(args.head)
+    if base.get("benchmark") != head.get("benchmark"):
+        print(f"benchmark mismatch: {base.get('benchmark')} vs {head.get('benchmark')}",
+              file=sys.stderr)
+        return 2
+    print(f"base {base['meta'].get('commit')}  head {head['meta'].get('commit')}")
+    rows = compare(base, head, args.metric, args.threshold)
+    width = max((len(r[0]) for r in rows), default=10)
+    for key, bv, hv, change, bad in rows:
+        flag = "  REGRESSION" if bad else ""
+        print(f"{key:<{width}}  {bv:>12.3f}  {hv:>12.3f}  {change:+8.1%}{flag}")
+    return 1 if any(r[4] for r in rows) else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
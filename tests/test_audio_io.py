@@ -0,0 +1,57 @@
+import pathlib
+import sys
+import wave
+
+import numpy as np
+import pytest
+
+sys.path.append(str(pathlib.Path(__file__).parent.parent))
+from app.core import audio_io
+
+
+@pytest.mark.parametrize("fmt,tol", [("pcm16", 1/2**15), ("pcm24", 1/2**23),
+                                     ("pcm32", 1/2**31), ("float32", 1e-7)])
+def test_roundtrip_formats(tmp_path, fmt, tol):
+    sr = 22050
+    t = np.arange(sr // 2) / sr
+    data = np.stack([0.5*np.sin(2*np.pi*440*t), -0.25*np.cos(2*np.pi*220*t)], axis=1)
+    p = str(tmp_path/f"{fmt}.wav")
+    audio_io.write_wav(p, data, sr, sample_format=fmt)
+    back, back_sr = audio_io.read_wav(p)
+    assert back_sr == sr and back.shape == data.shape
+    assert np.max(np.abs(back - data)) <= max(tol, 1e-7) * 1.01
+
+def test_pcm16_readable_by_stdlib_and_streamed_in_blocks(tmp_path):
+    p = str(tmp_path/"s.wav")
+    data = (np.arange(200000) % 1000 - 500).astype(np.int16)
+    with audio_io.WavWriter(p, 16000) as w:
+        for i in range(0, len(data), 70000):
+            w.write(data[i:i+70000])
+    with wave.open(p, "rb") as wf:
+        assert wf.getnframes() == len(data)
+        assert wf.readframes(wf.getnframes()) == data.tobytes()
+    blocks = list(audio_io.iter_blocks(p, block_frames=65536))
+    assert sum(len(b) for b in blocks) == len(data)
+
+def test_silence_and_failed_write_leaves_no_file(tmp_path):
+    p = str(tmp_path/"z.wav")
+    audio_io.write_silence(p, 1.5, sr=16000, channels=2)
+    info = audio_io.wav_info(p)
+    assert (info.frames, info.channels) == (24000, 2)
+    bad = tmp_path/"bad.wav"
+    with pytest.raises(ValueError):
+        with audio_io.WavWriter(str(bad), 16000, channels=2) as w:
+            w.write(np.zeros(10))
+    assert not bad.exists() and len(list(tmp_path.iterdir())) == 1
+
+def test_atomic_open_replaces_or_keeps_old(tmp_path):
+    p = tmp_path / "a.json"
+    p.write_text("old")
+    with pytest.raises(RuntimeError):
+        with audio_io.atomic_open(str(p), "w") as f:
+            f.write("half")
+            raise RuntimeError("boom")
+    assert p.read_text() == "old" and [x.name for x in tmp_path.iterdir()] == ["a.json"]
+    with audio_io.atomic_open(str(p), "w") as f:
+        f.write("new")
+    assert p.read_text() == "new" and [x.name for x in tmp_path.iterdir()] == ["a.json"]
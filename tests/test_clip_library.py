@@ -0,0 +1,99 @@
+import json
+import os
+import pathlib
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.append(str(pathlib.Path(__file__).parent.parent))
+from app.core import audio_io, clip_library
+from app.core.config import settings
+
+SR = 16000
+
+def _tone(path, midi_pitch, seconds, sr=SR, channels=1, pad=0.0):
+    t = np.arange(int(seconds * sr)) / sr
+    x = 0.5 * np.sin(2 * np.pi * 440 * 2 ** ((midi_pitch - 69) / 12) * t).astype(np.float32)
+    silence = np.zeros(int(pad * sr), np.float32)
+    x = np.concatenate([silence, x, silence])
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    audio_io.write_wav(path, np.repeat(x[:, None], channels, axis=1), sr)
+
+@pytest.fixture()
+def lib_dir(tmp_path):
+    src = tmp_path / "clips"
+    _tone(str(src / "哈_60.wav"), 60, 0.30)
+    _tone(str(src / "哈_67_b.wav"), 67, 0.20)
+    _tone(str(src / "哈" / "哈_72.wav"), 72, 0.50, sr=22050, channels=2)
+    _tone(str(src / "基.wav"), 64, 0.25, pad=0.1)          # 无音高：自相关估计，首尾静音被裁掉
+    _tone(str(src / "米_62.wav"), 62, 0.40)
+    _tone(str(src / "米.wav"), 69, 0.20)                     # 同字混用带/不带音高的命名
+    (src / "broken_60.wav").write_bytes(b"RIFF\x00\x00")
+    out = tmp_path / "lib"
+    st = clip_library.build(str(src), str(out), sr=SR)
+    assert st == {"clips": 6, "words": 3, "seconds": pytest.approx(1.85, abs=0.01), "skipped": 1}
+    return str(out)
+
+def test_build_index_and_zero_copy_slices(lib_dir):
+    lib = clip_library.ClipLibrary(lib_dir)
+    assert sorted(lib.words) == ["哈", "基", "米"] and len(lib) == 6 and lib.sr == SR
+    a, b = lib.lookup("哈")
+    assert b - a == 3 and list(lib.index["pitch"][a:b]) == [60, 67, 72]
+    assert lib.lookup("无") == (0, 0)
+    a, b = lib.lookup("米")
+    assert b - a == 2 and lib.index["pitch"][a] == 62
+    assert abs(float(lib.index["pitch"][a + 1]) - 69) < 0.2
+    row = lib.nearest("基")
+    assert abs(float(lib.index["pitch"][row]) - 64) < 0.2
+    assert lib.index["frames"][row] == pytest.approx(0.25 * SR, abs=2)
+    # 72 号片段从 22050Hz 立体声重采样而来
+    r72 = lib.nearest("哈", pitch=72)
+    assert lib.index["frames"][r72] == pytest.approx(0.5 * SR, abs=2)
+    clip = lib.clip(r72)
+    assert isinstance(clip.base, np.memmap) or isinstance(clip, np.memmap)
+    spec = np.abs(np.fft.rfft(audio_io.to_float32(clip, "pcm16")))
+    assert np.fft.rfftfreq(len(clip), 1 / SR)[spec.argmax()] == pytest.approx(523.25, abs=3)
+
+def test_nearest_pitch_and_duration_search(lib_dir):
+    lib = clip_library.ClipLibrary(lib_dir)
+
+    def pitch(r):
+        return int(lib.index["pitch"][r])
+    assert pitch(lib.nearest("哈", pitch=62)) == 60
+    assert pitch(lib.nearest("哈", pitch=70)) == 72
+    assert pitch(lib.nearest("哈", duration=0.2)) == 67
+    assert lib.nearest("无", pitch=60) is None
+    rows = lib.nearest_many(["哈", "米", "无", "哈", "基"], [61, 62, 60, 71, 50],
+                            [0.3, 0.4, 0.1, 0.5, 0.2])
+    assert rows[2] == -1
+    assert [pitch(r) for r in rows[[0, 1, 3]]] == [60, 62, 72]
+    queries = zip(["哈", "米", "哈", "基"], [61, 62, 71, 50], [0.3, 0.4, 0.5, 0.2])
+    for i, (w, p, d) in enumerate(queries):
+        assert rows[[0, 1, 3, 4][i]] == lib.nearest(w, p, d)
+
+def test_render_phrases_and_cli(lib_dir, tmp_path, monkeypatch, capsys):
+    lib = clip_library.ClipLibrary(lib_dir)
+    doc = {"phrases": [{"text": "哈基", "notes": [[0.0, 0.25, 60], [0.5, 1.0, 64]]},
+                       {"text": "无米", "notes": [[2.0, 0.5, 70], [3.0, 0.2, 62]]}]}
+    out = str(tmp_path / "vocal.wav")
+    st = lib.render_phrases(doc, out)
+    assert st["notes"] == 4 and st["placed"] == 3
+    data, sr = audio_io.read_wav(out)
+    assert sr == SR and len(data) == st["frames"] == int(3.2 * SR)
+    env = np.abs(data[:, 0])
+    assert env[:int(0.25 * SR) - 200].max() > 0.3 and env[int(0.3 * SR):int(0.5 * SR)].max() == 0
+    assert env[int(2.0 * SR):int(3.0 * SR)].max() == 0       # 缺字留空
+    assert env[-1] < 0.01                                      # 片段截断处淡出
+
+    monkeypatch.setattr(settings, "CLIP_LIBRARY_DIR", lib_dir)
+    assert clip_library.open_library() is clip_library.open_library()
+    assert clip_library.main(["find", "哈", "--pitch", "66"]) == 0
+    assert json.loads(capsys.readouterr().out)["pitch"] == 67
+    assert clip_library.main(["info"]) == 0
+    assert json.loads(capsys.readouterr().out)["words"] == {"哈": 3, "基": 1, "米": 2}
+    # 重建途中(blob 与 manifest 不一致)打开会明确报错
+    with open(os.path.join(lib_dir, clip_library.BLOB_NAME), "ab") as f:
+        f.write(b"\x00\x00")
+    with pytest.raises(clip_library.ClipLibraryError):
+        clip_library.ClipLibrary(lib_dir)
@@ -0,0 +1,84 @@
+import dataclasses
+import pathlib
+import sys
+import threading
+import time
+
+import numpy as np
+import pytest
+
+sys.path.append(str(pathlib.Path(__file__).parent.parent))
+from app.core import audio_io, pipeline_stub
+from app.core.config import settings
+from app.core.dag import Stage, run_graph, topo_order
+
+
+def _meet(barrier, key, value):
+    # 两个分支都到达屏障才能返回；串行执行时先到的一方等不到对方，屏障超时报错
+    def fn(ctx):
+        barrier.wait()
+        return {key: value}
+    return fn
+
+def test_independent_stages_run_concurrently():
+    barrier = threading.Barrier(2, timeout=5)
+    stages = [
+        Stage("root", lambda ctx: {"a": 1}, outputs=("a",)),
+        Stage("left", _meet(barrier, "b", 2), inputs=("a",), outputs=("b",)),
+        Stage("right", _meet(barrier, "c", 3), inputs=("a",), outputs=("c",)),
+        Stage("join", lambda ctx: {"d": ctx["b"] + ctx["c"]}, inputs=("b", "c"), outputs=("d",)),
+    ]
+    steps = []
+    ctx, timings = run_graph(stages, {}, on_step=lambda name, i: steps.append((name, i)))
+    assert ctx["d"] == 5
+    assert set(timings) == {"root", "left", "right", "join"}
+    assert steps[0] == ("root", 1) and steps[-1] == ("join", 4)
+
+def test_failure_stops_scheduling():
+    ran = []
+    def boom(ctx):
+        raise RuntimeError("boom")
+    stages = [
+        Stage("a", boom, outputs=("x",)),
+        Stage("b", lambda ctx: ran.append("b") or {"y": 1}, inputs=("x",), outputs=("y",)),
+    ]
+    with pytest.raises(RuntimeError):
+        run_graph(stages, {})
+    assert ran == []
+
+def test_graph_validation():
+    with pytest.raises(ValueError):
+        topo_order([Stage("a", dict, inputs=("missing",), outputs=("x",))])
+    with pytest.raises(ValueError):
+        topo_order([
+            Stage("a", dict, inputs=("y",), outputs=("x",)),
+            Stage("b", dict, inputs=("x",), outputs=("y",)),
+        ])
+
+def _overlaps(spans, a, b):
+    return spans[a][0] < spans[b][1] and spans[b][0] < spans[a][1]
+
+def test_pipeline_branches_overlap(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "TEMP_DIR", str(tmp_path / "tmp_hachimi"))
+    spans = {}
+
+    def timed(st):
+        def fn(ctx):
+            t0 = time.perf_counter()
+            out = st.fn(ctx)
+            time.sleep(0.05)
+            spans[st.name] = (t0, time.perf_counter())
+            return out
+        return dataclasses.replace(st, fn=fn)
+    monkeypatch.setattr(pipeline_stub, "PIPELINE", [timed(st) for st in pipeline_stub.PIPELINE])
+    src = tmp_path / "in.wav"
+    t = np.arange(8000) / 16000
+    audio_io.write_wav(str(src), (0.3 * np.sin(2 * np.pi * 220 * t)).astype(np.float32), 16000)
+    payload = pipeline_stub.run_pipeline_stub("dagjob", str(src), 120)
+    assert set(payload["stage_timings"]) == set(pipeline_stub.STEPS)
+    # 伴奏后处理与 MIDI/歌词分支并行，预览与终混编码并行
+    assert _overlaps(spans, "accompaniment", "midi")
+    assert _overlaps(spans, "preview", "encode")
+    assert spans["synthesize"][0] >= max(spans["lyrics"][1], spans["accompaniment"][1])
+    data, sr = audio_io.read_wav(payload["outputs"]["result_path"])
+    assert sr == settings.MIX_SAMPLE_RATE and np.abs(data).max() > 0.05
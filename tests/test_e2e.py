@@ -96,6 +96,15 @@ def test_stage_retry_and_uploads():
     arts = client.get(f"/hachimi_ai_mad/projects/{project_id}/artifacts").json()
     assert "synth" in arts["stages"]
     
+def test_dispatch_reads_ready_result_while_another_eager_task_runs():
+    from celery.result import denied_join_result
+    client = TestClient(app)
+    #另一个 eager 任务执行期间 celery 会置进程级"禁止 join"标志，已就绪的结果仍应直接返回
+    with denied_join_result():
+        r = client.post("/hachimi_ai_mad/stages/separate/retry",
+                        data={"project_id": "p2", "allow_missing": "true"})
+    assert r.status_code == 200 and r.json()["skipped"]
+
 def test_admin_feature_requires_secret(monkeypatch):
     monkeypatch.setattr(settings, "ADMIN_SECRET", "s3cr3t")
     client = TestClient(app)
@@ -109,3 +118,329 @@ def test_admin_feature_requires_secret(monkeypatch):
     assert r.status_code == 200
     assert r.json().get("ok") is True
     
+
+def test_showcase_etag_revalidation():
+    client = TestClient(app)
+    r = client.get("/hachimi_ai_mad/showcase?limit=5")
+    assert r.status_code == 200
+    assert r.json() == {"items": [], "next_cursor": None}
+    etag = r.headers["etag"]
+    r = client.get("/hachimi_ai_mad/showcase?limit=5", headers={"If-None-Match": etag})
+    assert r.status_code == 304
+    assert client.get("/hachimi_ai_mad/showcase?cursor=%%%").status_code == 400
+
+def test_upload_size_limit_and_hash(monkeypatch):
+    import hashlib
+
+    from app.core import storage
+    monkeypatch.setattr(settings, "MAX_UPLOAD_MB", 1)
+    client = TestClient(app)
+    big = io.BytesIO(b"\x00" * (1024 * 1024 + 1))
+    files = {"midi_file": ("big.mid", big, "audio/midi")}
+    r = client.post("/hachimi_ai_mad/stages/midi/upload", data={"project_id": "big"}, files=files)
+    assert r.status_code == 413
+    assert os.listdir(storage.stage_dir("big", "midi")) == []
+    body = b"MThd\x00\x00\x00\x06\x00\x01\x00\x01\x00\x60"
+    files = {"midi_file": ("a.mid", io.BytesIO(body), "audio/midi")}
+    r = client.post("/hachimi_ai_mad/stages/midi/upload", data={"project_id": "big"}, files=files)
+    assert r.status_code == 200
+    path = os.path.join(storage.stage_dir("big", "midi"), "a.mid")
+    assert storage.upload_sha256("big", path) == hashlib.sha256(body).hexdigest()
+
+def _parse_sse(text):
+    out = []
+    for block in text.split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in block.splitlines()
+                      if ": " in line and not line.startswith(":"))
+        if "data" in fields:
+            out.append((fields["id"], fields["event"], json.loads(fields["data"])))
+    return out
+
+def test_task_events_stream_and_resume():
+    client = TestClient(app)
+    files = {"file": ("a.wav", _make_silence_wav(), "audio/wav")}
+    data = {"bpm": "120", "project_name": "demo", "pen_name": "alice"}
+    job_id = client.post("/hachimi_ai_mad/tasks/process", files=files, data=data).json()["job_id"]
+    r = client.get(f"/hachimi_ai_mad/tasks/{job_id}/events")
+    assert r.status_code == 200
+    assert r.headers["content-type"].startswith("text/event-stream")
+    evs = _parse_sse(r.text)
+    statuses = [d["status"] for _, _, d in evs]
+    assert statuses[0] == "STARTED" and statuses[-1] == "SUCCEEDED"
+    assert [d["stage"] for _, t, d in evs if t == "progress"] == [
+        "separate", "accompaniment", "midi", "lyrics", "synthesize", "preview", "encode"]
+    #从中间的事件续传，只收到之后的事件
+    r = client.get(f"/hachimi_ai_mad/tasks/{job_id}/events", headers={"Last-Event-ID": evs[2][0]})
+    assert [e[0] for e in _parse_sse(r.text)] == [e[0] for e in evs[3:]]
+
+def test_task_events_unknown_and_expired(monkeypatch):
+    from app.core import events
+    client = TestClient(app)
+    assert client.get("/hachimi_ai_mad/tasks/no-such-job/events").status_code == 404
+    files = {"file": ("a.wav", _make_silence_wav(), "audio/wav")}
+    data = {"bpm": "120", "project_name": "demo", "pen_name": "alice"}
+    job_id = client.post("/hachimi_ai_mad/tasks/process", files=files, data=data).json()["job_id"]
+    #事件历史已过期：补发一条终态事件后关闭
+    monkeypatch.setattr(events, "memory_bus", events.MemoryEventBus())
+    r = client.get(f"/hachimi_ai_mad/tasks/{job_id}/events")
+    evs = _parse_sse(r.text)
+    assert [(t, d["status"]) for _, t, d in evs] == [("status", "SUCCEEDED")]
+    assert evs[0][2]["urls"]["result_url"].startswith("/hachimi_ai_mad/projects/")
+
+def test_range_and_conditional_file_serving():
+    client = TestClient(app)
+    files = {"file": ("a.wav", _make_silence_wav(), "audio/wav")}
+    data = {"bpm": "120", "project_name": "demo", "pen_name": "alice"}
+    job_id = client.post("/hachimi_ai_mad/tasks/process", files=files, data=data).json()["job_id"]
+    url = f"/hachimi_ai_mad/projects/{job_id}/preview/preview.wav"
+    full = client.get(url)
+    assert full.status_code == 200 and full.headers["accept-ranges"] == "bytes"
+    r = client.get(url, headers={"Range": "bytes=100-199"})
+    assert r.status_code == 206
+    assert r.headers["content-range"] == f"bytes 100-199/{len(full.content)}"
+    assert r.content == full.content[100:200]
+    assert client.get(url, headers={"Range": "bytes=999999-"}).status_code == 416
+    r = client.get(url, headers={"If-None-Match": full.headers["etag"]})
+    assert r.status_code == 304 and r.content == b""
+    assert client.get(f"/hachimi_ai_mad/projects/{job_id}/../meta.json").status_code in (400, 404)
+    #发布后带版本号的地址可长期缓存
+    pub = client.post(f"/hachimi_ai_mad/tasks/{job_id}/publish").json()
+    r = client.get(pub["preview_url"])
+    assert r.status_code == 200 and "immutable" in r.headers["cache-control"]
+    r = client.get(f"/hachimi_ai_mad/showcase/{job_id}/preview")
+    assert r.headers["cache-control"] == "no-cache"
+
+def test_queue_routing_and_admin_depths(monkeypatch):
+    from app.workers.celery_app import celery_app
+    from app.workers.queues import QUEUES
+    router = celery_app.amqp.router
+    assert router.route({}, "tasks.run_pipeline")["queue"].name == "pipeline"
+    assert router.route({}, "tasks.stage_separate")["queue"].name == "separation"
+    assert router.route({}, "tasks.stage_synthesize")["queue"].name == "synthesis"
+    assert router.route({}, "tasks.stage_quantize_midi")["queue"].name == "synthesis"
+    assert router.route({}, "tasks.sweep_expired")["queue"].name == "maintenance"
+
+    monkeypatch.setattr(settings, "ADMIN_SECRET", "s3cr3t")
+    client = TestClient(app)
+    assert client.get("/hachimi_ai_mad/admin/queues").status_code == 403
+    r = client.get("/hachimi_ai_mad/admin/queues", headers={"X-Admin-Secret": "s3cr3t"})
+    assert r.status_code == 200
+    assert set(r.json()["queues"]) == set(QUEUES)
+
+def test_redis_priority_sub_queues_serve_interactive_first():
+    from kombu.transport import redis as kredis
+
+    from app.workers import queues
+    conf = queues.celery_queue_conf()
+    opts = conf["broker_transport_options"]
+    ch = kredis.Channel.__new__(kredis.Channel)
+    ch.priority_steps, ch.sep = opts["priority_steps"], opts["sep"]
+
+    def key(queue, priority):
+        msg = {"properties": {"priority": priority}}
+        return ch._q_for_pri(queue, ch._get_message_priority(msg, reverse=False))
+    assert key("publish", queues.PRIORITY_INTERACTIVE) == "publish"
+    assert key("pipeline", queues.PRIORITY_DEFAULT) == "pipeline:5"
+    assert key("publish", queues.PRIORITY_BACKGROUND) == "publish:9"
+    # BRPOP 按 priority_steps 顺序取键，与 queue_depths 统计的键一致
+    order = [ch._q_for_pri("publish", p) for p in ch.priority_steps]
+    assert order == list(queues._priority_keys("publish"))
+    ranks = [order.index(key("publish", p)) for p in
+             (queues.PRIORITY_INTERACTIVE, queues.PRIORITY_DEFAULT, queues.PRIORITY_BACKGROUND)]
+    assert ranks == sorted(ranks) and len(set(ranks)) == 3
+    assert all(not q.queue_arguments for q in conf["task_queues"])
+
+def test_admission_rejects_before_reading_body(monkeypatch):
+    from app.core import admission
+    client = TestClient(app)
+    files = {"file": ("a.wav", _make_silence_wav(), "audio/wav")}
+    data = {"bpm": "120", "project_name": "p", "pen_name": "n"}
+    monkeypatch.setattr(admission, "_cached", None)
+    monkeypatch.setattr(admission, "_queued", lambda: 7)
+    monkeypatch.setattr(settings, "ADMISSION_MAX_QUEUED", 5)
+    monkeypatch.setattr(settings, "ADMISSION_DEFAULT_JOB_SECONDS", 40.0)
+    monkeypatch.setattr(settings, "CELERY_WORKER_CONCURRENCY", 2)
+    r = client.post("/hachimi_ai_mad/tasks/process", files=files, data=data)
+    assert r.status_code == 429 and r.headers["retry-after"] == "20"
+    # 被拒的上传不会落盘
+    assert not os.path.exists(os.path.join(settings.TEMP_DIR, "projects"))
+
+    monkeypatch.setattr(admission, "_cached", None)
+    monkeypatch.setattr(settings, "ADMISSION_MIN_FREE_MB", 10 ** 12)
+    r = client.post("/hachimi_ai_mad/tasks/process", files=files, data=data)
+    assert r.status_code == 503 and "retry-after" in r.headers
+
+    monkeypatch.setattr(settings, "MAX_UPLOAD_MB", 0)
+    big = {"file": ("a.wav", b"\x00" * (2 * 1024 * 1024), "audio/wav")}
+    assert client.post("/hachimi_ai_mad/tasks/process", files=big, data=data).status_code == 413
+
+    monkeypatch.setattr(admission, "_cached", None)
+    monkeypatch.setattr(settings, "MAX_UPLOAD_MB", 32)
+    monkeypatch.setattr(settings, "ADMISSION_MIN_FREE_MB", 0)
+    monkeypatch.setattr(admission, "_queued", lambda: 1)
+    files = {"file": ("a.wav", _make_silence_wav(), "audio/wav")}
+    r = client.post("/hachimi_ai_mad/tasks/process", files=files, data=data)
+    assert r.status_code == 201
+    assert r.json()["eta_seconds"] > 0
+
+def test_admission_counts_running_jobs_in_celery_mode(monkeypatch):
+    from app.core import admission, storage
+    monkeypatch.setattr(settings, "CELERY_EAGER", 0)
+    monkeypatch.setattr(admission, "_queued", lambda: 2)
+    #worker 已取走的任务不在 Redis 列表里，按元数据 RUNNING 计入；超时遗留的不算
+    for i in range(3):
+        storage.save_project_meta(f"run{i}",
+                                  {"job_status": "RUNNING", "job_started_at": storage.now_iso()})
+    storage.save_project_meta("stale",
+                              {"job_status": "RUNNING", "job_started_at": "2000-01-01T00:00:00Z"})
+    storage.save_project_meta("done",
+                              {"job_status": "SUCCEEDED", "job_started_at": storage.now_iso()})
+    snap = admission.snapshot(refresh=True)
+    assert snap.queued == 5
+    monkeypatch.setattr(settings, "EXECUTION_BACKEND", "local")
+    assert admission.snapshot(refresh=True).queued == 2
+
+def test_metrics_endpoint_reports_routes_stages_and_uploads():
+    client = TestClient(app)
+    files = {"file": ("a.wav", _make_silence_wav(), "audio/wav")}
+    r = client.post("/hachimi_ai_mad/tasks/process", files=files,
+                    data={"bpm": "120", "project_name": "p", "pen_name": "n"})
+    assert r.status_code == 201
+    client.get(f"/hachimi_ai_mad/tasks/{r.json()['job_id']}/status")
+    text = client.get("/metrics").text
+    assert ('hachimi_http_request_seconds_count{method="GET",'
+            'route="/hachimi_ai_mad/tasks/{job_id}/status",status="200"}') in text
+    assert 'hachimi_stage_seconds_count{stage="separate"}' in text
+    assert 'hachimi_upload_bytes_total{stage="uploads"}' in text
+    assert "hachimi_queue_wait_seconds_count" in text
+    assert ('hachimi_stage_cache_total{result="miss"}' in text
+            or 'hachimi_stage_cache_total{result="hit"}' in text)
+    assert 'hachimi_dir_used_bytes{dir="temp"}' in text
+
+def test_disk_usage_counts_hardlinks_once():
+    from app.core.metrics import DiskCollector
+    os.makedirs(settings.TEMP_DIR)
+    os.makedirs(settings.PUBLISH_DIR)
+    src = os.path.join(settings.TEMP_DIR, "a.bin")
+    with open(src, "wb") as f:
+        f.write(b"x" * 1000)
+    os.link(src, os.path.join(settings.TEMP_DIR, "b.bin"))
+    os.link(src, os.path.join(settings.PUBLISH_DIR, "a.bin"))
+    data = DiskCollector()._measure()
+    assert data["temp"][0] == 1000 and data["publish"][0] == 0
+
+def test_resumable_upload_parallel_parts_and_commit(monkeypatch):
+    import hashlib
+    from concurrent.futures import ThreadPoolExecutor
+
+    def sha(b):
+        return hashlib.sha256(b).hexdigest()
+    monkeypatch.setattr(settings, "UPLOAD_PART_MB", 1)
+    client = TestClient(app)
+    wav = _make_silence_wav(seconds=80, sr=16000).getvalue()  # ~2.5MB → 3 个分片
+    wav = wav[:44] + os.urandom(len(wav) - 44)
+    job = {"bpm": 120, "project_name": "p", "pen_name": "n"}
+    r = client.post("/hachimi_ai_mad/uploads",
+                    json={"filename": "src.wav", "size": len(wav), "sha256": sha(wav)})
+    assert r.status_code == 201
+    up = r.json()
+    uid, ps = up["upload_id"], up["part_size"]
+    parts = [wav[i:i + ps] for i in range(0, len(wav), ps)]
+    assert up["parts_total"] == len(parts) == 3
+
+    # 哈希不符的分片不登记
+    r = client.put(f"/hachimi_ai_mad/uploads/{uid}/parts/1", content=parts[1],
+                   headers={"X-Part-SHA256": sha(b"x")})
+    assert r.status_code == 422
+    r = client.put(f"/hachimi_ai_mad/uploads/{uid}/parts/2", content=parts[2],
+                   headers={"X-Part-SHA256": sha(parts[2])})
+    assert r.status_code == 200
+    assert client.get(f"/hachimi_ai_mad/uploads/{uid}").json()["missing"] == [0, 1]
+    r = client.post(f"/hachimi_ai_mad/uploads/{uid}/commit", json=job)
+    assert r.status_code == 409 and r.json()["detail"]["missing"] == [0, 1]
+
+    def put(i):
+        return client.put(f"/hachimi_ai_mad/uploads/{uid}/parts/{i}", content=parts[i],
+                          headers={"X-Part-SHA256": sha(parts[i])}).status_code
+    with ThreadPoolExecutor(2) as ex:
+        assert list(ex.map(put, [1, 0])) == [200, 200]
+    assert client.get(f"/hachimi_ai_mad/uploads/{uid}").json()["missing"] == []
+    #未提交的数据只在 .resumable 子目录里，不会被当成已上传文件
+    up_dir = os.path.join(settings.TEMP_DIR, "projects", uid, "uploads")
+    assert [f for f in os.listdir(up_dir) if os.path.isfile(os.path.join(up_dir, f))] == []
+
+    #提交时再做一次准入判断，被拒后上传仍可重试提交
+    from app.core import admission
+    monkeypatch.setattr(admission, "_cached", None)
+    monkeypatch.setattr(admission, "_queued", lambda: 7)
+    monkeypatch.setattr(settings, "ADMISSION_MAX_QUEUED", 5)
+    r = client.post(f"/hachimi_ai_mad/uploads/{uid}/commit", json=job)
+    assert r.status_code == 429 and "retry-after" in r.headers
+    assert client.get(f"/hachimi_ai_mad/uploads/{uid}").json()["status"] == "open"
+    monkeypatch.setattr(admission, "_cached", None)
+    monkeypatch.setattr(admission, "_queued", lambda: 0)
+
+    r = client.post(f"/hachimi_ai_mad/uploads/{uid}/commit", json=job)
+    assert r.status_code == 201 and r.json()["job_id"] == uid
+    assert client.get(f"/hachimi_ai_mad/tasks/{uid}/status").json()["status"] == "SUCCEEDED"
+    with open(os.path.join(settings.TEMP_DIR, "projects", uid, "uploads", "src.wav"), "rb") as f:
+        assert f.read() == wav
+    assert client.get(f"/hachimi_ai_mad/uploads/{uid}").json()["status"] == "committed"
+    r = client.put(f"/hachimi_ai_mad/uploads/{uid}/parts/0", content=parts[0],
+                   headers={"X-Part-SHA256": sha(parts[0])})
+    assert r.status_code == 409
+
+def test_resumable_corrupted_retry_keeps_verified_part(monkeypatch):
+    import hashlib
+
+    def sha(b):
+        return hashlib.sha256(b).hexdigest()
+    monkeypatch.setattr(settings, "UPLOAD_PART_MB", 1)
+    client = TestClient(app)
+    wav = _make_silence_wav(seconds=40, sr=16000).getvalue()  # ~1.3MB → 2 个分片
+    wav = wav[:44] + os.urandom(len(wav) - 44)
+    # 不带整文件 sha256，只能靠分片校验保证数据完整
+    up = client.post("/hachimi_ai_mad/uploads",
+                     json={"filename": "src.wav", "size": len(wav)}).json()
+    uid, ps = up["upload_id"], up["part_size"]
+    parts = [wav[i:i + ps] for i in range(0, len(wav), ps)]
+    for i, part in enumerate(parts):
+        r = client.put(f"/hachimi_ai_mad/uploads/{uid}/parts/{i}", content=part,
+                       headers={"X-Part-SHA256": sha(part)})
+        assert r.status_code == 200
+
+    corrupt = bytes(b ^ 0xFF for b in parts[0][:4096]) + parts[0][4096:]
+    r = client.put(f"/hachimi_ai_mad/uploads/{uid}/parts/0", content=corrupt,
+                   headers={"X-Part-SHA256": sha(parts[0])})
+    assert r.status_code == 422
+    assert client.get(f"/hachimi_ai_mad/uploads/{uid}").json()["missing"] == []
+    up_dir = os.path.join(settings.TEMP_DIR, "projects", uid, "uploads")
+    assert not [fn for fn in os.listdir(up_dir) if fn.endswith(".tmp")]
+
+    r = client.post(f"/hachimi_ai_mad/uploads/{uid}/commit",
+                    json={"bpm": 120, "project_name": "p", "pen_name": "n"})
+    assert r.status_code == 201
+    with open(os.path.join(up_dir, "src.wav"), "rb") as f:
+        assert f.read() == wav
+
+def test_waveform_peaks_for_artifacts_and_showcase():
+    client = TestClient(app)
+    files = {"file": ("a.wav", _make_silence_wav(), "audio/wav")}
+    r = client.post("/hachimi_ai_mad/tasks/process", files=files,
+                    data={"bpm": "120", "project_name": "p", "pen_name": "n"})
+    assert r.status_code == 201
+    job_id = r.json()["job_id"]
+    assert client.get(f"/hachimi_ai_mad/tasks/{job_id}/status").json()["status"] == "SUCCEEDED"
+    arts = client.get(f"/hachimi_ai_mad/projects/{job_id}/artifacts").json()["stages"]
+    assert "waveform" not in arts
+    wf = arts["synth"]["waveforms"]["fullmix.wav"]
+    assert wf["duration"] > 0 and wf["levels"][0] == 256 and wf["lufs"] is None
+    peaks = client.get(wf["peaks_url"])
+    assert peaks.status_code == 200 and peaks.content[:4] == b"HPK1"
+    assert set(arts["separate"]["waveforms"]) == {"vocals.wav", "accompaniment.wav"}
+
+    pub = client.post(f"/hachimi_ai_mad/tasks/{job_id}/publish").json()
+    assert set(pub["waveform"]) == {"preview", "result"}
+    r = client.get(pub["waveform"]["result"]["peaks_url"])
+    assert r.status_code == 200 and r.content == peaks.content
+    assert client.get(f"/hachimi_ai_mad/showcase/{pub['public_id']}/other/peaks").status_code == 404
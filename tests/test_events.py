@@ -0,0 +1,43 @@
+import asyncio
+import pathlib
+import sys
+import threading
+import time
+
+import pytest
+
+sys.path.append(str(pathlib.Path(__file__).parent.parent))
+from app.core import events
+from app.core.config import settings
+
+
+@pytest.fixture(autouse=True)
+def _memory_backend(monkeypatch):
+    monkeypatch.setattr(settings, "EVENTS_BACKEND", "memory")
+    monkeypatch.setattr(settings, "EVENTS_HEARTBEAT_SECONDS", 0.05)
+    monkeypatch.setattr(events, "memory_bus", events.MemoryEventBus())
+
+def test_live_fanout_with_heartbeat():
+    async def consume():
+        got = []
+        async for ev in events.listen("j1"):
+            got.append(ev if ev is None else ev[2]["status"])
+        return got
+
+    def producer():
+        time.sleep(0.15)
+        events.publish("j1", "progress", {"status": "PROGRESS"})
+        time.sleep(0.05)
+        events.publish("j1", "status", {"status": "SUCCEEDED"})
+
+    async def main():
+        t = threading.Thread(target=producer)
+        t.start()
+        a, b = await asyncio.gather(consume(), consume())
+        t.join()
+        return a, b
+
+    a, b = asyncio.run(main())
+    for got in (a, b):
+        assert None in got  # 等待期间有心跳
+        assert [g for g in got if g] == ["PROGRESS", "SUCCEEDED"]
@@ -0,0 +1,51 @@
+import asyncio
+import os
+import pathlib
+import sys
+
+sys.path.append(str(pathlib.Path(__file__).parent.parent))
+from app.core.http_files import CachedFileResponse
+
+
+def _serve(path, headers=(), zerocopy=True):
+    scope = {
+        "type": "http",
+        "method": "GET",
+        "headers": [(k.encode(), v.encode()) for k, v in headers],
+        "extensions": {"http.response.zerocopysend": {}} if zerocopy else {},
+    }
+    sent = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(msg):
+        if msg["type"] == "http.response.zerocopysend":
+            f = msg["file"]
+            f.seek(msg["offset"])
+            msg = {"type": msg["type"], "body": f.read(msg["count"])}
+        sent.append(msg)
+
+    resp = CachedFileResponse(path, os.stat(path))
+    asyncio.run(resp(scope, receive, send))
+    return sent
+
+def test_zerocopy_full_and_single_range(tmp_path):
+    p = tmp_path / "a.bin"
+    p.write_bytes(bytes(range(256)) * 4)
+    start, body = _serve(str(p))
+    assert start["status"] == 200
+    assert body["type"] == "http.response.zerocopysend" and len(body["body"]) == 1024
+    start, body = _serve(str(p), [("range", "bytes=100-199")])
+    hdrs = dict((k.decode(), v.decode()) for k, v in start["headers"])
+    assert start["status"] == 206 and hdrs["content-range"] == "bytes 100-199/1024"
+    assert body["body"] == (bytes(range(256)) * 4)[100:200]
+    start, body = _serve(str(p), [("range", "bytes=-24")])
+    assert start["status"] == 206 and len(body["body"]) == 24
+
+def test_multi_range_falls_back_to_starlette(tmp_path):
+    p = tmp_path / "a.bin"
+    p.write_bytes(b"x" * 1024)
+    sent = _serve(str(p), [("range", "bytes=0-9,20-29")])
+    assert sent[0]["status"] == 206
+    assert all(m["type"] != "http.response.zerocopysend" for m in sent)
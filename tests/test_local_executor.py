@@ -0,0 +1,83 @@
+import io
+import pathlib
+import sys
+import threading
+import time
+import wave
+
+import pytest
+from fastapi.testclient import TestClient
+
+sys.path.append(str(pathlib.Path(__file__).parent.parent))
+from app.core.config import settings
+from app.workers import local_executor
+from app.workers.local_executor import LocalExecutor, QueueFull
+
+
+@pytest.fixture(autouse=True)
+def _local_backend(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "EXECUTION_BACKEND", "local")
+    monkeypatch.setattr(settings, "TEMP_DIR", str(tmp_path / "tmp_hachimi"))
+    monkeypatch.setattr(settings, "PUBLISH_DIR", str(tmp_path / "publish"))
+    yield
+    local_executor.shutdown_executor(timeout=5)
+
+def test_bounded_queue_states_and_shutdown():
+    gate = threading.Event()
+    ex = LocalExecutor(max_workers=1, max_queue=2)
+    a = ex.submit(lambda: gate.wait(5) and "a", {})
+    b = ex.submit(lambda: "b", {})
+    with pytest.raises(QueueFull):
+        ex.submit(lambda: "c", {})
+    time.sleep(0.05)
+    assert a.state == "STARTED" and b.state == "PENDING"
+    gate.set()
+    assert a.get(timeout=5) == "a" and b.get(timeout=5) == "b"
+    assert a.state == b.state == "SUCCESS" and ex.active() == 0
+
+    ex.submit(lambda: gate.clear() or time.sleep(0.2), {})
+    queued = ex.submit(lambda: "never", {})
+    ex.shutdown(timeout=5)
+    assert queued.state == "REVOKED" and ex.active() == 0
+    with pytest.raises(QueueFull):
+        ex.submit(lambda: None, {})
+
+def test_bound_job_reports_progress_and_failure():
+    ex = LocalExecutor(max_workers=1, max_queue=4)
+    seen = threading.Event()
+    def job(update_state, n):
+        update_state(state="PROGRESS", meta={"progress": 0.5})
+        seen.wait(5)
+        raise ValueError(n)
+    r = ex.submit(job, {"n": 3}, task_id="j1", bind=True)
+    time.sleep(0.05)
+    assert ex.get("j1") is r and r.state == "PROGRESS" and r.info == {"progress": 0.5}
+    seen.set()
+    with pytest.raises(ValueError):
+        r.get(timeout=5)
+    assert r.state == "FAILURE" and isinstance(r.info, ValueError)
+    ex.shutdown()
+
+def test_process_returns_before_pipeline_finishes():
+    from app.main import app
+    buf = io.BytesIO()
+    with wave.open(buf, "wb") as wf:
+        wf.setnchannels(1)
+        wf.setsampwidth(2)
+        wf.setframerate(16000)
+        wf.writeframes(b"\x00\x00" * 3200)
+    with TestClient(app) as client:
+        files = {"file": ("a.wav", buf.getvalue(), "audio/wav")}
+        r = client.post("/hachimi_ai_mad/tasks/process", files=files,
+                        data={"bpm": "120", "project_name": "p", "pen_name": "n"})
+        assert r.status_code == 201
+        job_id = r.json()["job_id"]
+        # 阶段本身要 0.2s+，请求返回时任务还在跑，说明没有在请求里同步执行
+        assert client.get(f"/hachimi_ai_mad/tasks/{job_id}/status").json()["status"] != "SUCCEEDED"
+        for _ in range(200):
+            status = client.get(f"/hachimi_ai_mad/tasks/{job_id}/status").json()
+            if status["status"] in ("SUCCEEDED", "FAILED"):
+                break
+            time.sleep(0.05)
+        assert status["status"] == "SUCCEEDED"
+        assert client.get(f"/hachimi_ai_mad/tasks/{job_id}/download").status_code == 200
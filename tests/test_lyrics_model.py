@@ -0,0 +1,108 @@
+import json
+import os
+import pathlib
+import sys
+import threading
+
+import numpy as np
+import pytest
+
+sys.path.append(str(pathlib.Path(__file__).parent.parent))
+from app.core import lyrics_model, midi, phrases
+from app.core.config import settings
+
+
+@pytest.fixture(autouse=True)
+def _paths(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "TEMP_DIR", str(tmp_path / "tmp_hachimi"))
+    monkeypatch.setattr(settings, "LYRICS_MODEL_PATH", None)
+    lyrics_model.reset()
+    yield
+    lyrics_model.reset()
+
+def _feats(n_notes=400, seed=0):
+    rng = np.random.default_rng(seed)
+    cells = np.sort(rng.choice(n_notes * 6, n_notes, replace=False))
+    step = 60 / 110 / 4
+    notes = midi.Notes(cells * step, step * np.minimum(np.diff(cells, append=cells[-1] + 2), 6),
+                       rng.integers(50, 80, n_notes), np.full(n_notes, 90))
+    return phrases.analyze(notes, 110)
+
+def _naive_proba(m, X):
+    out = np.zeros((len(X), len(m.classes)))
+    for i, x in enumerate(X):
+        for r in m.roots:
+            node = r
+            while m.left[node] >= 0:
+                node = m.left[node] if x[m.feature[node]] <= m.threshold[node] else m.right[node]
+            out[i] += m.value[node]
+    return out / len(m.roots)
+
+def test_bundled_model_matches_naive_traversal_and_context_window():
+    m = lyrics_model.ForestModel.load(lyrics_model.DEFAULT_MODEL)
+    _, f = _feats()
+    X = lyrics_model.context_rows(f, 3)
+    assert X.shape == (len(f), 2 * len(phrases.FEATURES))
+    for i in (0, 1, 5, len(f) - 1):
+        prev = f[max(0, i - 3):i]
+        ctx = prev.mean(axis=0) if len(prev) else 0
+        assert np.allclose(X[i, len(phrases.FEATURES):], ctx, atol=1e-4)
+    assert np.allclose(m.predict_proba(X), _naive_proba(m, X), atol=1e-6)
+    assert np.allclose(m.predict_proba(X).sum(axis=1), 1, atol=1e-5)
+    with pytest.raises(lyrics_model.ModelError):
+        m.predict_proba(X[:, :5])
+
+def test_invalid_models_are_rejected(tmp_path):
+    with np.load(lyrics_model.DEFAULT_MODEL) as z:
+        arrays = {k: z[k] for k in z.files}
+    bad = dict(arrays, left=np.where(arrays["left"] >= 0, arrays["left"] + 10**6, -1))
+    with pytest.raises(lyrics_model.ModelError, match="child"):
+        lyrics_model.ForestModel(bad)
+    with pytest.raises(lyrics_model.ModelError, match="inputs"):
+        lyrics_model.ForestModel(dict(arrays, feature_names=arrays["feature_names"][::-1]))
+    with pytest.raises(lyrics_model.ModelError, match="depth"):
+        lyrics_model.ForestModel(dict(arrays, depth=np.array(1)))
+    (tmp_path / "junk.npz").write_bytes(b"not a model")
+    with pytest.raises(lyrics_model.ModelError):
+        lyrics_model.ForestModel.load(str(tmp_path / "junk.npz"))
+
+def test_batcher_merges_concurrent_jobs(monkeypatch):
+    monkeypatch.setattr(settings, "LYRICS_BATCH_WAIT_MS", 200.0)
+    b = lyrics_model.load()
+    assert lyrics_model.load() is b and lyrics_model.stats()["loaded"]
+    inputs = [lyrics_model.context_rows(_feats(200, seed)[1], 4) for seed in range(4)]
+    results = [None] * 4
+    barrier = threading.Barrier(4)
+
+    def job(i):
+        barrier.wait()
+        results[i] = b.predict_proba(inputs[i], timeout=10)
+    threads = [threading.Thread(target=job, args=(i,)) for i in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    st = lyrics_model.stats()
+    assert st["rows"] == sum(len(x) for x in inputs) and st["batches"] < 4
+    for x, r in zip(inputs, results):
+        assert np.allclose(r, b.model.predict_proba(x))
+
+def test_fill_writes_text_and_worker_init_preloads(tmp_path):
+    from celery.signals import worker_process_init
+
+    import app.workers.celery_app  # noqa: F401  注册信号处理
+    worker_process_init.send(sender=None)
+    assert lyrics_model.stats()["loaded"]
+
+    doc, f = _feats()
+    out = tmp_path / "lyrics"
+    phrases.write(str(out), doc, f)
+    os.link(out / phrases.PHRASES_NAME, tmp_path / "cached.json")
+    res = lyrics_model.fill(str(out))
+    assert res["phrases"] == len(doc["phrases"])
+    filled = json.loads((out / phrases.PHRASES_NAME).read_text(encoding="utf-8"))
+    for p in filled["phrases"]:
+        assert p["lyric_class"] in lyrics_model.TEST_CLASSES and len(p["text"]) == p["note_count"]
+    # 原文件(可能是缓存条目的硬链接)保持不变
+    cached = json.loads((tmp_path / "cached.json").read_text(encoding="utf-8"))
+    assert cached["phrases"][0]["text"] is None
@@ -0,0 +1,98 @@
+import io
+import pathlib
+import struct
+import sys
+
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+
+sys.path.append(str(pathlib.Path(__file__).parent.parent))
+from app.core import midi, storage
+from app.core.config import settings
+from app.main import app
+
+
+@pytest.fixture(autouse=True)
+def _paths(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "TEMP_DIR", str(tmp_path / "tmp_hachimi"))
+    monkeypatch.setattr(settings, "PUBLISH_DIR", str(tmp_path / "publish"))
+    monkeypatch.setattr(settings, "CELERY_EAGER", 1)
+
+def _smf(*tracks, division=96):
+    out = b"MThd" + struct.pack(">IHHH", 6, 1, len(tracks), division)
+    for t in tracks:
+        out += b"MTrk" + struct.pack(">I", len(t)) + t
+    return out
+
+def test_parse_running_status_tempo_map_and_sysex():
+    # 轨 0：速度 120BPM，第 2 拍起改为 60BPM
+    conductor = (b"\x00\xff\x51\x03\x07\xa1\x20" + b"\x81\x40\xff\x51\x03\x0f\x42\x40"
+                 + b"\x00\xff\x2f\x00")
+    # 轨 1：sysex、running status、力度 0 当 note-off、未关闭的音延续到轨尾
+    notes = (b"\x00\xf0\x03\x7e\x7f\xf7"
+             b"\x00\x90\x3c\x64" b"\x60\x3c\x00"        # C4 第 0-1 拍
+             b"\x00\x3e\x50" b"\x81\x40\x80\x3e\x40"    # D4 第 1-3 拍，跨越速度变化
+             b"\x00\xc0\x05" b"\x00\x90\x40\x70"        # 程序变更 + 不关闭的 E4
+             b"\x60\xff\x2f\x00")
+    n = midi.parse(_smf(conductor, notes))
+    assert list(n.pitch) == [60, 62, 64]
+    assert np.allclose(n.onset, [0.0, 0.5, 2.0]) and np.allclose(n.duration, [0.5, 1.5, 1.0])
+    assert list(n.velocity) == [100, 80, 112]
+    with pytest.raises(ValueError):
+        midi.parse(b"RIFF....")
+    with pytest.raises(ValueError):
+        midi.parse(_smf(b"\x00\x90\x3c"))
+
+def test_quantize_snaps_filters_folds_and_resolves_overlaps():
+    step = 60 / 100 / 4
+    n = midi.Notes(
+        onset=[0.02, 4*step - 0.03, 4*step + 0.01, 8*step, 9*step, 12*step, 20*step],
+        duration=[3*step, 2*step, 2*step, 0.01, 6*step, 100*step, step],
+        pitch=[60, 62, 67, 70, 40, 90, 64],
+        velocity=[90, 60, 100, 100, 80, 80, 80],
+    )
+    q, st = midi.quantize(n, 100)
+    assert st == {"input": 7, "dropped_short": 1, "clamped_long": 1, "transposed": 2,
+                  "dropped_overlap": 1, "trimmed_overlap": 2, "output": 5}
+    cells = np.rint(q.onset / step).astype(int)
+    assert list(cells) == [0, 4, 9, 12, 20]
+    assert list(np.rint(q.duration / step).astype(int)) == [3, 2, 3, 8, 1]
+    assert list(q.pitch) == [60, 67, 52, 78, 64]
+
+def test_encode_roundtrip_and_upload_route(tmp_path):
+    rng = np.random.default_rng(1)
+    step = 60 / 90 / 4
+    cells = np.sort(rng.choice(2000, 300, replace=False))
+    notes = midi.Notes(cells * step, step * np.minimum(np.diff(cells, append=cells[-1] + 2), 8),
+                       rng.integers(50, 80, 300), rng.integers(1, 127, 300))
+    back = midi.parse(midi.encode(notes, 90))
+    assert np.allclose(back.onset, notes.onset) and np.allclose(back.duration, notes.duration)
+    assert np.array_equal(back.pitch, notes.pitch) and np.array_equal(back.velocity, notes.velocity)
+
+    client = TestClient(app)
+    shifted = midi.Notes(notes.onset + 0.01, notes.duration, notes.pitch, notes.velocity)
+    raw = midi.encode(shifted, 90)
+    r = client.post("/hachimi_ai_mad/stages/midi/upload", data={"project_id": "m1", "bpm": "90"},
+                    files={"midi_file": ("take.mid", io.BytesIO(raw), "audio/midi")})
+    assert r.status_code == 200, r.text
+    body = r.json()
+    assert body["quantized_url"].endswith("/midi/quantized.mid") and body["stats"]["output"] == 300
+    q = midi.parse(client.get(body["quantized_url"]).content)
+    assert np.allclose(q.onset, notes.onset) and np.array_equal(q.pitch, notes.pitch)
+    arts = client.get("/hachimi_ai_mad/projects/m1/artifacts").json()["stages"]["midi"]["files"]
+    assert set(arts) >= {"take.mid", "quantized.mid"}
+
+    r = client.post("/hachimi_ai_mad/stages/midi/upload",
+                    data={"project_id": "m1", "quantize": "false"},
+                    files={"midi_file": ("raw.mid", io.BytesIO(raw), "audio/midi")})
+    body = r.json()
+    assert body["quantized_url"] == body["midi_url"]
+    files = storage.load_project_meta("m1")["stage_artifacts"]["midi"]["files"]
+    assert files["quantized"] == body["midi_url"]
+
+    bad = (b"MThd\x00\x00\x00\x06\x00\x00\x00\x01\x00\x60"
+           b"MTrk\x00\x00\x00\x03\x00\x90\x3c")
+    r = client.post("/hachimi_ai_mad/stages/midi/upload", data={"project_id": "m1"},
+                    files={"midi_file": ("bad.mid", io.BytesIO(bad), "audio/midi")})
+    assert r.status_code == 400
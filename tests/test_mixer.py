@@ -0,0 +1,62 @@
+import pathlib
+import sys
+import tracemalloc
+
+import numpy as np
+
+sys.path.append(str(pathlib.Path(__file__).parent.parent))
+from app.core import audio_io, mixer
+
+
+def _sine(path, sr, seconds, freq, amp, channels=1):
+    t = np.arange(int(sr * seconds)) / sr
+    x = np.repeat((amp*np.sin(2*np.pi*freq*t))[:, None], channels, axis=1)
+    audio_io.write_wav(path, x, sr, sample_format="float32")
+
+def _mix(tmp_path, **kw):
+    out = {n: str(tmp_path/f"{n}.wav") for n in ("vocal", "full", "preview")}
+    summary = mixer.mix_stems(str(tmp_path/"v.wav"), str(tmp_path/"a.wav"),
+                              out["vocal"], out["full"], out["preview"],
+                              sample_format="float32", **kw)
+    return summary, {n: audio_io.read_wav(p)[0] for n, p in out.items()}
+
+def test_resample_gain_and_block_invariance(tmp_path):
+    _sine(str(tmp_path/"v.wav"), 16000, 2, 440, 0.3)
+    _sine(str(tmp_path/"a.wav"), 48000, 3, 220, 0.3, channels=2)
+    s, a = _mix(tmp_path, sr=44100, accomp_gain_db=-6.0, block_frames=1000)
+    _, b = _mix(tmp_path, sr=44100, accomp_gain_db=-6.0, block_frames=1 << 16)
+    assert s["frames"] == 3 * 44100 and s["limited_ms"] == 0
+    for n in a:
+        assert np.array_equal(a[n], b[n])
+    t = np.arange(s["frames"] - 10) / 44100
+    ref = (np.where(t < 2, 0.3*np.sin(2*np.pi*440*t), 0)
+           + mixer.db_to_gain(-6.0)*0.3*np.sin(2*np.pi*220*t))
+    edge = np.abs(t - 2) < 5 / 44100  # 人声分轨结尾处插值保持最后一帧
+    assert np.abs(a["full"][:len(t), 0] - ref)[~edge].max() < 2e-3
+    assert a["vocal"].shape == (3 * 44100, 2) and np.abs(a["vocal"][2*44100+10:]).max() == 0
+
+def test_limiter_holds_ceiling_and_preview_window(tmp_path):
+    _sine(str(tmp_path/"v.wav"), 22050, 4, 330, 0.9)
+    _sine(str(tmp_path/"a.wav"), 22050, 4, 110, 0.9)
+    s, out = _mix(tmp_path, sr=22050, channels=1, ceiling_dbfs=-1.0,
+                  preview_start=10, preview_seconds=1.5)
+    ceiling = mixer.db_to_gain(-1.0)
+    assert np.abs(out["full"]).max() <= ceiling + 1e-6 and s["limited_ms"] > 0
+    # 预览起点超出曲长时向前挪，片段内容与 fullmix 对应位置一致(淡入淡出外)
+    assert s["preview"] == {"start": 2.5, "seconds": 1.5}
+    p, start, fade = out["preview"], int(2.5 * 22050), int(0.05 * 22050)
+    assert len(p) == int(1.5 * 22050)
+    assert np.array_equal(p[fade:-fade], out["full"][start + fade:start + len(p) - fade])
+    assert abs(p[0, 0]) < 1e-3 and abs(p[-1, 0]) < 1e-3
+
+def test_peak_memory_independent_of_length(tmp_path):
+    peaks = []
+    for seconds in (10, 40):
+        _sine(str(tmp_path/"v.wav"), 44100, seconds, 440, 0.5, channels=2)
+        _sine(str(tmp_path/"a.wav"), 44100, seconds, 220, 0.5, channels=2)
+        tracemalloc.start()
+        mixer.mix_stems(str(tmp_path/"v.wav"), str(tmp_path/"a.wav"),
+                        str(tmp_path/"o1.wav"), str(tmp_path/"o2.wav"), str(tmp_path/"o3.wav"))
+        peaks.append(tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+    assert peaks[1] < peaks[0] * 1.2
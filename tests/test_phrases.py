@@ -0,0 +1,112 @@
+import io
+import json
+import pathlib
+import sys
+
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+
+sys.path.append(str(pathlib.Path(__file__).parent.parent))
+from app.core import midi, phrases, pipeline_stub, stage_cache
+from app.core.config import settings
+from app.main import app
+
+
+@pytest.fixture(autouse=True)
+def _paths(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "TEMP_DIR", str(tmp_path / "tmp_hachimi"))
+    monkeypatch.setattr(settings, "PUBLISH_DIR", str(tmp_path / "publish"))
+    monkeypatch.setattr(settings, "STAGE_CACHE_DIR", str(tmp_path / "stage_cache"))
+    monkeypatch.setattr(settings, "CELERY_EAGER", 1)
+
+def _beats(onsets, durs, pitches, bpm=120):
+    beat = 60 / bpm
+    n = len(onsets)
+    return midi.Notes(np.array(onsets, float) * beat, np.array(durs, float) * beat,
+                      pitches, [100] * n)
+
+def test_rest_gaps_and_forced_bar_splits():
+    # 句 1：0-3 拍上行；休止 2 拍；句 2：连续 12 拍八分音符，超过 2 小节(8 拍)被强制断开
+    on = [0, 1, 2, 3] + [6 + 0.5 * k for k in range(24)]
+    dur = [1, 1, 1, 1] + [0.5] * 24
+    pitch = [60, 62, 64, 67] + [70] * 12 + [72, 70] * 6
+    doc, f = phrases.analyze(_beats(on, dur, pitch), 120)
+    col = {n: i for i, n in enumerate(doc["feature_names"])}
+    assert f.dtype == np.float32 and f.shape == (3, len(phrases.FEATURES))
+    assert [p["note_count"] for p in doc["phrases"]] == [4, 16, 8]
+    assert list(f[:, col["after_rest"]]) == [1, 1, 0]
+    assert np.allclose(f[:, col["gap_before_beats"]], [0, 2, 0])
+    assert np.allclose(f[:, col["duration_beats"]], [4, 8, 4])
+    assert np.allclose(f[:, col["mean_note_beats"]], [1, 0.5, 0.5])
+    assert np.allclose(f[:, col["std_note_beats"]], 0)
+    assert np.allclose(f[:, col["pitch_range"]], [7, 2, 2])
+    assert np.allclose(f[:, col["pitch_change_rate"]], [7 / 3, 8 / 15, 2])
+    assert np.allclose(f[:, col["offbeat_ratio"]], [0, 0.5, 0.5])
+    assert np.allclose(f[:, col["position"]], [0, 0.5, 1])
+    assert f[0, col["contour_slope"]] > 2 and doc["phrases"][0]["contour"] == "rising"
+    assert doc["phrases"][1]["start"] == 3.0 and doc["phrases"][2]["start"] == 7.0
+    assert doc["phrases"][0]["notes"][1] == [0.5, 0.5, 62]
+    assert doc["summary"]["phrases"] == 3 and doc["summary"]["pitch_range"] == [60, 72]
+
+    empty, ef = phrases.analyze(midi.Notes.empty(), 120)
+    assert empty["phrases"] == [] and ef.shape == (0, len(phrases.FEATURES))
+
+def test_features_match_per_phrase_reference():
+    rng = np.random.default_rng(3)
+    cells = np.sort(rng.choice(4000, 600, replace=False))
+    dur = np.minimum(np.diff(cells, append=cells[-1] + 4), rng.integers(1, 9, 600))
+    notes = _beats(cells / 4, dur / 4, rng.integers(48, 84, 600), bpm=96)
+    doc, f = phrases.analyze(notes, 96, rest_beats=0.75, max_bars=1)
+    assert sum(p["note_count"] for p in doc["phrases"]) == 600
+    for p, row in zip(doc["phrases"], f):
+        arr = np.array(p["notes"])
+        on, d, pi = arr[:, 0] / 0.625, arr[:, 1] / 0.625, arr[:, 2]
+        assert on[-1] - on[0] < 4 + 1e-6
+        assert np.isclose(row[3], d.std(), atol=1e-4) and row[6] == pi.max() - pi.min()
+        slope = np.polyfit(on - on[0], pi, 1)[0] if len(pi) > 1 and np.ptp(on) > 0 else 0.0
+        assert np.isclose(row[10], slope, rtol=2e-3, atol=1e-3)
+
+def test_analysis_is_cached_by_midi_hash_and_memory_mappable():
+    client = TestClient(app)
+    rng = np.random.default_rng(5)
+    cells = np.sort(rng.choice(1000, 120, replace=False))
+    step = 60 / 100 / 4
+    notes = midi.Notes(cells * step, step * np.ones(120), rng.integers(50, 80, 120), [90] * 120)
+    raw = midi.encode(notes, 100)
+    for pid in ("ph1", "ph2"):
+        r = client.post("/hachimi_ai_mad/stages/midi/upload",
+                        data={"project_id": pid, "bpm": "100"},
+                        files={"midi_file": ("take.mid", io.BytesIO(raw), "audio/midi")})
+        assert r.status_code == 200, r.text
+
+    notes_path = pipeline_stub.latest_midi_upload("ph1").replace("take.mid", midi.QUANTIZED_NAME)
+    out = pipeline_stub._stage_lyrics({"job_id": "ph1", "notes": notes_path, "bpm": 100})
+    doc = json.loads(open(out["phrases"], encoding="utf-8").read())
+    assert doc["summary"]["notes"] == 120 and doc["bpm"] == 100
+    f = phrases.load_features(str(pathlib.Path(out["phrases"]).parent))
+    assert isinstance(f, np.memmap) and f.shape == (len(doc["phrases"]), len(phrases.FEATURES))
+
+    # 另一项目的同一份 MIDI 直接命中缓存
+    before = stage_cache.stats()["hits"]
+    other = pipeline_stub.latest_midi_upload("ph2").replace("take.mid", midi.QUANTIZED_NAME)
+    assert pipeline_stub.analyze_phrases("ph2", other, 100) is True
+    assert stage_cache.stats()["hits"] == before + 1
+    arts = client.get("/hachimi_ai_mad/projects/ph2/artifacts").json()["stages"]["lyrics"]["files"]
+    assert set(arts) >= {"phrases.json", "features.npy"}
+    assert client.get(arts["phrases.json"]).json()["summary"] == doc["summary"]
+    # bpm 不同则重新分析
+    assert pipeline_stub.analyze_phrases("ph2", other, 120) is False
+
+def test_synthesize_cache_key_follows_phrases(tmp_path, monkeypatch):
+    keys = []
+    monkeypatch.setattr(pipeline_stub, "_cached_stage", lambda *a, params="": keys.append(params))
+    ctx = {"job_id": "syn1", "bpm": 120, "src_hash": "h",
+           "vocals_path": "v.wav", "accomp_mix_path": "a.wav"}
+    for text in (None, "哈", "基", "哈"):
+        path = None
+        if text is not None:
+            path = tmp_path / f"{len(keys)}.json"
+            path.write_text(json.dumps({"phrases": [{"text": text}]}), encoding="utf-8")
+        pipeline_stub._stage_synthesize(dict(ctx, phrases=None if path is None else str(path)))
+    assert len(set(keys[:3])) == 3 and keys[3] == keys[1]
@@ -0,0 +1,85 @@
+import pathlib
+import sys
+import tracemalloc
+
+import numpy as np
+import pytest
+
+sys.path.append(str(pathlib.Path(__file__).parent.parent))
+from app.core import audio_io, separation
+
+SR = 16000
+
+def _input(path, seconds, channels=2, seed=0):
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(seconds * SR)) / SR
+    voice = 0.3 * np.sin(2 * np.pi * 440 * t)[:, None]
+    x = (voice + 0.1 * rng.standard_normal((len(t), channels))).astype(np.float32)
+    audio_io.write_wav(str(path), x, SR, sample_format="float32")
+    return x
+
+def _files(tmp_path):
+    return [str(tmp_path / n) for n in ("in.wav", "v.wav", "a.wav")]
+
+class HalfModel(separation.SeparationModel):
+    """无上下文的逐帧模型：重叠区两窗结果相同，交叉淡化后应无缝"""
+    name = "half"
+
+    def separate(self, x):
+        return 0.5 * x, 0.5 * x
+
+class NoSeparateModel(separation.SeparationModel):
+    name = "incomplete"
+
+@pytest.mark.parametrize("memory_mb,workers,overlap",
+                         [(0.05, 1, 0.0), (0.5, 3, 0.005), (64, 2, 0.25)])
+def test_chunked_output_matches_full_buffer(tmp_path, memory_mb, workers, overlap):
+    x = _input(tmp_path / "in.wav", 3.0)
+    st = separation.separate_file(*_files(tmp_path), memory_mb=memory_mb, workers=workers,
+                                  overlap_seconds=overlap, sample_format="float32")
+    assert st["frames"] == len(x) and (st["windows"] > 1) == (memory_mb < 1)
+    ref = separation.CenterBandModel()
+    ref.prepare(SR, 2)
+    rv, ra = ref.separate(x)
+    v, _ = audio_io.read_wav(str(tmp_path / "v.wav"))
+    a, _ = audio_io.read_wav(str(tmp_path / "a.wav"))
+    assert v.shape == x.shape and a.shape == x.shape
+    assert np.abs(v - rv).max() < 1e-5 and np.abs(a - ra).max() < 1e-5
+    # 带通后的人声主要是 440Hz 正弦
+    assert np.std(v[1000:-1000]) == pytest.approx(0.3 / np.sqrt(2), rel=0.1)
+
+def test_pluggable_model_crossfade_and_budget(tmp_path):
+    x = _input(tmp_path / "in.wav", 20.0, channels=2)
+    tracemalloc.start()
+    st = separation.separate_file(*_files(tmp_path),
+                                  model=HalfModel(), memory_mb=1.0, workers=2, overlap_seconds=0.02,
+                                  sample_format="float32")
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    assert st["model"] == "half" and st["windows"] > 10
+    # 峰值只与预算相关，远小于整段输入(20s 立体声 float32 ≈ 2.5MB)
+    assert peak < 2 * 1024 * 1024 < x.nbytes
+    v, _ = audio_io.read_wav(str(tmp_path / "v.wav"))
+    assert np.abs(v - 0.5 * x).max() < 1e-6
+
+    with pytest.raises(ValueError, match="too small"):
+        separation.separate_file(*_files(tmp_path),
+                                 memory_mb=0.01, workers=4, overlap_seconds=0.5)
+    with pytest.raises(ValueError):
+        separation.load_model("no_such_model")
+    assert isinstance(separation.load_model("tests.test_separation:HalfModel"), HalfModel)
+    with pytest.raises(ValueError, match="separate"):
+        separation.load_model("tests.test_separation:NoSeparateModel")
+    with pytest.raises(ValueError, match="not a SeparationModel"):
+        separation.load_model("tests.test_separation:_input")
+
+def test_workers_not_in_cache_key(monkeypatch):
+    from app.core import pipeline_stub
+    from app.core.config import settings
+    monkeypatch.setattr(settings, "SEPARATION_WORKERS", 1)
+    key = pipeline_stub._separation_key()
+    monkeypatch.setattr(settings, "SEPARATION_WORKERS", 4)
+    assert pipeline_stub._separation_key() == key
+    overlap = settings.SEPARATION_OVERLAP_SECONDS + 1
+    monkeypatch.setattr(settings, "SEPARATION_OVERLAP_SECONDS", overlap)
+    assert pipeline_stub._separation_key() != key
@@ -0,0 +1,176 @@
+import json
+import os
+import pathlib
+import sys
+
+import pytest
+
+sys.path.append(str(pathlib.Path(__file__).parent.parent))
+from app.core import meta_index, storage
+from app.core.config import settings
+
+
+@pytest.fixture(autouse=True)
+def _isolate_tmp(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "TEMP_DIR", str(tmp_path/"tmp_hachimi"))
+    monkeypatch.setattr(settings, "PUBLISH_DIR", str(tmp_path/"publish"))
+    yield
+
+def test_recent_and_featured_use_index():
+    for i in range(5):
+        storage.save_project_meta(f"p{i}", {"project_name": f"n{i}",
+                                            "created_at": f"2024-01-0{i+1}T00:00:00Z"})
+    storage.feature_project("p1")
+    storage.feature_project("p3")
+    recent = storage.list_recent_projects(limit=3)
+    assert [m["project_id"] for m in recent] == ["p4", "p3", "p2"]
+    featured = storage.list_featured_projects()
+    assert [m["project_id"] for m in featured] == ["p3", "p1"]
+    assert all(m["is_featured"] for m in featured)
+
+def test_rebuild_from_meta_files():
+    storage.save_project_meta("a", {"created_at": "2024-01-01T00:00:00Z"})
+    #绕过索引直接写入meta.json，模拟旧数据
+    root = storage.project_root("b")
+    os.makedirs(root, exist_ok=True)
+    with open(os.path.join(root, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump({"project_id": "b", "created_at": "2024-02-01T00:00:00Z", "is_featured": True}, f)
+    assert [m["project_id"] for m in storage.list_recent_projects()] == ["a"]
+    assert meta_index.rebuild() == 2
+    assert [m["project_id"] for m in storage.list_recent_projects()] == ["b", "a"]
+    assert [m["project_id"] for m in storage.list_featured_projects()] == ["b"]
+
+def test_published_page_cursor():
+    for i in range(5):
+        meta_index.upsert_published({"public_id": f"x{i}",
+                                     "published_at": f"2024-03-0{i+1}T00:00:00Z"})
+    page = storage.list_published_page(limit=2)
+    assert [m["public_id"] for m in page["items"]] == ["x4", "x3"]
+    page = storage.list_published_page(limit=2, cursor=page["next_cursor"])
+    assert [m["public_id"] for m in page["items"]] == ["x2", "x1"]
+    page = storage.list_published_page(limit=2, cursor=page["next_cursor"])
+    assert [m["public_id"] for m in page["items"]] == ["x0"]
+    assert page["next_cursor"] is None
+    with pytest.raises(ValueError):
+        storage.list_published_page(cursor="not-a-cursor")
+
+def test_meta_batch_coalesces_and_replays_on_latest():
+    storage.ensure_project_initialized("b1")
+    writes = []
+    orig = storage._write_json_atomic
+    def counting(path, obj):
+        writes.append(path)
+        orig(path, obj)
+    storage._write_json_atomic = counting
+    try:
+        with storage.meta_batch("b1"):
+            storage.record_stage_artifacts("b1", "separate", {"vocals.wav": "u1"})
+            storage.record_stage_artifacts("b1", "synth", {"fullmix.wav": "u2"})
+            assert set(storage.load_project_meta("b1")["stage_artifacts"]) == {"separate", "synth"}
+            #模拟另一进程在批处理期间直接改了文件
+            with open(storage.meta_path("b1"), encoding="utf-8") as f:
+                orig(storage.meta_path("b1"), {**json.load(f), "is_featured": True})
+            assert writes == []
+    finally:
+        storage._write_json_atomic = orig
+    assert writes == [storage.meta_path("b1")]
+    meta = storage.load_project_meta("b1")
+    assert meta["is_featured"] is True
+    assert set(meta["stage_artifacts"]) == {"separate", "synth"}
+
+def test_concurrent_updates_not_lost():
+    import threading
+    storage.ensure_project_initialized("c1")
+    def worker(i):
+        for j in range(20):
+            storage.update_project_meta("c1", {f"k{i}_{j}": j})
+    ts = [threading.Thread(target=worker, args=(i,)) for i in range(4)]
+    for t in ts:
+        t.start()
+    for t in ts:
+        t.join()
+    meta = storage.load_project_meta("c1")
+    assert sum(1 for k in meta if k.startswith("k")) == 80
+    assert not [f for f in os.listdir(storage.project_root("c1")) if f.endswith(".tmp")]
+
+def test_stage_cache_roundtrip_and_lru():
+    from app.core import stage_cache
+    src = storage.stage_dir("s1", "separate")
+    for fn in ("vocals.wav", "accompaniment.wav"):
+        with open(os.path.join(src, fn), "wb") as f:
+            f.write(b"x" * 1000)
+    k1 = stage_cache.cache_key("abc", 120, "separate", 1)
+    before = stage_cache.stats()
+    assert not stage_cache.fetch(k1, storage.stage_dir("s2", "separate"), ["vocals.wav"])
+    stage_cache.store(k1, src, ["vocals.wav", "accompaniment.wav"])
+    dst = storage.stage_dir("s2", "separate")
+    assert stage_cache.fetch(k1, dst, ["vocals.wav", "accompaniment.wav"])
+    assert os.path.getsize(os.path.join(dst, "vocals.wav")) == 1000
+    after = stage_cache.stats()
+    assert after["hits"] - before["hits"] == 1
+    assert after["misses"] - before["misses"] == 1
+    assert after["entries"] == 1 and after["bytes"] == 2000
+    k2 = stage_cache.cache_key("def", 120, "separate", 1)
+    stage_cache.store(k2, src, ["vocals.wav"])
+    assert stage_cache.evict(max_bytes=1500) == 1
+    assert not stage_cache.fetch(k1, dst, ["vocals.wav"])
+    assert stage_cache.fetch(k2, dst, ["vocals.wav"])
+
+def test_sweeper_expires_by_ttl_and_skips_running(monkeypatch):
+    import datetime as dt
+
+    from app.core import metrics, sweeper
+    monkeypatch.setattr(settings, "RESULT_TTL_HOURS", 24)
+    monkeypatch.setattr(settings, "PUBLISHED_TTL_DAYS", 7)
+    monkeypatch.setattr(settings, "SWEEP_MAX_DELETES_PER_SEC", 0)
+    now = dt.datetime(2024, 6, 10, tzinfo=dt.timezone.utc)
+    storage.save_project_meta("old", {"created_at": "2024-06-01T00:00:00Z"})
+    with open(os.path.join(storage.stage_dir("old", "synth"), "fullmix.wav"), "wb") as f:
+        f.write(b"x" * 500)
+    running = {"job_status": "RUNNING", "job_started_at": "2024-06-09T23:59:00Z"}
+    storage.save_project_meta("busy", {"created_at": "2024-06-09T23:00:00Z", **running})
+    storage.save_project_meta("busy_old", {"created_at": "2024-06-01T00:00:00Z", **running})
+    storage.save_project_meta("new", {"created_at": "2024-06-09T12:00:00Z"})
+    for pid, at in (("p_old", "2024-05-01T00:00:00Z"), ("p_new", "2024-06-09T00:00:00Z")):
+        os.makedirs(os.path.join(settings.PUBLISH_DIR, pid), exist_ok=True)
+        meta_index.upsert_published({"public_id": pid, "published_at": at})
+    dry = sweeper.sweep(now=now, dry_run=True)
+    assert dry["projects_deleted"] == 1 and os.path.isdir(storage.project_root("old"))
+    before = metrics.SWEEP_RECLAIMED_BYTES.labels("project")._value.get()
+    stats = sweeper.sweep(now=now)
+    reclaimed = metrics.SWEEP_RECLAIMED_BYTES.labels("project")._value.get() - before
+    assert reclaimed == stats["project_bytes"] >= 500
+    assert stats["projects_deleted"] == 1
+    assert stats["projects_skipped_running"] == 1
+    assert stats["published_deleted"] == 1
+    assert stats["reclaimed_bytes"] >= 500
+    assert not os.path.exists(storage.project_root("old"))
+    assert {m["project_id"] for m in storage.list_recent_projects()} == {"busy", "busy_old", "new"}
+    assert [m["public_id"] for m in storage.list_published()] == ["p_new"]
+
+def test_publish_links_deterministic_artifacts():
+    with pytest.raises(FileNotFoundError):
+        storage.publish_job("empty")
+    syn = storage.stage_dir("pp", "synth")
+    for fn, body in (("vocal.wav", b"v"), ("fullmix.wav", b"full")):
+        with open(os.path.join(syn, fn), "wb") as f:
+            f.write(body)
+    meta = storage.publish_job("pp")
+    pub = os.path.join(settings.PUBLISH_DIR, "pp")
+    #没有预览产物时预览退回 fullmix
+    assert open(os.path.join(pub, "preview.wav"), "rb").read() == b"full"
+    with open(os.path.join(storage.stage_dir("pp", "preview"), "preview.wav"), "wb") as f:
+        f.write(b"prev")
+    meta = storage.publish_job("pp")
+    assert open(os.path.join(pub, "preview.wav"), "rb").read() == b"prev"
+    assert os.path.samefile(os.path.join(pub, "result.wav"), os.path.join(syn, "fullmix.wav"))
+    assert meta["result_url"].startswith("/hachimi_ai_mad/showcase/pp/result?v=")
+
+def test_stage_dir_recreates_project_swept_by_another_process():
+    storage.stage_dir("gone", "synth")
+    # 另一个进程的清理任务删掉了目录，本进程没有收到 forget_project
+    import shutil
+    shutil.rmtree(storage.project_root("gone"))
+    d = storage.stage_dir("gone", "synth")
+    assert os.path.isdir(d) and os.path.isfile(storage.meta_path("gone"))
+    assert storage.load_project_meta("gone")["project_id"] == "gone"
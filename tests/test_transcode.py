@@ -0,0 +1,148 @@
+import io
+import os
+import pathlib
+import sys
+import threading
+import time
+import wave
+
+import pytest
+from fastapi.testclient import TestClient
+
+sys.path.append(str(pathlib.Path(__file__).parent.parent))
+from app.core import transcode
+from app.core.config import settings
+from app.main import app
+
+# 假 ffmpeg：按 "-f" 指定的格式写出带标记的文件，并记录调用次数
+FAKE_FFMPEG = """#!{python}
+import sys, time
+args = sys.argv[1:]
+src, fmt, dst = args[args.index("-i") + 1], args[args.index("-f") + 1], args[-1]
+time.sleep(0.2)
+open(dst, "wb").write(fmt.encode() + b":" + open(src, "rb").read()[:64])
+open({log!r}, "a").write(src + "\\n")
+"""
+
+@pytest.fixture(autouse=True)
+def _paths(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "TEMP_DIR", str(tmp_path / "tmp_hachimi"))
+    monkeypatch.setattr(settings, "PUBLISH_DIR", str(tmp_path / "publish"))
+    monkeypatch.setattr(settings, "CELERY_EAGER", 1)
+
+@pytest.fixture
+def ffmpeg(tmp_path, monkeypatch):
+    log = tmp_path / "ffmpeg.log"
+    exe = tmp_path / "ffmpeg"
+    exe.write_text(FAKE_FFMPEG.format(python=sys.executable, log=str(log)))
+    exe.chmod(0o755)
+    monkeypatch.setattr(settings, "TRANSCODE_FFMPEG", str(exe))
+    return lambda: log.read_text().splitlines() if log.exists() else []
+
+def _wav(path, seconds=0.2):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with wave.open(str(path), "wb") as wf:
+        wf.setnchannels(1)
+        wf.setsampwidth(2)
+        wf.setframerate(16000)
+        wf.writeframes(os.urandom(int(seconds * 16000)) * 2)
+
+def test_concurrent_requests_encode_once_and_source_change_invalidates(tmp_path, ffmpeg):
+    src = str(tmp_path / "a" / "fullmix.wav")
+    _wav(src)
+    out = []
+    threads = [threading.Thread(target=lambda: out.append(transcode.transcode(src, "opus")))
+               for _ in range(6)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(set(out)) == 1 and len(ffmpeg()) == 1
+    assert os.path.dirname(out[0]).endswith(transcode.RENDITIONS_DIR)
+    with open(out[0], "rb") as f:
+        assert f.read().startswith(b"ogg:")
+    assert transcode.transcode(src, "opus") == out[0] and len(ffmpeg()) == 1
+    time.sleep(0.01)
+    _wav(src)
+    assert transcode.transcode(src, "opus") != out[0] and len(ffmpeg()) == 2
+    with pytest.raises(ValueError):
+        transcode.transcode(src, "flac")
+
+def test_lru_eviction(tmp_path, ffmpeg):
+    paths = []
+    for i in range(3):
+        src = str(tmp_path / f"s{i}.wav")
+        _wav(src)
+        paths.append(transcode.transcode(src, "mp3"))
+    transcode.transcode(str(tmp_path / "s0.wav"), "mp3")  # s0 变为最近使用
+    size = os.path.getsize(paths[0])
+    assert transcode.evict(max_bytes=2 * size) == 1
+    assert os.path.exists(paths[0]) and not os.path.exists(paths[1]) and os.path.exists(paths[2])
+
+def _published_job(client):
+    buf = io.BytesIO()
+    with wave.open(buf, "wb") as wf:
+        wf.setnchannels(1)
+        wf.setsampwidth(2)
+        wf.setframerate(16000)
+        wf.writeframes(b"\x00\x00" * 3200)
+    buf.seek(0)
+    r = client.post("/hachimi_ai_mad/tasks/process", files={"file": ("a.wav", buf, "audio/wav")},
+                    data={"bpm": "120", "project_name": "p", "pen_name": "n"})
+    job_id = r.json()["job_id"]
+    assert client.post(f"/hachimi_ai_mad/tasks/{job_id}/publish").status_code == 200
+    return job_id
+
+def test_publish_warms_renditions_and_showcase_serves_them(ffmpeg):
+    from app.core import task as tasks
+    client = TestClient(app)
+    job_id = _published_job(client)
+    assert len(ffmpeg()) == 0  # eager 模式不在发布请求里同步预热
+    tasks.transcode_published_task(job_id)
+    assert len(ffmpeg()) == 4  # 预览/结果 × opus/mp3
+    r = client.get(f"/hachimi_ai_mad/showcase/{job_id}/preview", params={"format": "mp3"})
+    assert r.status_code == 200 and r.headers["content-type"] == "audio/mpeg"
+    assert r.content.startswith(b"mp3:")
+    assert 'filename="preview.mp3"' in r.headers["content-disposition"]
+    assert len(ffmpeg()) == 4
+    r = client.get(f"/hachimi_ai_mad/projects/{job_id}/synth/vocal.wav", params={"format": "opus"})
+    assert r.headers["content-type"] == "audio/ogg" and len(ffmpeg()) == 5
+    r = client.get(f"/hachimi_ai_mad/showcase/{job_id}/result", params={"format": "aiff"})
+    assert r.status_code == 400
+
+    r = client.post("/hachimi_ai_mad/stages/synthesize/retry",
+                    json={"project_id": job_id, "format": "mp3"})
+    assert r.status_code == 200 and r.json()["format"] == "mp3"
+    assert client.get(r.json()["fullmix_url"]).content.startswith(b"mp3:")
+    r = client.post("/hachimi_ai_mad/stages/synthesize/retry",
+                    json={"project_id": job_id, "format": "aiff"})
+    assert r.status_code == 422
+
+def test_publish_survives_full_warm_up_queue(ffmpeg, monkeypatch):
+    from app.core import task as tasks
+    from app.workers import dispatch
+    from app.workers.local_executor import QueueFull
+    job_id = _published_job(TestClient(app))
+    monkeypatch.setattr(settings, "CELERY_EAGER", 0)
+
+    def full(task, kwargs, **opts):
+        raise QueueFull("full")
+    monkeypatch.setattr(dispatch, "submit", full)
+    assert tasks.publish_task(job_id)["public_id"] == job_id
+    assert len(ffmpeg()) == 0
+
+def test_falls_back_to_wav_without_encoder(monkeypatch):
+    from app.core.http_files import file_version
+    monkeypatch.setattr(settings, "TRANSCODE_FFMPEG", "/nonexistent/ffmpeg")
+    client = TestClient(app)
+    job_id = _published_job(client)
+    v = file_version(os.stat(os.path.join(settings.PUBLISH_DIR, job_id, "preview.wav")))
+    r = client.get(f"/hachimi_ai_mad/showcase/{job_id}/preview", params={"format": "opus", "v": v})
+    assert r.status_code == 200 and r.headers["x-transcode-fallback"] == "wav"
+    assert r.content[:4] == b"RIFF"
+    assert r.headers["cache-control"] == "no-cache"  # 带版本号也不能把 WAV 长期缓存在 opus 地址下
+    r = client.get(f"/hachimi_ai_mad/showcase/{job_id}/preview", params={"v": v})
+    assert "immutable" in r.headers["cache-control"]
+    r = client.post("/hachimi_ai_mad/stages/synthesize/retry",
+                    json={"project_id": job_id, "format": "opus"})
+    assert r.json()["format"] == "wav" and r.json()["fullmix_url"].endswith("fullmix.wav")
@@ -0,0 +1,52 @@
+import pathlib
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.append(str(pathlib.Path(__file__).parent.parent))
+from app.core import audio_io, waveform
+
+
+def _sine(sr, seconds, amp, channels):
+    t = np.arange(int(sr * seconds)) / sr
+    return np.repeat((amp * np.sin(2*np.pi*997*t))[:, None], channels, axis=1)
+
+@pytest.mark.parametrize("sr,amp,channels,lufs", [(48000, 1.0, 1, -3.01), (44100, 0.5, 2, -6.02)])
+def test_sine_loudness_matches_bs1770(tmp_path, sr, amp, channels, lufs):
+    p = str(tmp_path/"s.wav")
+    audio_io.write_wav(p, _sine(sr, 5, amp, channels), sr, sample_format="float32")
+    summary, _ = waveform.analyze(p)
+    assert summary["lufs"] == pytest.approx(lufs, abs=0.05)
+    assert summary["peak_dbfs"] == pytest.approx(20*np.log10(amp), abs=0.01)
+    assert summary["rms_dbfs"] == pytest.approx(20*np.log10(amp) - 3.01, abs=0.01)
+    assert summary["duration"] == 5.0 and summary["channels"] == channels
+
+def test_peaks_independent_of_block_size_and_levels_consistent(tmp_path):
+    sr = 22050
+    data = np.random.default_rng(0).uniform(-0.8, 0.8, (sr * 3 + 123, 2))
+    p = str(tmp_path/"n.wav")
+    audio_io.write_wav(p, data, sr, sample_format="float32")
+    a = waveform.analyze(p, block_frames=1000)
+    b = waveform.analyze(p, block_frames=65536)
+    assert a[1] == b[1] and a[0] == b[0]
+
+    peaks = waveform.decode_peaks(a[1])
+    assert peaks["frames"] == len(data) and list(peaks["levels"]) == list(waveform.LEVELS)
+    fine = peaks["levels"][256].astype(int)
+    assert len(fine) == -(-len(data) // 256)
+    assert fine[0, 0] == round(data[:256].min() * 127)
+    assert fine[0, 1] == round(data[:256].max() * 127)
+    for spb in waveform.LEVELS[1:]:
+        k = spb // 256
+        coarse = peaks["levels"][spb]
+        assert len(coarse) == -(-len(fine) // k)
+        assert coarse[0, 0] == fine[:k, 0].min()
+        assert coarse[-1, 1] == fine[(len(coarse)-1)*k:, 1].max()
+
+def test_silence_has_no_loudness(tmp_path):
+    p = str(tmp_path/"z.wav")
+    audio_io.write_wav(p, np.zeros((16000, 1)), 16000)
+    summary, blob = waveform.analyze(p)
+    assert summary["lufs"] is None and summary["peak_dbfs"] is None
+    assert not waveform.decode_peaks(blob)["levels"][256].any()